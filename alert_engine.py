@@ -0,0 +1,203 @@
+"""
+向量化预警引擎
+
+规则来自 AlertRule 表，由 rule_matcher 编译后对整列数据做二分匹配，
+每个参数得到匹配到的最高级别规则，再跨参数取最高级别，
+只为触发预警的行构造结果字典。可用于原始记录或任意汇总粒度。
+"""
+
+import numpy as np
+import pandas as pd
+
+from models import MEASUREMENT_FIELDS
+from timeseries_store import time_series_store
+from rollups import rollup_series
+from rule_matcher import RuleMatcher, rules_from_config
+
+# 默认预警规则，规则表为空时使用，也用于初始化规则表
+ALERT_RULES = {
+    'temperature': {
+        'critical': {'min': 5, 'max': 35},     # 极端异常
+        'warning': {'min': 10, 'max': 30},     # 明显异常
+        'attention': {'min': 15, 'max': 28}    # 轻微异常
+    },
+    'dissolved_oxygen': {
+        'critical': {'min': 3, 'max': 15},     # 严重缺氧或过饱和
+        'warning': {'min': 4, 'max': 12},      # 明显异常
+        'attention': {'min': 5, 'max': 10}     # 轻微异常
+    },
+    'ph': {
+        'critical': {'min': 6.0, 'max': 9.5},  # 严重偏离
+        'warning': {'min': 6.5, 'max': 9.0},   # 明显偏离
+        'attention': {'min': 7.0, 'max': 8.5}  # 轻微偏离
+    },
+    'turbidity': {
+        'critical': {'max': 20},               # 严重异常：20NTU以上
+        'warning': {'max': 10},                # 警告：10NTU以上
+        'attention': {'max': 5}                # 关注：5NTU以上
+    },
+    'chlorophyll': {
+        'critical': {'max': 10},               # 严重异常：10μg/L以上
+        'warning': {'max': 5},                 # 警告：5μg/L以上
+        'attention': {'max': 3}                # 关注：3μg/L以上
+    }
+}
+
+# 参与预警检查的参数，同一时间多个参数级别相同时取靠前的参数
+ALERT_PARAMETERS = ['temperature', 'dissolved_oxygen', 'ph', 'turbidity', 'chlorophyll']
+
+# 支持的数据粒度，raw 为原始记录
+ALERT_GRANULARITIES = ['raw', 'hourly', 'daily', 'monthly']
+ALERT_GRANULARITY_NAMES = {'raw': '原始记录', 'hourly': '小时粒度', 'daily': '日粒度', 'monthly': '月粒度'}
+
+PARAMETER_NAMES = {
+    'temperature': '温度',
+    'dissolved_oxygen': '溶解氧',
+    'ph': 'pH值',
+    'turbidity': '浊度',
+    'chlorophyll': '叶绿素',
+    'salinity': '盐度',
+    'average_water_speed': '平均流速',
+    'average_water_direction': '平均流向',
+    'dissolved_oxygen_saturation': '溶解氧饱和度',
+    'specific_conductance': '电导率'
+}
+
+PARAMETER_UNITS = {
+    'temperature': '°C',
+    'dissolved_oxygen': 'mg/L',
+    'ph': '',
+    'turbidity': 'NTU',
+    'chlorophyll': 'μg/L',
+    'salinity': 'PSU',
+    'average_water_speed': 'm/s',
+    'average_water_direction': '°',
+    'dissolved_oxygen_saturation': '%',
+    'specific_conductance': 'mS/cm'
+}
+
+
+def get_parameter_name(parameter):
+    """获取参数中文名称"""
+    return PARAMETER_NAMES.get(parameter, parameter)
+
+
+def get_parameter_unit(parameter):
+    """获取参数单位"""
+    return PARAMETER_UNITS.get(parameter, '')
+
+
+# 全局共享的规则匹配器
+rule_matcher = RuleMatcher(fallback=rules_from_config(ALERT_RULES))
+
+
+def alert_parameters(compiled=None):
+    """参与预警检查的参数：默认参数在前，其余按规则表中出现的顺序"""
+    compiled = compiled or rule_matcher.get()
+    extra = [p for p in compiled.parameters if p not in ALERT_PARAMETERS and p in MEASUREMENT_FIELDS]
+    return ALERT_PARAMETERS + extra
+
+
+def build_alert(rule, value, timestamp, compiled):
+    """构造与 check_single_parameter 相同格式的预警字典"""
+    is_low = rule.operator in ('<', '<=')
+    return {
+        'parameter': rule.parameter,
+        'current_value': round(float(value), 2),
+        'level': rule.severity,
+        'message': f"{get_parameter_name(rule.parameter)}{'过低' if is_low else '过高'}",
+        'timestamp': timestamp,
+        'status': 'active',
+        'unit': get_parameter_unit(rule.parameter),
+        'threshold': compiled.threshold_for(rule)
+    }
+
+
+def alert_label(granularity, label):
+    """数据标签的显示文本，原始记录为精确到秒的时间"""
+    if granularity == 'raw':
+        return pd.Timestamp(label).strftime('%Y-%m-%d %H:%M:%S')
+    return label
+
+
+def alert_timestamp(granularity, label):
+    """数据标签转换为预警时间字符串，日粒度沿用当天 12:00"""
+    if granularity == 'raw':
+        return alert_label(granularity, label)
+    if granularity == 'hourly':
+        return f'{label}:00'
+    if granularity == 'daily':
+        return f'{label} 12:00:00'
+    return f'{label}-01 00:00:00'
+
+
+def alert_timestamps(granularity, labels, rows):
+    """批量转换指定行的预警时间，原始记录一次性格式化"""
+    if granularity == 'raw':
+        text = np.datetime_as_string(np.asarray(labels)[rows], unit='s')
+        return [value.replace('T', ' ') for value in text.tolist()]
+    return [alert_timestamp(granularity, labels[row]) for row in rows]
+
+
+def evaluate_alerts(labels, columns, granularity='raw', parameters=None, compiled=None):
+    """
+    对每行数据取所有参数中级别最高的预警
+
+    labels 为每行的时间标签（原始记录为 datetime64，汇总为分组标签），columns 为 {参数: 数组}。
+    返回按行顺序排列的预警字典列表，没有预警的行不返回。
+    """
+    compiled = compiled or rule_matcher.get()
+    parameters = [p for p in (parameters or alert_parameters(compiled)) if p in columns]
+    if not parameters or len(labels) == 0:
+        return []
+
+    matched = np.vstack([compiled.classify_array(p, columns[p]) for p in parameters])
+    values = np.vstack([np.asarray(columns[p], dtype='float64') for p in parameters])
+    ranks = compiled.ranks[matched]
+
+    # argmax 返回第一个最大值，级别相同时取靠前的参数
+    rows = np.flatnonzero(ranks.max(axis=0))
+    best = ranks[:, rows].argmax(axis=0)
+    timestamps = alert_timestamps(granularity, labels, rows)
+    return [
+        build_alert(compiled.rules[index], value, timestamp, compiled)
+        for index, value, timestamp in zip(matched[best, rows].tolist(), values[best, rows].tolist(), timestamps)
+    ]
+
+
+def evaluate_parameter_alerts(labels, columns, granularity='raw', parameters=None, compiled=None):
+    """逐参数返回每行的最高级别预警，结果按行、再按参数顺序排列"""
+    compiled = compiled or rule_matcher.get()
+    parameters = [p for p in (parameters or alert_parameters(compiled)) if p in columns]
+    found = []
+    for order, parameter in enumerate(parameters):
+        values = np.asarray(columns[parameter], dtype='float64')
+        matched = compiled.classify_array(parameter, values)
+        rows = np.flatnonzero(matched >= 0)
+        timestamps = alert_timestamps(granularity, labels, rows)
+        for row, index, value, timestamp in zip(rows.tolist(), matched[rows].tolist(), values[rows].tolist(),
+                                                timestamps):
+            found.append((row, order, build_alert(compiled.rules[index], value, timestamp, compiled)))
+    found.sort(key=lambda item: (item[0], item[1]))
+    return [alert for _, _, alert in found]
+
+
+def load_alert_columns(granularity, start=None, end=None, parameters=None):
+    """
+    读取指定粒度的预警输入数据，start 闭区间、end 开区间
+
+    raw 从时序存储读取原始记录，其余粒度读取汇总表中的分组均值。
+    返回 (时间标签数组, {参数: 数组})。
+    """
+    parameters = parameters or alert_parameters()
+    if granularity not in ALERT_GRANULARITIES:
+        raise ValueError(f'不支持的预警粒度: {granularity}')
+
+    if granularity == 'raw':
+        snapshot = time_series_store.get()
+        snapshot = snapshot.slice_half_open(start, end)
+        return snapshot.datetimes(), {p: snapshot.column(p) for p in parameters}
+
+    labels, stats = rollup_series(granularity, parameters, start, end)
+    columns = {p: np.array(stats[p]['mean'], dtype='float64') for p in parameters}
+    return labels, columns
@@ -0,0 +1,248 @@
+"""
+预警事件后台评估
+
+按 (updated_at, id) 记录检查点，每轮只读取检查点之后新增或被修改的原始记录，
+用向量化预警引擎判断后批量写入 AlertEvent，检查点与事件在同一事务中提交。
+后台线程按系统设置 alert_check_interval 的间隔运行。
+"""
+
+import json
+import threading
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select, insert, update, delete, and_, or_
+
+from models import db, WaterQualityData, AlertRule, AlertEvent, SystemSetting
+from alert_engine import (ALERT_RULES, rule_matcher, alert_parameters, get_parameter_name,
+                          get_parameter_unit)
+from rule_matcher import LOW_OPERATORS
+
+# 检查点在 system_settings 中的键
+CHECKPOINT_KEY = 'alert_checkpoint'
+
+# 每批评估的记录数
+DEFAULT_EVALUATE_BATCH = 5000
+
+# 没有配置 alert_check_interval 时的检查间隔（秒）
+DEFAULT_CHECK_INTERVAL = 300
+
+# 规则运算符与预警方向
+LOW_OPERATOR = '<'
+HIGH_OPERATOR = '>'
+
+
+def seed_alert_rules():
+    """预警规则表为空时按 ALERT_RULES 写入默认规则，返回写入条数"""
+    if db.session.query(AlertRule.id).first() is not None:
+        return 0
+
+    count = 0
+    for parameter, levels in ALERT_RULES.items():
+        for level, threshold in levels.items():
+            for bound, operator, direction in (('min', LOW_OPERATOR, '过低'), ('max', HIGH_OPERATOR, '过高')):
+                if bound not in threshold:
+                    continue
+                db.session.add(AlertRule(
+                    name=f'{get_parameter_name(parameter)}{direction}（{level}）',
+                    parameter=parameter,
+                    operator=operator,
+                    threshold=threshold[bound],
+                    severity=level,
+                    description=f'{get_parameter_name(parameter)} {operator} {threshold[bound]}'
+                ))
+                count += 1
+    db.session.commit()
+    rule_matcher.refresh()
+    return count
+
+
+def read_checkpoint(conn):
+    """读取检查点，返回 (updated_at, id)，尚未评估过时为 (None, 0)"""
+    table = SystemSetting.__table__
+    value = conn.execute(select(table.c.value).where(table.c.key == CHECKPOINT_KEY)).scalar()
+    if not value:
+        return None, 0
+    checkpoint = json.loads(value)
+    if not checkpoint.get('updated_at'):
+        return None, 0
+    return datetime.fromisoformat(checkpoint['updated_at']), checkpoint['id']
+
+
+def write_checkpoint(conn, updated_at, record_id):
+    """保存检查点，updated_at 为 None 表示从头开始"""
+    table = SystemSetting.__table__
+    value = json.dumps({
+        'updated_at': updated_at.isoformat() if updated_at is not None else None,
+        'id': record_id
+    })
+    result = conn.execute(
+        update(table).where(table.c.key == CHECKPOINT_KEY).values(value=value, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(
+            key=CHECKPOINT_KEY, value=value, value_type='json', category='alert',
+            description='预警评估检查点', updated_at=datetime.utcnow()
+        ))
+
+
+def clear_alert_events(conn):
+    """清空预警事件并重置检查点，原始数据被清空时调用"""
+    conn.execute(delete(AlertEvent.__table__))
+    write_checkpoint(conn, None, 0)
+
+
+def evaluate_batch(rows, compiled, parameters):
+    """对一批原始记录逐参数匹配最高级别规则，返回待写入的事件行"""
+    events = []
+    for parameter in parameters:
+        values = np.array([getattr(row, parameter) for row in rows], dtype='float64')
+        matched = compiled.classify_array(parameter, values)
+        for index in np.flatnonzero(matched >= 0).tolist():
+            rule = compiled.rules[matched[index]]
+            if rule.id is None:
+                continue
+            events.append({
+                'rule_id': rule.id,
+                'data_id': rows[index].id,
+                'parameter_value': float(values[index]),
+                'triggered_at': rows[index].timestamp,
+                'is_acknowledged': False
+            })
+    return events
+
+
+def evaluate_pending(batch_size=DEFAULT_EVALUATE_BATCH):
+    """
+    评估检查点之后的全部记录，返回 (评估记录数, 新增事件数)
+
+    被修改过的记录会先删除旧事件再重新评估。规则变化只作用于之后评估的记录。
+    """
+    seed_alert_rules()
+    compiled = rule_matcher.get()
+    parameters = alert_parameters(compiled)
+    table = WaterQualityData.__table__
+    columns = [table.c.id, table.c.timestamp, table.c.updated_at] + [table.c[p] for p in parameters]
+    evaluated = created = 0
+
+    while True:
+        with db.engine.begin() as conn:
+            updated_at, record_id = read_checkpoint(conn)
+            query = select(*columns).order_by(table.c.updated_at, table.c.id).limit(batch_size)
+            if updated_at is not None:
+                query = query.where(or_(
+                    table.c.updated_at > updated_at,
+                    and_(table.c.updated_at == updated_at, table.c.id > record_id)
+                ))
+            rows = conn.execute(query).all()
+            if not rows:
+                break
+
+            conn.execute(delete(AlertEvent.__table__).where(
+                AlertEvent.__table__.c.data_id.in_([row.id for row in rows])
+            ))
+            events = evaluate_batch(rows, compiled, parameters)
+            if events:
+                conn.execute(insert(AlertEvent.__table__), events)
+            write_checkpoint(conn, rows[-1].updated_at, rows[-1].id)
+
+        evaluated += len(rows)
+        created += len(events)
+        if len(rows) < batch_size:
+            break
+    return evaluated, created
+
+
+def get_check_interval():
+    """读取 alert_check_interval 系统设置（秒）"""
+    setting = SystemSetting.query.filter_by(key='alert_check_interval').first()
+    try:
+        interval = setting.get_value() if setting is not None else DEFAULT_CHECK_INTERVAL
+    except ValueError:
+        interval = DEFAULT_CHECK_INTERVAL
+    finally:
+        db.session.remove()
+    return max(int(interval), 1)
+
+
+def event_to_dict(event, rule):
+    """预警事件转换为与历史预警相同格式的字典"""
+    is_low = rule.operator in LOW_OPERATORS
+    return {
+        'id': event.id,
+        'data_id': event.data_id,
+        'rule_id': rule.id,
+        'parameter': rule.parameter,
+        'current_value': round(event.parameter_value, 2),
+        'level': rule.severity,
+        'message': f"{get_parameter_name(rule.parameter)}{'过低' if is_low else '过高'}",
+        'timestamp': event.triggered_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'status': 'acknowledged' if event.is_acknowledged else 'active',
+        'unit': get_parameter_unit(rule.parameter),
+        'threshold': {'min' if is_low else 'max': rule.threshold}
+    }
+
+
+class AlertEvaluator:
+    """后台预警评估线程，每轮间隔从系统设置读取，修改后下一轮生效"""
+
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.last_run = None
+        self.last_result = None
+        self.last_error = None
+
+    def run_once(self, app):
+        """在应用上下文中评估一轮"""
+        with app.app_context():
+            try:
+                self.last_result = evaluate_pending()
+                self.last_error = None
+                if self.last_result[0]:
+                    print(f"预警评估完成: 评估 {self.last_result[0]} 条记录，新增 {self.last_result[1]} 条预警事件")
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"预警评估错误: {e}")
+            finally:
+                self.last_run = datetime.utcnow()
+                db.session.remove()
+
+    def _run(self, app):
+        while not self._stop.is_set():
+            self.run_once(app)
+            with app.app_context():
+                interval = get_check_interval()
+            self._stop.wait(interval)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """启动后台线程，已在运行时不重复启动"""
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(app,), name='alert-evaluator', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+
+    def status(self):
+        """运行状态"""
+        return {
+            'running': self.running,
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'last_evaluated': self.last_result[0] if self.last_result else 0,
+            'last_created': self.last_result[1] if self.last_result else 0,
+            'last_error': self.last_error
+        }
+
+
+# 全局预警评估线程
+alert_evaluator = AlertEvaluator()
@@ -0,0 +1,12 @@
+"""
+数据库侧聚合的分组格式
+
+汇总表和趋势分析的时间分组标签都由 SQLite strftime 按这里的格式生成。
+"""
+
+# 分组粒度对应的 SQLite strftime 格式
+BUCKET_FORMATS = {
+    'hourly': '%Y-%m-%d %H:00',
+    'daily': '%Y-%m-%d',
+    'monthly': '%Y-%m'
+}
@@ -1,11 +1,36 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify,send_file
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify,send_file, Response, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from forms import LoginForm, RegisterForm
-from models import db, WaterQualityData, User, init_db
+from models import (db, WaterQualityData, User, AlertRule, AlertEvent, PredictionModel, init_db, upgrade_schema,
+                    SOURCE_COLUMN_MAP, MEASUREMENT_FIELDS)
+from timeseries_store import time_series_store
+from analytics import BUCKET_FORMATS
+from rollups import rollup_series, rebuild_rollups, check_rollups, ensure_rollups
+from ingest import import_files, collect_source_files, DEFAULT_CHUNK_SIZE
+from cache import cached_response, conditional_response, response_cache, request_data_version
+from alert_engine import (rule_matcher, ALERT_GRANULARITIES, ALERT_GRANULARITY_NAMES, get_parameter_name,
+                          get_parameter_unit, load_alert_columns, evaluate_alerts, alert_label)
+from alert_evaluator import alert_evaluator, evaluate_pending, event_to_dict
+from live_stream import broadcaster, stream_items, stream_parameter_info, STREAM_FIELDS
+from records import parse_fields, fetch_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from payloads import compressed_response, is_columnar, rows_to_columns, format_times, series_values
+from downsample import downsample_indices, DOWNSAMPLE_METHODS, DEFAULT_POINTS, MIN_POINTS, MAX_POINTS
+from correlation import correlation_matrix, MIN_PAIR_COUNT
+from distribution import describe, parse_percentiles, DEFAULT_BINS, MAX_BINS
+from forecasting import (PREDICTION_PARAMETERS, MODEL_TYPES, get_prediction_frame, get_feature_set, forecast,
+                         parse_training_options, parse_prediction_parameters)
+from model_registry import model_registry
+from prediction_jobs import prediction_jobs, JobQueueFull
+from export import (EXPORT_FORMATS, DEFAULT_EXPORT_BATCH, check_format, export_filename, export_records,
+                    export_predictions)
 import os
-from sqlalchemy import func, desc
+import threading
+import click
+from functools import partial
+from sqlalchemy import func, desc, select
 import json
 from datetime import datetime, timedelta
 import pandas as pd
@@ -13,10 +38,6 @@ import numpy as np
 import io
 import math
 import random
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
 import warnings
 warnings.filterwarnings('ignore')
 app = Flask(__name__)
@@ -36,6 +57,30 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
+# 处理请求的进程只做一次的准备工作
+startup_lock = threading.Lock()
+startup_done = False
+
+
+@app.before_request
+def prepare_serving_process():
+    """
+    在处理请求的进程中升级表结构、补建汇总，并启动后台预警评估线程
+
+    flask run、WSGI 服务器和直接运行都会经过这里；调试重载器的监控进程、
+    命令行命令和训练子进程不处理请求，不会启动评估线程。
+    """
+    global startup_done
+    if not startup_done:
+        with startup_lock:
+            if not startup_done:
+                upgrade_schema()
+                ensure_rollups()
+                startup_done = True
+    if not alert_evaluator.running:
+        alert_evaluator.start(app)
+
+
 @app.route('/')
 def index():
     if current_user.is_authenticated:
@@ -91,41 +136,34 @@ def dashboard():
     return render_template('dashboard.html', title='控制台')
 @app.route('/api/dashboard/stream-data')
 @login_required
+@compressed_response
+@conditional_response
 def api_dashboard_stream_data():
-    """获取数据流数据 - 显示所有参数"""
+    """获取数据流数据 - 显示所有参数，format=columnar 时按列返回"""
     try:
+        if is_columnar():
+            table = WaterQualityData.__table__
+            with db.engine.connect() as conn:
+                rows = conn.execute(
+                    select(table.c.timestamp, *[table.c[field] for field in STREAM_FIELDS])
+                    .order_by(table.c.timestamp.desc()).limit(50)
+                ).all()
+            columns = rows_to_columns(['timestamp'] + STREAM_FIELDS, rows)
+            return jsonify({
+                'success': True,
+                'format': 'columnar',
+                'parameters': stream_parameter_info(),
+                'timestamps': [timestamp.isoformat() for timestamp in columns.pop('timestamp')],
+                'values': columns,
+                'total': len(rows)
+            })
+
         # 获取最新的50条记录
         latest_data = WaterQualityData.query.order_by(
             WaterQualityData.timestamp.desc()
         ).limit(50).all()
 
-        stream_data = []
-        for record in latest_data:
-            # 检查并添加所有有数据的参数
-            parameters_to_check = [
-                ('temperature', '温度', 15, 28),
-                ('dissolved_oxygen', '溶解氧', 5, 10),
-                ('ph', 'pH值', 6.5, 8.5),
-                ('turbidity', '浊度', 0, 5),
-                ('chlorophyll', '叶绿素', 0, 3),
-                ('salinity', '盐度', 0, 35)
-            ]
-
-            for param_field, param_name, min_val, max_val in parameters_to_check:
-                value = getattr(record, param_field)
-                if value is not None:
-                    # 判断状态
-                    status = 'normal'
-                    if value < min_val or value > max_val:
-                        status = 'warning'
-
-                    stream_data.append({
-                        'timestamp': record.timestamp.isoformat(),
-                        'parameter': param_name,
-                        'value': float(value),
-                        'status': status,
-                        'unit': get_parameter_unit(param_field)
-                    })
+        stream_data = stream_items(latest_data)
 
         return jsonify({
             'success': True,
@@ -140,6 +178,26 @@ def api_dashboard_stream_data():
         })
 
 
+@app.route('/api/stream')
+@login_required
+def api_stream():
+    """实时推送新数据（readings）和新预警（alerts），数据需整体刷新时推送 resync"""
+    subscriber = broadcaster.subscribe(app)
+    response = Response(broadcaster.stream(subscriber), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 连接在开始推送前断开时生成器不会执行清理，这里兜底注销
+    response.call_on_close(lambda: broadcaster.unsubscribe(subscriber))
+    return response
+
+
+@app.route('/api/stream/status')
+@login_required
+def api_stream_status():
+    """实时推送的连接数、积压与丢弃情况"""
+    return jsonify({'success': True, 'stats': broadcaster.stats()})
+
 def prepare_chart_data(recent_data):
     """准备图表数据，安全处理空值和异常"""
     if not recent_data:
@@ -190,6 +248,8 @@ def prepare_chart_data(recent_data):
 
 @app.route('/api/latest-data')
 @login_required
+@compressed_response
+@conditional_response
 def api_latest_data():
     """API接口：获取最新数据"""
     latest_data = WaterQualityData.query.order_by(WaterQualityData.timestamp.desc()).first()
@@ -206,8 +266,61 @@ def api_latest_data():
         })
 
 
+@app.route('/api/data')
+@login_required
+@compressed_response
+@conditional_response
+def api_data():
+    """
+    按 (timestamp, id) 键集分页读取原始监测数据
+
+    查询参数：fields（逗号分隔，默认全部）、start/end、cursor（上一页返回的 next_cursor）、
+    limit（默认1000，最大10000）、order（asc/desc）、format（columnar 时按列返回）。
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        start, end = parse_time_range()
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        descending = request.args.get('order', 'asc') == 'desc'
+
+        columnar = is_columnar()
+        data, next_cursor = fetch_page(fields, start, end, request.args.get('cursor'), limit, descending,
+                                       columnar)
+        return jsonify({
+            'success': True,
+            'format': 'columnar' if columnar else 'rows',
+            'data': data,
+            'count': len(data['id']) if columnar else len(data),
+            'fields': ['id', 'timestamp'] + fields,
+            'limit': min(max(limit, 1), MAX_PAGE_SIZE),
+            'next_cursor': next_cursor
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/export/data')
+@login_required
+def export_data():
+    """
+    流式导出原始监测数据
+
+    查询参数：format（csv/ndjson/parquet，默认csv）、fields（逗号分隔，默认全部）、start/end。
+    """
+    try:
+        fmt = check_format(request.args.get('format', 'csv'))
+        fields = parse_fields(request.args.get('fields'))
+        start, end = parse_time_range()
+        chunks = export_records(fmt, fields, start, end)
+        return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt], headers={
+            'Content-Disposition': f'attachment; filename={export_filename("water_quality_data", fmt)}'
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/data-statistics')
 @login_required
+@compressed_response
+@conditional_response
 def api_data_statistics():
     """API接口：获取数据统计"""
     total_records = WaterQualityData.query.count()
@@ -254,6 +367,103 @@ def list_users_command():
             print(f'{user.username} ({user.email}) - {user.role}')
 
 
+@app.cli.command('import-data')
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--mode', type=click.Choice(['incremental', 'replace']), default='incremental',
+              help='incremental 只导入新增数据，replace 清空后全量导入')
+@click.option('--update-existing', is_flag=True, help='增量导入时同时回写已存在记录的变更')
+@click.option('--workers', type=int, default=None, help='解析文件的进程数，默认为CPU核数')
+@click.option('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每个批次的行数')
+def import_data_command(paths, mode, update_existing, workers, chunk_size):
+    """Flask命令：并行导入目录或通配符匹配的水质数据文件"""
+    with app.app_context():
+        upgrade_schema()
+        file_paths = collect_source_files(paths)
+        if not file_paths:
+            print('未找到可导入的文件')
+            return
+
+        print(f'共 {len(file_paths)} 个文件，导入模式: {mode}')
+
+        def report(path, stats):
+            if stats['error']:
+                print(f'[失败] {path}: {stats["error"]}')
+            else:
+                print(f'[完成] {path}: 导入 {stats["imported"]} 条，跳过 {stats["skipped"]} 条，'
+                      f'解析 {stats["parse_seconds"]:.2f} 秒，写入 {stats["write_seconds"]:.2f} 秒')
+
+        started = datetime.now()
+        results = import_files(file_paths, mode=mode, update_existing=update_existing,
+                               workers=workers, chunk_size=chunk_size, progress=report)
+        imported = sum(stats['imported'] for stats in results.values())
+        failed = sum(1 for stats in results.values() if stats['error'])
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f'导入完成: 共导入 {imported} 条记录，失败文件 {failed} 个，耗时 {elapsed:.2f} 秒')
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Flask命令：根据原始数据重建小时/日/月汇总"""
+    with app.app_context():
+        upgrade_schema()
+        started = datetime.now()
+        rows = rebuild_rollups()
+        print(f'汇总重建完成，共 {rows} 行，耗时 {(datetime.now() - started).total_seconds():.2f} 秒')
+
+
+@app.cli.command('evaluate-alerts')
+def evaluate_alerts_command():
+    """Flask命令：评估检查点之后的新数据并写入预警事件"""
+    with app.app_context():
+        upgrade_schema()
+        started = datetime.now()
+        evaluated, created = evaluate_pending()
+        print(f'预警评估完成: 评估 {evaluated} 条记录，新增 {created} 条预警事件，'
+              f'耗时 {(datetime.now() - started).total_seconds():.2f} 秒')
+
+
+@app.cli.command('export-data')
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default=None,
+              help='导出格式，默认按文件扩展名判断')
+@click.option('--fields', default=None, help='逗号分隔的字段，默认全部')
+@click.option('--start', default=None, help='开始时间（含）')
+@click.option('--end', default=None, help='结束时间（不含）')
+@click.option('--batch-size', type=int, default=DEFAULT_EXPORT_BATCH, help='每批读取的行数')
+def export_data_command(output, fmt, fields, start, end, batch_size):
+    """Flask命令：流式导出原始监测数据到 CSV/NDJSON/Parquet 文件"""
+    with app.app_context():
+        fmt = fmt or os.path.splitext(output)[1].lstrip('.').lower() or 'csv'
+        try:
+            chunks = export_records(check_format(fmt), parse_fields(fields),
+                                    datetime.fromisoformat(start) if start else None,
+                                    datetime.fromisoformat(end) if end else None, batch_size)
+        except ValueError as e:
+            print(f'导出失败: {e}')
+            return
+
+        started = datetime.now()
+        size = 0
+        with open(output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        print(f'导出完成: {output}，{size / 1024 / 1024:.2f} MB，'
+              f'耗时 {(datetime.now() - started).total_seconds():.2f} 秒')
+
+@app.cli.command('check-rollups')
+def check_rollups_command():
+    """Flask命令：检查汇总与原始数据是否一致"""
+    with app.app_context():
+        mismatches = check_rollups()
+        if not mismatches:
+            print('汇总与原始数据一致')
+            return
+        for granularity, bucket, parameter, detail in mismatches[:50]:
+            print(f'[{granularity}] {bucket} {parameter}: {detail}')
+        print(f'共 {len(mismatches)} 处不一致，可运行 flask rebuild-rollups 重建')
+
+
 
 
 
@@ -265,41 +475,65 @@ def list_users_command():
 def analysis_center():
     return render_template('analysis.html', title='水质分析中心')
 
-def calculate_daily_averages(data):
-    """计算每日平均值"""
-    from collections import defaultdict
-    daily_data = defaultdict(lambda: {'temp': [], 'oxygen': [], 'ph': []})
-
-    for record in data:
-        if record.timestamp:
-            date_key = record.timestamp.strftime('%Y-%m-%d')
-            if record.temperature: daily_data[date_key]['temp'].append(float(record.temperature))
-            if record.dissolved_oxygen: daily_data[date_key]['oxygen'].append(float(record.dissolved_oxygen))
-            if record.ph: daily_data[date_key]['ph'].append(float(record.ph))
-
-    return daily_data
+def parse_time_arg(name):
+    """解析查询参数中的时间，只有日期时返回 (时间, True)"""
+    value = request.args.get(name)
+    if not value:
+        return None, False
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'无效的时间参数 {name}: {value}')
+    return parsed, len(value) <= 10
+
+def parse_time_range():
+    """
+    解析 start/end 查询参数，返回 (start, end)，start 闭区间、end 开区间
+
+    end 只有日期时包含当天全天
+    """
+    start, _ = parse_time_arg('start')
+    end, date_only = parse_time_arg('end')
+    if end is not None and date_only:
+        end += timedelta(days=1)
+    return start, end
+
+def safe_round(value, digits=2):
+    """NaN 或空值返回 0，其余四舍五入"""
+    if value is None or np.isnan(value):
+        return 0
+    return round(float(value), digits)
+
+def calculate_daily_averages(fields):
+    """从日汇总读取每日平均值"""
+    _, stats = rollup_series('daily', fields)
+    return {field: stats[field]['mean'] for field in fields}
+
+def mean_of(values):
+    """忽略 None 求均值，没有有效值时返回 None"""
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
 
 @app.route('/api/analysis/overview')
 @login_required
+@compressed_response
+@conditional_response
+@cached_response
 def api_analysis_overview():
     """分析中心概览数据"""
     try:
-        data = WaterQualityData.query.all()
-        if not data:
+        total_records = WaterQualityData.query.count()
+        if not total_records:
             return jsonify({'success': False, 'error': '无数据'})
 
-        daily_data = calculate_daily_averages(data)
-
-        # 计算总平均
-        daily_avg_temps = [sum(values['temp'])/len(values['temp']) for values in daily_data.values() if values['temp']]
-        daily_avg_oxygen = [sum(values['oxygen'])/len(values['oxygen']) for values in daily_data.values() if values['oxygen']]
-        daily_avg_ph = [sum(values['ph'])/len(values['ph']) for values in daily_data.values() if values['ph']]
+        daily_means = calculate_daily_averages(['temperature', 'dissolved_oxygen', 'ph'])
 
+        # 计算总平均（各日均值的平均）
         metrics = {
-            'avg_temperature': round(sum(daily_avg_temps)/len(daily_avg_temps), 1) if daily_avg_temps else 0,
-            'avg_oxygen': round(sum(daily_avg_oxygen)/len(daily_avg_oxygen), 1) if daily_avg_oxygen else 0,
-            'avg_ph': round(sum(daily_avg_ph)/len(daily_avg_ph), 2) if daily_avg_ph else 0,
-            'total_records': len(data)
+            'avg_temperature': safe_round(mean_of(daily_means['temperature']), 1),
+            'avg_oxygen': safe_round(mean_of(daily_means['dissolved_oxygen']), 1),
+            'avg_ph': safe_round(mean_of(daily_means['ph']), 2),
+            'total_records': total_records
         }
 
         return jsonify({'success': True, 'metrics': metrics})
@@ -308,44 +542,29 @@ def api_analysis_overview():
 
 @app.route('/api/analysis/trend')
 @login_required
+@compressed_response
+@conditional_response
+@cached_response
 def api_analysis_trend():
-    """趋势数据"""
+    """趋势数据，从汇总表按 start/end 时间范围读取"""
     try:
         granularity = request.args.get('granularity', 'monthly')
-        data = WaterQualityData.query.order_by(WaterQualityData.timestamp).all()
+        if granularity not in BUCKET_FORMATS:
+            granularity = 'monthly'
+        start, end = parse_time_range()
+
+        # 未指定时间范围时日粒度只显示最近30天
+        limit = 30 if granularity == 'daily' and start is None and end is None else None
 
-        if not data:
+        fields = ['temperature', 'dissolved_oxygen', 'ph', 'turbidity', 'chlorophyll']
+        sorted_dates, stats = rollup_series(granularity, fields, start, end, limit)
+
+        if not sorted_dates:
             return jsonify({'success': False, 'error': '无数据'})
 
-        # 分组数据
-        grouped_data = {}
-        for record in data:
-            if record.timestamp:
-                key = record.timestamp.strftime('%Y-%m-%d' if granularity == 'daily' else '%Y-%m')
-                if key not in grouped_data:
-                    grouped_data[key] = {'temp': [], 'oxygen': [], 'ph': [], 'turbidity': [], 'chlorophyll': []}
-
-                if record.temperature: grouped_data[key]['temp'].append(float(record.temperature))
-                if record.dissolved_oxygen: grouped_data[key]['oxygen'].append(float(record.dissolved_oxygen))
-                if record.ph: grouped_data[key]['ph'].append(float(record.ph))
-                if record.turbidity: grouped_data[key]['turbidity'].append(float(record.turbidity))
-                if record.chlorophyll: grouped_data[key]['chlorophyll'].append(float(record.chlorophyll))
-
-        sorted_dates = sorted(grouped_data.keys())
-        if granularity == 'daily':  # 限制显示天数
-            sorted_dates = sorted_dates[-30:]
-
-        def safe_avg(values):
-            return round(sum(values)/len(values), 2) if values else 0
-
-        trend_data = {
-            'dates': sorted_dates,
-            'temperature': [safe_avg(grouped_data[date]['temp']) for date in sorted_dates],
-            'dissolved_oxygen': [safe_avg(grouped_data[date]['oxygen']) for date in sorted_dates],
-            'ph': [safe_avg(grouped_data[date]['ph']) for date in sorted_dates],
-            'turbidity': [safe_avg(grouped_data[date]['turbidity']) for date in sorted_dates],
-            'chlorophyll': [safe_avg(grouped_data[date]['chlorophyll']) for date in sorted_dates]
-        }
+        trend_data = {'dates': sorted_dates}
+        for field in fields:
+            trend_data[field] = [safe_round(value) for value in stats[field]['mean']]
 
         return jsonify({'success': True, 'trend_data': trend_data})
     except Exception as e:
@@ -355,57 +574,47 @@ def api_analysis_trend():
 # 确保这些路由都存在
 @app.route('/api/analysis/correlation')
 @login_required
+@compressed_response
+@conditional_response
+@cached_response
 def api_analysis_correlation():
-    """相关性分析"""
+    """
+    相关性分析，使用全部数据，每对参数只取两者都有值的记录
+
+    查询参数：parameters（逗号分隔，默认温度、溶解氧、pH值、浊度）、start/end、
+    lag（小时，x(t) 与 y(t + lag) 的互相关）。
+    """
     try:
-        # 获取有效数据（包含浊度）
-        data = WaterQualityData.query.filter(
-            WaterQualityData.temperature.isnot(None),
-            WaterQualityData.dissolved_oxygen.isnot(None),
-            WaterQualityData.ph.isnot(None),
-            WaterQualityData.turbidity.isnot(None)  # 新增浊度
-        ).limit(500).all()
-
-        if len(data) < 10:
+        parameters = request.args.get('parameters', 'temperature,dissolved_oxygen,ph,turbidity').split(',')
+        for parameter in parameters:
+            if parameter not in MEASUREMENT_FIELDS:
+                raise ValueError(f'未知的参数: {parameter}')
+        param_names = [get_parameter_name(parameter) for parameter in parameters]
+        lag = request.args.get('lag', 0, type=int)
+        start, end = parse_time_range()
+
+        corr_matrix, counts, source = correlation_matrix(parameters, start, end, lag)
+        off_diagonal = counts[~np.eye(len(parameters), dtype=bool)]
+        if len(parameters) < 2 or off_diagonal.max(initial=0) < MIN_PAIR_COUNT:
             return jsonify({'success': False, 'error': '数据不足'})
 
-        # 简化版相关性计算（包含浊度）
-        parameters = ['temperature', 'dissolved_oxygen', 'ph', 'turbidity']  # 新增浊度
-        param_names = ['温度', '溶解氧', 'pH值', '浊度']  # 新增浊度
-        param_data = {param: [] for param in parameters}
-
-        # 收集数据（包含浊度）
-        for record in data:
-            for param in parameters:
-                value = getattr(record, param)
-                if value is not None:
-                    param_data[param].append(float(value))
-
-        # 计算相关性矩阵（现在包含浊度）
-        correlation_matrix = []
-        for i, param1 in enumerate(parameters):
-            for j, param2 in enumerate(parameters):
-                if i == j:
-                    correlation = 1.0
-                else:
-                    # 简单相关性计算
-                    data1 = param_data[param1]
-                    data2 = param_data[param2]
-                    min_len = min(len(data1), len(data2))
-                    if min_len < 5:
-                        correlation = 0.0
-                    else:
-                        # 使用numpy计算相关性
-                        corr_matrix = np.corrcoef(data1[:min_len], data2[:min_len])
-                        correlation = float(corr_matrix[0, 1]) if not np.isnan(corr_matrix[0, 1]) else 0.0
-
-                correlation_matrix.append([param_names[i], param_names[j], correlation])
+        correlation_matrix_data = []
+        for i in range(len(parameters)):
+            for j in range(len(parameters)):
+                correlation = 1.0 if i == j and lag == 0 else float(corr_matrix[i, j])
+                if np.isnan(correlation):
+                    correlation = 0.0
+                correlation_matrix_data.append([param_names[i], param_names[j], correlation])
 
         return jsonify({
             'success': True,
             'correlation_data': {
                 'parameters': param_names,
-                'matrix': correlation_matrix
+                'fields': parameters,
+                'matrix': correlation_matrix_data,
+                'counts': counts.astype(int).tolist(),
+                'lag': lag,
+                'source': source
             }
         })
 
@@ -414,37 +623,41 @@ def api_analysis_correlation():
 
 @app.route('/api/analysis/distribution')
 @login_required
+@compressed_response
+@conditional_response
+@cached_response
 def api_analysis_distribution():
-    """分布统计"""
+    """
+    分布统计：最值、均值、标准差、分位数和等宽直方图
+
+    查询参数：parameters（逗号分隔，默认温度、溶解氧、pH值、浊度）、start/end、
+    percentiles（如 5,50,95）、bins（直方图分箱数，默认20）。
+    """
     try:
-        data = WaterQualityData.query.all()
-        if not data:
+        parameters = request.args.get('parameters', 'temperature,dissolved_oxygen,ph,turbidity').split(',')
+        for parameter in parameters:
+            if parameter not in MEASUREMENT_FIELDS:
+                raise ValueError(f'未知的参数: {parameter}')
+        param_names = [get_parameter_name(parameter) for parameter in parameters]
+        percentiles = parse_percentiles(request.args.get('percentiles'))
+        bins = min(max(request.args.get('bins', DEFAULT_BINS, type=int), 1), MAX_BINS)
+
+        snapshot = time_series_store.get()
+        start, end = parse_time_range()
+        snapshot = snapshot.slice_half_open(start, end)
+        if snapshot.empty:
             return jsonify({'success': False, 'error': '无数据'})
 
-        # 主要参数统计
-        parameters = ['temperature', 'dissolved_oxygen', 'ph', 'turbidity']
-        param_names = ['温度', '溶解氧', 'pH值', '浊度']
-
-        min_values, avg_values, max_values = [], [], []
-
-        for param in parameters:
-            values = [float(getattr(record, param)) for record in data if getattr(record, param) is not None]
-            if values:
-                min_values.append(round(min(values), 2))
-                avg_values.append(round(sum(values)/len(values), 2))
-                max_values.append(round(max(values), 2))
-            else:
-                min_values.append(0)
-                avg_values.append(0)
-                max_values.append(0)
+        stats = describe(np.column_stack([snapshot.column(param) for param in parameters]), percentiles, bins)
 
         return jsonify({
             'success': True,
             'distribution_data': {
                 'categories': param_names,
-                'min': min_values,
-                'avg': avg_values,
-                'max': max_values
+                'min': [safe_round(item['min']) for item in stats],
+                'avg': [safe_round(item['mean']) for item in stats],
+                'max': [safe_round(item['max']) for item in stats],
+                'stats': dict(zip(parameters, stats))
             }
         })
 
@@ -452,29 +665,18 @@ def api_analysis_distribution():
         return jsonify({'success': False, 'error': str(e)})
 @app.route('/api/analysis/calendar')
 @login_required
+@compressed_response
+@conditional_response
+@cached_response
 def api_analysis_calendar():
     """日历视图数据"""
     try:
-        data = WaterQualityData.query.filter(
-            WaterQualityData.timestamp.isnot(None),
-            WaterQualityData.temperature.isnot(None)
-        ).order_by(WaterQualityData.timestamp).all()
-
-        monthly_data = {}
-        for record in data:
-            if record.timestamp and record.temperature:
-                month_key = record.timestamp.strftime('%Y-%m')
-                if month_key not in monthly_data:
-                    monthly_data[month_key] = []
-                monthly_data[month_key].append(float(record.temperature))
+        months, stats = rollup_series('monthly', ['temperature'])
 
         calendar_data = []
-        for month, temps in monthly_data.items():
-            if temps:
-                avg_temp = round(sum(temps)/len(temps), 1)
-                calendar_data.append([f"{month}-01", avg_temp])
-
-        calendar_data.sort(key=lambda x: x[0])
+        for month, avg_temp in zip(months, stats['temperature']['mean']):
+            if avg_temp is not None:
+                calendar_data.append([f"{month}-01", round(avg_temp, 1)])
 
         return jsonify({
             'success': True,
@@ -485,98 +687,66 @@ def api_analysis_calendar():
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
-# 全局变量存储数据
-water_data = None
-data_loaded = False
-# 在应用启动时加载数据
-# 从数据库加载数据的函数
-def load_data_from_database():
-    try:
-        with app.app_context():
-            # 查询所有数据
-            records = WaterQualityData.query.order_by(WaterQualityData.timestamp).all()
-
-            if not records:
-                print("数据库中没有数据")
-                return None
-
-            # 转换为DataFrame
-            data_list = []
-            for record in records:
-                data_list.append({
-                    'Timestamp': record.timestamp,
-                    'Record number': record.record_number,
-                    'Average Water Speed': record.average_water_speed,
-                    'Average Water Direction': record.average_water_direction,
-                    'Chlorophyll': record.chlorophyll,
-                    'Chlorophyll [quality]': record.chlorophyll_quality,
-                    'Temperature': record.temperature,
-                    'Temperature [quality]': record.temperature_quality,
-                    'Dissolved Oxygen': record.dissolved_oxygen,
-                    'Dissolved Oxygen [quality]': record.dissolved_oxygen_quality,
-                    'Dissolved Oxygen (%Saturation)': record.dissolved_oxygen_saturation,
-                    'Dissolved Oxygen (%Saturation) [quality]': record.dissolved_oxygen_saturation_quality,
-                    'pH': record.ph,
-                    'pH [quality]': record.ph_quality,
-                    'Salinity': record.salinity,
-                    'Salinity [quality]': record.salinity_quality,
-                    'Specific Conductance': record.specific_conductance,
-                    'Specific Conductance [quality]': record.specific_conductance_quality,
-                    'Turbidity': record.turbidity,
-                    'Turbidity [quality]': record.turbidity_quality
-                })
-
-            df = pd.DataFrame(data_list)
-            print(f"从数据库加载了 {len(df)} 条记录")
-            return df
 
+@app.route('/api/cache/stats')
+@login_required
+def api_cache_stats():
+    """响应缓存的命中率等统计信息"""
+    try:
+        return jsonify({'success': True, 'stats': response_cache.stats()})
     except Exception as e:
-        print(f"从数据库加载数据失败: {str(e)}")
-        return None
-
-# 数据预处理函数
-def preprocess_data(df):
-    df_clean = df.copy()
-
-    # 确保时间列是datetime类型
-    if 'Timestamp' in df_clean.columns:
-        df_clean['Timestamp'] = pd.to_datetime(df_clean['Timestamp'])
-
-    # 处理数值列
-    numeric_columns = [
-        'Average Water Speed', 'Average Water Direction', 'Chlorophyll',
-        'Temperature', 'Dissolved Oxygen', 'Dissolved Oxygen (%Saturation)',
-        'pH', 'Salinity', 'Specific Conductance', 'Turbidity'
-    ]
-
-    for col in numeric_columns:
-        if col in df_clean.columns:
-            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-
-    # 按时间排序
-    if 'Timestamp' in df_clean.columns:
-        df_clean = df_clean.sort_values('Timestamp').reset_index(drop=True)
-
-    return df_clean
-
-# 懒加载数据函数
-def ensure_data_loaded():
-    global water_data, data_loaded
-    if not data_loaded:
-        print("首次加载数据...")
-        water_data = load_data_from_database()
-        if water_data is not None:
-            water_data = preprocess_data(water_data)
-            data_loaded = True
-            print("数据加载成功！")
-        else:
-            data_loaded = False
-            print("数据加载失败！")
+        return jsonify({'success': False, 'error': str(e)})
 
 
+def snapshot_version():
+    """时序存储当前快照的指纹，用于预测接口的 ETag"""
+    return time_series_store.get().fingerprint
 
 
 
+@app.route('/api/series')
+@login_required
+@compressed_response
+@conditional_response(version_func=snapshot_version)
+def api_series():
+    """
+    降采样后的原始时序数据，用于长时间范围的图表
+
+    查询参数：parameters（逗号分隔，默认 temperature）、start/end、
+    points（目标点数，默认1000）、method（lttb 或 minmax，默认 lttb）。
+    每个参数单独降采样，按列返回时间和数值。
+    """
+    try:
+        snapshot = time_series_store.get()
+        parameters = [p for p in request.args.get('parameters', 'temperature').split(',') if p]
+        for parameter in parameters:
+            if parameter not in snapshot.columns:
+                raise ValueError(f'未知的参数: {parameter}')
+        method = request.args.get('method', 'lttb')
+        if method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f'不支持的降采样方法: {method}')
+        points = min(max(request.args.get('points', DEFAULT_POINTS, type=int), MIN_POINTS), MAX_POINTS)
+
+        start, end = parse_time_range()
+        snapshot = snapshot.slice_half_open(start, end)
+
+        series = {}
+        for parameter in parameters:
+            values = snapshot.column(parameter)
+            indexes = downsample_indices(snapshot.timestamps, values, points, method)
+            series[parameter] = {
+                'time': np.datetime_as_string(snapshot.datetimes()[indexes], unit='s').tolist(),
+                'value': values[indexes].tolist(),
+                'name': get_parameter_name(parameter),
+                'unit': get_parameter_unit(parameter),
+                'raw_points': int(np.count_nonzero(~np.isnan(values)))
+            }
+
+        return jsonify({'success': True, 'method': method, 'points': points, 'series': series})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
 # 预测中心主页路由
 @app.route('/prediction')
 def prediction_center():
@@ -584,51 +754,43 @@ def prediction_center():
 
 # API: 检查数据状态
 @app.route('/api/prediction/status')
+@conditional_response(version_func=snapshot_version)
 def get_data_status():
-    ensure_data_loaded()
-    global water_data
-    if water_data is None or water_data.empty:
+    snapshot = time_series_store.get()
+    if snapshot.empty:
         return jsonify({'status': 'error', 'message': '数据未加载'}), 400
 
+    start, end = snapshot.time_range()
     return jsonify({
         'status': 'success',
         'message': '数据加载成功',
-        'data_shape': water_data.shape,
+        'data_shape': [len(snapshot), len(snapshot.fields) + 1],
         'timestamp_range': {
-            'start': water_data['Timestamp'].min().strftime('%Y-%m-%d %H:%M:%S'),
-            'end': water_data['Timestamp'].max().strftime('%Y-%m-%d %H:%M:%S')
-        }
+            'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'end': end.strftime('%Y-%m-%d %H:%M:%S')
+        },
+        'memory_usage': snapshot.memory_usage()
     })
 
 # API: 获取可用参数列表
 @app.route('/api/prediction/parameters')
+@conditional_response(version_func=snapshot_version)
 def get_prediction_parameters():
-    ensure_data_loaded()
-    global water_data
+    snapshot = time_series_store.get()
 
-    if water_data is None or water_data.empty:
+    if snapshot.empty:
         return jsonify({'error': '数据未加载'}), 400
 
-    parameter_mapping = {
-        'Dissolved Oxygen': {'name': '溶解氧', 'unit': 'mg/L'},
-        'Temperature': {'name': '温度', 'unit': '°C'},
-        'pH': {'name': 'pH值', 'unit': ''},
-        'Salinity': {'name': '盐度', 'unit': 'PSU'},
-        'Chlorophyll': {'name': '叶绿素', 'unit': 'μg/L'},
-        'Turbidity': {'name': '浊度', 'unit': 'NTU'},
-        'Specific Conductance': {'name': '电导率', 'unit': 'mS/cm'},
-        'Average Water Speed': {'name': '平均水流速度', 'unit': 'm/s'},
-        'Average Water Direction': {'name': '平均水流方向', 'unit': '°'}
-    }
-
     available_parameters = []
-    for param_id, param_info in parameter_mapping.items():
-        if param_id in water_data.columns and water_data[param_id].notna().sum() > 10:
+    for param_id, param_info in PREDICTION_PARAMETERS.items():
+        field = SOURCE_COLUMN_MAP[param_id]
+        data_count = int(np.count_nonzero(~np.isnan(snapshot.column(field))))
+        if data_count > 10:
             available_parameters.append({
                 'id': param_id,
                 'name': param_info['name'],
                 'unit': param_info['unit'],
-                'data_count': int(water_data[param_id].notna().sum())
+                'data_count': data_count
             })
 
     return jsonify(available_parameters)
@@ -636,366 +798,216 @@ def get_prediction_parameters():
 # API: 重新加载数据
 @app.route('/api/prediction/reload', methods=['POST'])
 def reload_data():
-    ensure_data_loaded()
-    global water_data
     try:
-        water_data = load_data_from_database()
-        if water_data is not None:
-            water_data = preprocess_data(water_data)
-            return jsonify({
-                'success': True,
-                'message': f'数据重新加载成功，共 {len(water_data)} 条记录'
-            })
+        snapshot = time_series_store.refresh()
+        return jsonify({
+            'success': True,
+            'message': f'数据重新加载成功，共 {len(snapshot)} 条记录'
+        })
     except Exception as e:
         return jsonify({'error': f'重新加载数据失败: {str(e)}'}), 500
 
-# 通用预测函数
-def prepare_prediction_data(target_param, df):
-    """准备预测数据"""
-    if target_param not in df.columns or 'Timestamp' not in df.columns:
-        return None, None, None
-
-    # 创建时间特征
-    df_clean = df[['Timestamp', target_param]].copy()
-    df_clean = df_clean.dropna()
-
-    if len(df_clean) < 10:
-        return None, None, None
+def columns_to_points(columns):
+    """{'time': [...], 'value': [...]} 转为逐点的 {'time', 'value'} 列表"""
+    return [{'time': time, 'value': value} for time, value in zip(columns['time'], columns['value'])]
 
-    df_clean['hour'] = df_clean['Timestamp'].dt.hour
-    df_clean['day_of_week'] = df_clean['Timestamp'].dt.dayofweek
-    df_clean['time_index'] = range(len(df_clean))
-
-    X = df_clean[['hour', 'day_of_week', 'time_index']].values
-    y = df_clean[target_param].values
-
-    return X, y, df_clean
-
-def train_and_predict(X, y, model_type, forecast_hours, df_clean):
-    """训练模型并进行预测"""
-    if len(X) < 10:
-        return None, None, None
-
-    # 分割数据
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    # 选择模型
-    model = RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10) if model_type == 'random_forest' else LinearRegression()
-
-    # 训练模型
-    model.fit(X_train, y_train)
+# API: 已训练模型
+@app.route('/api/prediction/models')
+def list_prediction_models():
+    """当前启用的预测模型及模型缓存的命中情况"""
+    try:
+        models = PredictionModel.query.filter_by(is_active=True).order_by(PredictionModel.target_parameter).all()
+        return jsonify({
+            'success': True,
+            'models': [{
+                'id': model.id,
+                'parameter': model.target_parameter,
+                'model_type': model.model_type,
+                'data_version': model.data_version,
+                'performance': json.loads(model.performance_metrics or '{}'),
+                'config': json.loads(model.model_config),
+                'updated_at': model.updated_at.isoformat() if model.updated_at else None
+            } for model in models],
+            'cache': model_registry.stats()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
 
-    # 评估模型
-    y_pred = model.predict(X_test)
-    performance = {
-        'mse': float(mean_squared_error(y_test, y_pred)),
-        'r2': float(r2_score(y_test, y_pred)),
-        'mae': float(mean_absolute_error(y_test, y_pred))
+def run_single_prediction(target_param, model_type, options, forecast_hours, history_points, history_method, columnar,
+                          progress):
+    """在预测任务中训练（或复用）模型并外推，返回与接口相同结构的结果"""
+    snapshot = time_series_store.get()
+    df = get_prediction_frame(snapshot, target_param)
+    if df is None:
+        raise ValueError(f'参数 {target_param} 不存在')
+
+    # 准备数据
+    progress(0.1, '准备数据')
+    df_clean = df.dropna()
+    if get_feature_set(snapshot, target_param) is None:
+        raise ValueError('有效数据量不足')
+
+    # 数据版本未变化时复用已训练的模型
+    progress(0.2, '训练模型')
+    trained = model_registry.get(target_param, model_type, options)
+    if trained is None:
+        raise ValueError('预测失败')
+    performance = trained.performance
+    progress(0.9, '生成预测')
+    future_times, future_predictions = forecast(trained.model, trained.meta, forecast_hours)
+
+    # 准备返回数据，历史默认只返回最近100条，指定 history_points 时对全部历史降采样
+    if history_points:
+        indexes = downsample_indices(df_clean['Timestamp'].to_numpy(), df_clean[target_param].to_numpy(),
+                                     history_points, history_method)
+        recent = df_clean.iloc[indexes]
+    else:
+        recent = df_clean.iloc[-100:]
+    history = {'time': format_times(recent['Timestamp']), 'value': series_values(recent[target_param])}
+    predictions = {
+        'time': [time.strftime('%Y-%m-%d %H:%M:%S') for time in future_times],
+        'value': future_predictions.tolist()
     }
 
-    # 生成预测
-    last_time = df_clean['Timestamp'].max()
-    future_times = [last_time + timedelta(hours=i) for i in range(1, forecast_hours + 1)]
+    result = {
+        'success': True,
+        'model_performance': performance,
+        'model_type': model_type,
+        'parameter': target_param
+    }
+    if columnar:
+        result.update({'format': 'columnar', 'history': history, 'predictions': predictions})
+    else:
+        result.update({'history': columns_to_points(history), 'predictions': columns_to_points(predictions)})
+    return result
 
-    future_features = []
-    for time in future_times:
-        future_features.append([
-            time.hour,
-            time.weekday(),
-            df_clean['time_index'].max() + (time - last_time).total_seconds() / 3600
-        ])
+def run_multi_prediction(target_params, options, forecast_hours, columnar, progress):
+    """在预测任务中为多个参数训练（或复用）随机森林并外推"""
+    # 缺少的模型在进程池中并行训练
+    progress(0.1, '训练模型')
+    models = model_registry.get_many(target_params, 'random_forest', options)
+
+    progress(0.9, '生成预测')
+    results = {}
+    for target_param, trained in models.items():
+        if trained is None:
+            continue
+        performance = trained.performance
+        future_times, future_predictions = forecast(trained.model, trained.meta, forecast_hours)
+
+        predictions = {
+            'time': [time.strftime('%Y-%m-%d %H:%M:%S') for time in future_times],
+            'value': future_predictions.tolist()
+        }
+        results[target_param] = {
+            'r2_score': performance['r2'],
+            'model_performance': performance,
+            'predictions': predictions if columnar else columns_to_points(predictions)
+        }
 
-    future_predictions = model.predict(future_features)
+    if columnar:
+        return {'success': True, 'format': 'columnar', 'results': results}
+    return {'success': True, 'results': results}
 
-    return performance, future_times, future_predictions
+def job_response(job):
+    """提交预测任务的响应：已完成（命中结果缓存）时返回 200 并附带结果，否则返回 202"""
+    return jsonify({
+        'success': True,
+        'job': job.to_dict(),
+        'status_url': url_for('get_prediction_job', job_id=job.id)
+    }), 200 if job.finished else 202
 
 # API: 单参数预测
 @app.route('/api/prediction/single', methods=['POST'])
 def single_parameter_prediction():
-    ensure_data_loaded()
+    """提交单参数预测任务，通过 /api/prediction/jobs/<id> 查询进度和结果"""
     try:
-        global water_data
-        if water_data is None or water_data.empty:
+        snapshot = time_series_store.get()
+        if snapshot.empty:
             return jsonify({'error': '数据未加载'}), 400
 
         data = request.json
         target_param = data.get('parameter')
         model_type = data.get('model', 'linear')
+        options = parse_training_options(data)
         forecast_hours = int(data.get('hours', 24))
+        history_points = int(data.get('history_points') or 0)
+        history_method = data.get('history_method', 'lttb')
+        columnar = is_columnar()
 
-        if target_param not in water_data.columns:
+        if get_prediction_frame(snapshot, target_param) is None:
             return jsonify({'error': f'参数 {target_param} 不存在'}), 400
-
-        # 准备数据
-        X, y, df_clean = prepare_prediction_data(target_param, water_data.copy())
-        if X is None:
-            return jsonify({'error': '有效数据量不足'}), 400
-
-        # 训练和预测
-        performance, future_times, future_predictions = train_and_predict(X, y, model_type, forecast_hours, df_clean)
-        if performance is None:
-            return jsonify({'error': '预测失败'}), 400
-
-        # 准备返回数据
-        history_data = [
-            {'time': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'), 'value': row[target_param]}
-            for _, row in df_clean.iterrows()
-        ]
-
-        prediction_data = [
-            {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'value': float(pred)}
-            for time, pred in zip(future_times, future_predictions)
-        ]
-
-        return jsonify({
-            'success': True,
-            'model_performance': performance,
-            'history': history_data[-100:],
-            'predictions': prediction_data,
-            'model_type': model_type,
-            'parameter': target_param
-        })
-
+        if model_type not in MODEL_TYPES:
+            return jsonify({'error': f'不支持的模型类型: {model_type}'}), 400
+        if history_points and history_method not in DOWNSAMPLE_METHODS:
+            return jsonify({'error': f'不支持的降采样方法: {history_method}'}), 400
+
+        params = (target_param, model_type, options, forecast_hours, history_points, history_method, columnar)
+        job = prediction_jobs.submit(app, 'single', params, partial(run_single_prediction, *params))
+        return job_response(job)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': f'预测错误: {str(e)}'}), 500
 
 # API: 多变量联合预测
 @app.route('/api/prediction/multi', methods=['POST'])
 def multi_parameter_prediction():
-    ensure_data_loaded()
+    """提交多变量预测任务，通过 /api/prediction/jobs/<id> 查询进度和结果"""
     try:
-        global water_data
-        if water_data is None or water_data.empty:
+        snapshot = time_series_store.get()
+        if snapshot.empty:
             return jsonify({'error': '数据未加载'}), 400
 
         data = request.json
-        target_params = data.get('parameters', [])
+        target_params = parse_prediction_parameters(data.get('parameters'))
+        options = parse_training_options(data)
         forecast_hours = int(data.get('hours', 24))
+        columnar = is_columnar()
 
-        results = {}
-        for target_param in target_params:
-            if target_param not in water_data.columns:
-                continue
-
-            X, y, df_clean = prepare_prediction_data(target_param, water_data.copy())
-            if X is None:
-                continue
-
-            performance, future_times, future_predictions = train_and_predict(X, y, 'random_forest', forecast_hours, df_clean)
-            if performance is None:
-                continue
-
-            results[target_param] = {
-                'r2_score': performance['r2'],
-                'predictions': [
-                    {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'value': float(pred)}
-                    for time, pred in zip(future_times, future_predictions)
-                ]
-            }
-
-        return jsonify({'success': True, 'results': results})
+        params = (target_params, options, forecast_hours, columnar)
+        job = prediction_jobs.submit(app, 'multi', params, partial(run_multi_prediction, *params))
+        return job_response(job)
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': f'多变量预测错误: {str(e)}'}), 500
 
+# API: 预测任务状态
+@app.route('/api/prediction/jobs/<job_id>')
+@compressed_response
+def get_prediction_job(job_id):
+    """任务的状态和进度，成功后附带预测结果（与原同步接口的返回相同）"""
+    job = prediction_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '任务不存在或已过期'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+# API: 预测任务队列
+@app.route('/api/prediction/jobs')
+def prediction_job_stats():
+    return jsonify({'success': True, 'stats': prediction_jobs.stats()})
+
 # API: 导出预测结果
 @app.route('/api/prediction/export', methods=['POST'])
 def export_prediction_results():
+    """按行流式输出预测结果，format 可选 csv（默认）、ndjson、parquet"""
     try:
         data = request.json
-        predictions = data.get('predictions', {})
-        output = io.StringIO()
-
-        if 'single' in predictions:
-            single_pred = predictions['single']
-            output.write('Time,Predicted_Value\n')
-            for pred in single_pred.get('predictions', []):
-                output.write(f"{pred['time']},{pred['value']}\n")
-        elif 'multi' in predictions:
-            multi_pred = predictions['multi']['results']
-            if multi_pred:
-                first_param = list(multi_pred.keys())[0]
-                times = [pred['time'] for pred in multi_pred[first_param]['predictions']]
-
-                output.write('Time,' + ','.join(multi_pred.keys()) + '\n')
-                for i, time in enumerate(times):
-                    row = [time] + [str(multi_pred[param]['predictions'][i]['value']) for param in multi_pred.keys()]
-                    output.write(','.join(row) + '\n')
-
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'water_quality_predictions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
+        fmt = check_format(data.get('format', 'csv'))
+        chunks = export_predictions(fmt, data.get('predictions', {}))
+        return Response(chunks, mimetype=EXPORT_FORMATS[fmt], headers={
+            'Content-Disposition': f'attachment; filename={export_filename("water_quality_predictions", fmt)}'
+        })
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    # 预警规则定义
-# 预警规则定义
-ALERT_RULES = {
-    'temperature': {
-        'critical': {'min': 5, 'max': 35},     # 极端异常
-        'warning': {'min': 10, 'max': 30},     # 明显异常
-        'attention': {'min': 15, 'max': 28}    # 轻微异常
-    },
-    'dissolved_oxygen': {
-        'critical': {'min': 3, 'max': 15},     # 严重缺氧或过饱和
-        'warning': {'min': 4, 'max': 12},      # 明显异常
-        'attention': {'min': 5, 'max': 10}     # 轻微异常
-    },
-    'ph': {
-        'critical': {'min': 6.0, 'max': 9.5},  # 严重偏离
-        'warning': {'min': 6.5, 'max': 9.0},   # 明显偏离
-        'attention': {'min': 7.0, 'max': 8.5}  # 轻微偏离
-    },
-    'turbidity': {
-        'critical': {'max': 20},               # 严重异常：20NTU以上
-        'warning': {'max': 10},                # 警告：10NTU以上
-        'attention': {'max': 5}                # 关注：5NTU以上
-    },
-    'chlorophyll': {
-        'critical': {'max': 10},               # 严重异常：10μg/L以上
-        'warning': {'max': 5},                 # 警告：5μg/L以上
-        'attention': {'max': 3}                # 关注：3μg/L以上
-    }
-}
-
-def get_parameter_name(parameter):
-    """获取参数中文名称"""
-    names = {
-        'temperature': '温度',
-        'dissolved_oxygen': '溶解氧',
-        'ph': 'pH值',
-        'turbidity': '浊度',
-        'chlorophyll': '叶绿素',
-        'salinity': '盐度'
-    }
-    return names.get(parameter, parameter)
-
-def get_parameter_unit(parameter):
-    """获取参数单位"""
-    units = {
-        'temperature': '°C',
-        'dissolved_oxygen': 'mg/L',
-        'ph': '',
-        'turbidity': 'NTU',
-        'chlorophyll': 'μg/L',
-        'salinity': 'PSU'
-    }
-    return units.get(parameter, '')
-
-def check_single_parameter(parameter, value, timestamp):
-    """检查单个参数的预警 - 修复版本"""
-    alerts = []
-
-    # 参数验证
-    if value is None:
-        return alerts
-
-    try:
-        value = float(value)
-    except (ValueError, TypeError):
-        return alerts
-
-    rules = ALERT_RULES.get(parameter, {})
-
-    # 按优先级检查：critical -> warning -> attention
-    # 只返回最高级别的预警
-    highest_alert = None
-    level_priority = {'critical': 3, 'warning': 2, 'attention': 1}
-
-    for level, threshold in rules.items():
-        is_alert = False
-        message = ""
-
-        if 'min' in threshold and value < threshold['min']:
-            is_alert = True
-            message = f"{get_parameter_name(parameter)}过低"
-        elif 'max' in threshold and value > threshold['max']:
-            is_alert = True
-            message = f"{get_parameter_name(parameter)}过高"
-
-        if is_alert:
-            alert = {
-                'parameter': parameter,
-                'current_value': round(value, 2),
-                'level': level,
-                'message': message,
-                'timestamp': timestamp,
-                'status': 'active',
-                'unit': get_parameter_unit(parameter),
-                'threshold': threshold
-            }
-
-            # 只保留最高级别的预警
-            if (highest_alert is None or
-                    level_priority[level] > level_priority[highest_alert['level']]):
-                highest_alert = alert
-
-    if highest_alert:
-        alerts.append(highest_alert)
-
-    return alerts
-
-def get_highest_level_alert(alerts):
-    """获取最高级别的预警"""
-    level_priority = {'critical': 3, 'warning': 2, 'attention': 1}
-
-    highest_alert = None
-    for alert in alerts:
-        if highest_alert is None or level_priority[alert['level']] > level_priority[highest_alert['level']]:
-            highest_alert = alert
-
-    return highest_alert
-
-def get_daily_trend_data():
-    """获取日粒度趋势数据 - 修复版本"""
-    data = WaterQualityData.query.order_by(WaterQualityData.timestamp).all()
-
-    daily_data = {}
-    for record in data:
-        if record.timestamp:
-            date_key = record.timestamp.strftime('%Y-%m-%d')
-            if date_key not in daily_data:
-                daily_data[date_key] = {
-                    'temp': [], 'oxygen': [], 'ph': [],
-                    'turbidity': [], 'chlorophyll': []
-                }
-
-            # 安全地添加数据
-            def safe_append(data_list, value):
-                if value is not None:
-                    try:
-                        data_list.append(float(value))
-                    except (ValueError, TypeError):
-                        pass
-
-            safe_append(daily_data[date_key]['temp'], record.temperature)
-            safe_append(daily_data[date_key]['oxygen'], record.dissolved_oxygen)
-            safe_append(daily_data[date_key]['ph'], record.ph)
-            safe_append(daily_data[date_key]['turbidity'], record.turbidity)
-            safe_append(daily_data[date_key]['chlorophyll'], record.chlorophyll)
-
-    dates = sorted(daily_data.keys())
-
-    # 安全计算平均值
-    def safe_average(data_list):
-        if not data_list:  # 空列表返回None
-            return None
-        return sum(data_list) / len(data_list)
-
-    result = {
-        'dates': dates,
-        'temperature': [safe_average(daily_data[date]['temp']) for date in dates],
-        'dissolved_oxygen': [safe_average(daily_data[date]['oxygen']) for date in dates],
-        'ph': [safe_average(daily_data[date]['ph']) for date in dates],
-        'turbidity': [safe_average(daily_data[date]['turbidity']) for date in dates],
-        'chlorophyll': [safe_average(daily_data[date]['chlorophyll']) for date in dates]
-    }
-
-    return result
 
 @app.route('/alerts')
 @login_required
@@ -1003,65 +1015,109 @@ def alerts_center():
     """预警监控中心"""
     return render_template('alerts.html', title='预警监控中心')
 
+def alert_rules_version():
+    """编译规则对应的规则表指纹，用于规则接口的 ETag"""
+    return rule_matcher.get().fingerprint
+
 @app.route('/api/alerts/rules')
 @login_required
+@compressed_response
+@conditional_response(version_func=alert_rules_version)
 def api_alerts_rules():
     """获取预警规则"""
-    return jsonify({'success': True, 'rules': ALERT_RULES})
+    return jsonify({'success': True, 'rules': rule_matcher.get().level_thresholds})
+
+def alert_analysis_version():
+    """预警分析结果同时取决于数据和规则，ETag 使用数据版本号加规则表指纹"""
+    return request_data_version(), rule_matcher.get().fingerprint
 
 @app.route('/api/alerts/historical')
 @login_required
+@compressed_response
+@conditional_response(version_func=alert_analysis_version)
 def api_alerts_historical():
-    """获取历史预警数据 - 修复版本"""
+    """
+    获取历史预警数据
+
+    granularity 可选 raw/hourly/daily/monthly，默认按日均值分析；支持 start/end 时间范围。
+    """
     try:
-        # 获取日粒度数据
-        daily_trend = get_daily_trend_data()
-
-        alerts = []
-        processed_dates = set()
-
-        for i, date in enumerate(daily_trend['dates']):
-            if date in processed_dates:
-                continue
-
-            daily_alerts = []
-            timestamp = f"{date} 12:00:00"
-
-            # 检查每个参数，跳过None值
-            parameters_to_check = [
-                ('temperature', daily_trend['temperature'][i]),
-                ('dissolved_oxygen', daily_trend['dissolved_oxygen'][i]),
-                ('ph', daily_trend['ph'][i]),
-                ('turbidity', daily_trend['turbidity'][i]),
-                ('chlorophyll', daily_trend['chlorophyll'][i])
-            ]
-
-            for param_name, param_value in parameters_to_check:
-                if param_value is not None:
-                    param_alerts = check_single_parameter(param_name, param_value, timestamp)
-                    daily_alerts.extend(param_alerts)
-
-            if daily_alerts:
-                # 只保留最高级别的预警
-                highest_alert = get_highest_level_alert(daily_alerts)
-                alerts.append(highest_alert)
-                processed_dates.add(date)
+        granularity = request.args.get('granularity', 'daily')
+        if granularity not in ALERT_GRANULARITIES:
+            granularity = 'daily'
+        start, end = parse_time_range()
+
+        labels, columns = load_alert_columns(granularity, start, end)
+        # 每个时间点只保留所有参数中最高级别的预警
+        alerts = evaluate_alerts(labels, columns, granularity)
 
         # 限制返回数量，按时间倒序
         alerts.sort(key=lambda x: x['timestamp'], reverse=True)
         alerts = alerts[:50]
 
+        if len(labels):
+            time_range = f"{alert_label(granularity, labels[0])} 至 {alert_label(granularity, labels[-1])}"
+        else:
+            time_range = '无数据'
+
         return jsonify({
             'success': True,
             'alerts': alerts,
             'total_count': len(alerts),
-            'data_note': '基于日粒度数据的预警分析',
-            'time_range': f"{daily_trend['dates'][0]} 至 {daily_trend['dates'][-1]}" if daily_trend['dates'] else '无数据'
+            'data_note': f'基于{ALERT_GRANULARITY_NAMES[granularity]}数据的预警分析',
+            'time_range': time_range
         })
 
     except Exception as e:
         print(f"预警分析错误: {e}")
         return jsonify({'success': False, 'error': str(e)})
+def alert_events_version():
+    """预警事件表的版本，用于事件接口的 ETag"""
+    return db.session.query(func.max(AlertEvent.id), func.count(AlertEvent.id)).one()
+
+@app.route('/api/alerts/events')
+@login_required
+@compressed_response
+@conditional_response(version_func=alert_events_version)
+def api_alerts_events():
+    """
+    分页查询已持久化的预警事件，按触发时间倒序
+
+    支持 page、per_page（最大200）、level、parameter、start、end 查询参数。
+    """
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+        start, end = parse_time_range()
+
+        query = db.select(AlertEvent, AlertRule).join(AlertRule, AlertEvent.rule_id == AlertRule.id)
+        if request.args.get('level'):
+            query = query.where(AlertRule.severity == request.args['level'])
+        if request.args.get('parameter'):
+            query = query.where(AlertRule.parameter == request.args['parameter'])
+        if start is not None:
+            query = query.where(AlertEvent.triggered_at >= start)
+        if end is not None:
+            query = query.where(AlertEvent.triggered_at < end)
+
+        total = db.session.execute(query.with_only_columns(func.count()).order_by(None)).scalar()
+        rows = db.session.execute(
+            query.order_by(AlertEvent.triggered_at.desc(), AlertEvent.id.desc())
+            .offset((max(page, 1) - 1) * per_page).limit(per_page)
+        ).all()
+
+        return jsonify({
+            'success': True,
+            'alerts': [event_to_dict(event, rule) for event, rule in rows],
+            'page': max(page, 1),
+            'per_page': per_page,
+            'total': total,
+            'pages': (total + per_page - 1) // per_page,
+            'evaluator': alert_evaluator.status()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/health')
 @login_required
 def health_calculator():
@@ -0,0 +1,238 @@
+"""
+性能对比脚本
+
+用法: python benchmark.py [alerts rules online ...]
+不带参数时运行全部对比项。每项先校验新旧实现结果一致，再比较耗时。
+"""
+
+import copy
+import operator
+import random
+import sys
+import time
+
+import numpy as np
+
+from app import app
+from alert_engine import (ALERT_RULES, ALERT_PARAMETERS, get_parameter_name, get_parameter_unit, load_alert_columns,
+                          evaluate_alerts, alert_timestamp)
+from rule_matcher import Rule, CompiledRules, SEVERITY_RANK, rules_from_config
+from timeseries_store import time_series_store
+from forecasting import feature_parameters, prepare_prediction_data, get_recent_features, build_model, update_model
+from online_learning import RecursiveLeastSquares
+
+
+def timed(func, repeat):
+    """运行 repeat 次，返回 (最后一次结果, 最短耗时)"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def check_single_parameter(parameter, value, timestamp):
+    """旧版逐值检查单个参数的预警，保留用于与 alert_engine 对比"""
+    alerts = []
+
+    # 参数验证
+    if value is None:
+        return alerts
+
+    try:
+        value = float(value)
+    except (ValueError, TypeError):
+        return alerts
+
+    rules = ALERT_RULES.get(parameter, {})
+
+    # 按优先级检查：critical -> warning -> attention
+    # 只返回最高级别的预警
+    highest_alert = None
+    level_priority = {'critical': 3, 'warning': 2, 'attention': 1}
+
+    for level, threshold in rules.items():
+        is_alert = False
+        message = ""
+
+        if 'min' in threshold and value < threshold['min']:
+            is_alert = True
+            message = f"{get_parameter_name(parameter)}过低"
+        elif 'max' in threshold and value > threshold['max']:
+            is_alert = True
+            message = f"{get_parameter_name(parameter)}过高"
+
+        if is_alert:
+            alert = {
+                'parameter': parameter,
+                'current_value': round(value, 2),
+                'level': level,
+                'message': message,
+                'timestamp': timestamp,
+                'status': 'active',
+                'unit': get_parameter_unit(parameter),
+                'threshold': threshold
+            }
+
+            # 只保留最高级别的预警
+            if (highest_alert is None or
+                    level_priority[level] > level_priority[highest_alert['level']]):
+                highest_alert = alert
+
+    if highest_alert:
+        alerts.append(highest_alert)
+
+    return alerts
+
+
+def get_highest_level_alert(alerts):
+    """获取最高级别的预警"""
+    level_priority = {'critical': 3, 'warning': 2, 'attention': 1}
+
+    highest_alert = None
+    for alert in alerts:
+        if highest_alert is None or level_priority[alert['level']] > level_priority[highest_alert['level']]:
+            highest_alert = alert
+
+    return highest_alert
+
+
+def legacy_alerts(labels, columns, granularity):
+    """旧版逐行、逐参数调用 check_single_parameter 的实现"""
+    alerts = []
+    for row, label in enumerate(labels):
+        timestamp = alert_timestamp(granularity, label)
+        row_alerts = []
+        for parameter in ALERT_PARAMETERS:
+            value = columns[parameter][row]
+            if value == value:  # 跳过 NaN
+                row_alerts.extend(check_single_parameter(parameter, value, timestamp))
+        if row_alerts:
+            alerts.append(get_highest_level_alert(row_alerts))
+    return alerts
+
+
+def benchmark_alerts(repeat=3):
+    """预警计算：逐值判断 vs 向量化引擎"""
+    # 与旧实现使用同一份规则，结果才可逐条比较
+    compiled = CompiledRules(rules_from_config(ALERT_RULES))
+    for granularity in ['raw', 'hourly', 'daily']:
+        labels, columns = load_alert_columns(granularity, parameters=ALERT_PARAMETERS)
+        legacy, legacy_time = timed(lambda: legacy_alerts(labels, columns, granularity), repeat)
+        vectorized, vectorized_time = timed(
+            lambda: evaluate_alerts(labels, columns, granularity, ALERT_PARAMETERS, compiled), repeat)
+        if legacy != vectorized:
+            raise AssertionError(f'{granularity} 粒度新旧预警结果不一致')
+
+        speedup = legacy_time / vectorized_time if vectorized_time > 0 else float('inf')
+        print(f'[{granularity}] {len(labels)} 行，{len(vectorized)} 条预警: '
+              f'逐值 {legacy_time * 1000:.1f} ms，向量化 {vectorized_time * 1000:.1f} ms，'
+              f'加速 {speedup:.1f} 倍')
+
+
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq}
+
+
+def linear_rank(rules, value):
+    """逐条扫描规则，返回匹配到的最高级别"""
+    best = 0
+    for rule in rules:
+        if OPERATORS[rule.operator](value, rule.threshold):
+            best = max(best, SEVERITY_RANK[rule.severity])
+    return best
+
+
+def benchmark_rules(repeat=3):
+    """规则匹配：逐条扫描 vs 编译后二分查找"""
+    generator = random.Random(42)
+    severities = list(SEVERITY_RANK)
+    values = [generator.uniform(0, 100) for _ in range(2000)]
+    for size in [20, 1000, 5000]:
+        rules = [Rule(i, 'temperature', generator.choice(['<', '<=', '>', '>=']),
+                      round(generator.uniform(0, 100), 1), generator.choice(severities)) for i in range(size)]
+        compiled, compile_time = timed(lambda: CompiledRules(rules), 1)
+
+        expected, linear_time = timed(lambda: [linear_rank(rules, v) for v in values], repeat)
+        scalar, bisect_time = timed(lambda: [compiled.classify('temperature', v) for v in values], repeat)
+        array, array_time = timed(lambda: compiled.classify_array('temperature', np.array(values)), repeat)
+
+        if [SEVERITY_RANK[rule.severity] if rule else 0 for rule in scalar] != expected:
+            raise AssertionError(f'{size} 条规则时二分匹配结果与逐条扫描不一致')
+        if [rule.id if rule else -1 for rule in scalar] != [compiled.rules[i].id if i >= 0 else -1
+                                                           for i in array.tolist()]:
+            raise AssertionError(f'{size} 条规则时整列匹配结果与单值匹配不一致')
+
+        print(f'[{size} 条规则] {len(values)} 个值: 逐条扫描 {linear_time * 1000:.1f} ms，'
+              f'bisect {bisect_time * 1000:.1f} ms，searchsorted {array_time * 1000:.2f} ms，'
+              f'编译 {compile_time * 1000:.1f} ms')
+
+
+def benchmark_online(repeat=3, target_param='pH'):
+    """在线模型：新增数据后全量重新训练 vs 增量更新"""
+    snapshot = time_series_store.get()
+    columns = {param: snapshot.column(field) for param, field in feature_parameters(snapshot).items()}
+    features, feature_time = timed(lambda: prepare_prediction_data(target_param, snapshot.timestamps, columns),
+                                   repeat)
+    full, full_time = timed(lambda: RecursiveLeastSquares().fit(features.X, features.y), repeat)
+    _, forest_time = timed(lambda: build_model('random_forest').fit(features.X, features.y), 1)
+    print(f'{len(features.X)} 个小时样本: 构造特征 {feature_time * 1000:.1f} ms，'
+          f'RLS 全量训练 {full_time * 1000:.1f} ms，随机森林全量训练 {forest_time * 1000:.0f} ms')
+
+    for added in [1, 24, 168]:
+        # 模型已学习到倒数第 added 个样本之前，之后的样本为新增数据
+        base = RecursiveLeastSquares().fit(features.X[:-added], features.y[:-added])
+        meta = {'trained_until': features.hours[-added - 1], 'rows': len(features.X) - added}
+
+        def update():
+            model = copy.deepcopy(base)
+            recent = get_recent_features(snapshot, target_param, meta['trained_until'])
+            update_model(model, {}, meta, recent)
+            return model
+
+        updated, update_time = timed(update, repeat)
+        if not (np.allclose(updated.predict(features.X), full.predict(features.X), rtol=1e-6, atol=1e-8)):
+            raise AssertionError(f'新增 {added} 个样本时增量更新与全量训练的结果不一致')
+
+        total = feature_time + full_time
+        speedup = total / update_time if update_time > 0 else float('inf')
+        print(f'[新增 {added} 小时] 全量（特征 + 训练）{total * 1000:.1f} ms，'
+              f'增量更新 {update_time * 1000:.2f} ms，加速 {speedup:.1f} 倍')
+
+    # 历史越长全量训练越慢，增量更新的耗时不变
+    start, end = snapshot.time_range()
+    for fraction in [0.25, 0.5, 1.0]:
+        history = snapshot.slice(end - (end - start) * fraction)
+        history_columns = {param: history.column(field) for param, field in feature_parameters(history).items()}
+
+        def retrain():
+            history_features = prepare_prediction_data(target_param, history.timestamps, history_columns)
+            return RecursiveLeastSquares().fit(history_features.X, history_features.y)
+
+        _, retrain_time = timed(retrain, repeat)
+        model = RecursiveLeastSquares().fit(features.X[:-24], features.y[:-24])
+        meta = {'trained_until': features.hours[-25], 'rows': len(features.X) - 24}
+        _, update_time = timed(lambda: update_model(copy.deepcopy(model), {}, meta, get_recent_features(
+            history, target_param, meta['trained_until'])), repeat)
+        print(f'[{len(history)} 条记录的历史] 全量重新训练 {retrain_time * 1000:.1f} ms，'
+              f'增量更新 24 小时 {update_time * 1000:.2f} ms')
+
+
+BENCHMARKS = {
+    'alerts': benchmark_alerts,
+    'rules': benchmark_rules,
+    'online': benchmark_online
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    with app.app_context():
+        for name in names:
+            if name not in BENCHMARKS:
+                print(f'未知的对比项: {name}，可选: {", ".join(BENCHMARKS)}')
+                continue
+            print(f'== {BENCHMARKS[name].__doc__}')
+            BENCHMARKS[name]()
@@ -0,0 +1,208 @@
+"""
+接口响应缓存与条件请求
+
+按 接口 + 查询参数 缓存 JSON 响应体，容量有上限（LRU 淘汰）并带过期时间。
+数据版本号保存在 system_settings 表中，每次导入在写入数据的同一事务中递增；
+缓存发现版本号变化后整体失效，多个进程之间同样有效。
+同一版本号还用于生成 ETag，客户端带 If-None-Match 请求时直接返回 304。
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+
+from flask import request, current_app, g
+from sqlalchemy import select, update, insert, cast, Integer
+
+from models import db, SystemSetting
+from payloads import negotiate_encoding
+
+# 数据版本号在 system_settings 中的键
+DATA_VERSION_KEY = 'data_version'
+
+# 默认最多缓存的响应数
+DEFAULT_MAX_ENTRIES = 256
+
+# 默认缓存有效期（秒）
+DEFAULT_TTL = 600
+
+
+def bump_data_version(conn):
+    """
+    数据版本号加一
+
+    需要在写入数据的同一事务中调用，数据提交的同时版本号生效。
+    """
+    table = SystemSetting.__table__
+    result = conn.execute(
+        update(table)
+        .where(table.c.key == DATA_VERSION_KEY)
+        .values(value=cast(cast(table.c.value, Integer) + 1, db.Text), updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(
+            key=DATA_VERSION_KEY, value='1', value_type='integer', category='system',
+            description='数据版本号，每次导入数据后递增', updated_at=datetime.utcnow()
+        ))
+
+
+def get_data_version():
+    """读取当前数据版本号，尚未导入过数据时为 0"""
+    table = SystemSetting.__table__
+    with db.engine.connect() as conn:
+        value = conn.execute(select(table.c.value).where(table.c.key == DATA_VERSION_KEY)).scalar()
+    return int(value) if value is not None else 0
+
+
+def request_data_version():
+    """当前请求使用的数据版本号，同一请求内只查询一次"""
+    if 'data_version' not in g:
+        g.data_version = get_data_version()
+    return g.data_version
+
+
+class ResponseCache:
+    """线程安全的 LRU + TTL 响应缓存，条目随数据版本号整体失效"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_version(self, version):
+        """
+        出现更新的版本号时清空全部条目，需持有锁
+
+        返回 version 是否为当前版本，旧版本的读写都应忽略。
+        """
+        if self._version is None or version > self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+        return version == self._version
+
+    def get(self, key, version):
+        """命中时返回缓存值，否则返回 None"""
+        with self._lock:
+            entry = self._entries.get(key) if self._sync_version(version) else None
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, version):
+        """写入缓存；计算期间版本号已变化时不写入"""
+        with self._lock:
+            if not self._sync_version(version):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空全部条目"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'data_version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+# 全局共享的响应缓存
+response_cache = ResponseCache()
+
+
+def cache_key():
+    """当前请求的缓存键：接口名 + 排序后的查询参数"""
+    args = tuple(sorted((key, tuple(values)) for key, values in request.args.lists()))
+    return request.endpoint, args
+
+
+def cached_response(view):
+    """
+    缓存接口返回的 JSON 响应
+
+    只缓存状态码为 200 且 success 不为 False 的响应，出错的结果不会被缓存。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = request_data_version()
+        key = cache_key()
+        cached = response_cache.get(key, version)
+        if cached is not None:
+            body, mimetype = cached
+            return current_app.response_class(body, mimetype=mimetype)
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and response.is_json:
+            payload = response.get_json(silent=True)
+            if not (isinstance(payload, dict) and payload.get('success') is False):
+                response_cache.set(key, (response.get_data(), response.mimetype), version)
+        return response
+    return wrapper
+
+
+def make_etag(version):
+    """由接口、查询参数、数据版本和协商的压缩方式生成强 ETag"""
+    endpoint, args = cache_key()
+    key = (endpoint, args, version, negotiate_encoding())
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:24]
+
+
+def conditional_response(view=None, version_func=None):
+    """
+    为 GET 接口加上 ETag 并处理 If-None-Match
+
+    ETag 由数据版本号决定，版本未变化时直接返回 304，不执行查询也不序列化。
+    version_func 可替换版本号来源（如时序存储快照的指纹），默认使用数据版本号。
+    响应带 Cache-Control: no-cache，浏览器每次都会带上 ETag 重新验证。
+    """
+    if view is None:
+        return lambda func: conditional_response(func, version_func)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = version_func() if version_func is not None else request_data_version()
+        etag = make_etag(version)
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or not response.is_json:
+                return response
+            payload = response.get_json(silent=True)
+            if isinstance(payload, dict) and payload.get('success') is False:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
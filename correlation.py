@@ -0,0 +1,164 @@
+"""
+参数相关性计算
+
+采用 pairwise-complete：每对参数只使用两者都有值的记录，
+所有参数对由几次矩阵乘法一次得到，不截断数据、也不逐对循环。
+- 不带滞后且时间范围按天对齐时，直接汇总按日维护的协矩累加量，
+  请求的计算量与参数个数有关，与历史长度无关
+- 其余情况在时序存储的列数据上计算；lag 不为 0 时先按小时取均值对齐，
+  计算 x(t) 与 y(t + lag) 的互相关
+"""
+
+import warnings
+
+import numpy as np
+from sqlalchemy import select, func
+
+from models import db, WaterQualityRollup, WaterQualityComoment
+from rollups import bucket_label
+from timeseries_store import time_series_store
+
+# 参数对的有效样本少于该数量时相关系数记为缺失
+MIN_PAIR_COUNT = 10
+
+# 滞后的最大小时数
+MAX_LAG_HOURS = 24 * 30
+
+HOUR_NS = 3600 * 10 ** 9
+
+
+def correlation_from_moments(count, sum_x, sum_y, sum_xx, sum_yy, sum_xy):
+    """由样本数与各阶和计算相关系数，样本不足或方差为 0 时为 NaN"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_y / count
+        var_x = sum_xx - sum_x * sum_x / count
+        var_y = sum_yy - sum_y * sum_y / count
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(count < MIN_PAIR_COUNT) | ~(var_x > 0) | ~(var_y > 0)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def cross_correlation(x, y):
+    """
+    x（n×p）各列与 y（n×q）各列两两的 pairwise-complete 相关系数
+
+    返回 (p×q 相关系数矩阵, p×q 有效样本数矩阵)。
+    """
+    valid_x = ~np.isnan(x)
+    valid_y = ~np.isnan(y)
+    # 先减去列均值再累加，减小大数相减带来的精度损失
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        x0 = np.where(valid_x, x - np.nanmean(x, axis=0), 0.0)
+        y0 = np.where(valid_y, y - np.nanmean(y, axis=0), 0.0)
+    mask_x = valid_x.astype('float64')
+    mask_y = valid_y.astype('float64')
+
+    count = mask_x.T @ mask_y
+    corr = correlation_from_moments(count, x0.T @ mask_y, mask_x.T @ y0,
+                                    (x0 * x0).T @ mask_y, mask_x.T @ (y0 * y0), x0.T @ y0)
+    return corr, count
+
+
+def hourly_grid(snapshot, fields):
+    """按小时取均值并排成连续的小时网格，没有数据的小时为 NaN"""
+    hours = snapshot.timestamps // HOUR_NS
+    first = hours[0]
+    positions = hours - first
+    size = int(positions[-1]) + 1
+    grid = np.full((size, len(fields)), np.nan)
+    for column, field in enumerate(fields):
+        values = snapshot.column(field)
+        valid = ~np.isnan(values)
+        counts = np.bincount(positions[valid], minlength=size)
+        sums = np.bincount(positions[valid], weights=values[valid], minlength=size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            grid[:, column] = np.where(counts > 0, sums / counts, np.nan)
+    return grid
+
+
+def snapshot_correlation(fields, start=None, end=None, lag=0):
+    """在时序存储的列数据上计算相关系数矩阵"""
+    snapshot = time_series_store.get()
+    snapshot = snapshot.slice_half_open(start, end)
+    if snapshot.empty:
+        size = len(fields)
+        return np.full((size, size), np.nan), np.zeros((size, size))
+
+    if lag == 0:
+        matrix = np.column_stack([snapshot.column(field) for field in fields])
+        return cross_correlation(matrix, matrix)
+
+    grid = hourly_grid(snapshot, fields)
+    steps = abs(lag)
+    if steps >= len(grid):
+        size = len(fields)
+        return np.full((size, size), np.nan), np.zeros((size, size))
+    if lag > 0:
+        return cross_correlation(grid[:-steps], grid[steps:])
+    return cross_correlation(grid[steps:], grid[:-steps])
+
+
+def comoment_correlation(fields, start=None, end=None):
+    """汇总 [start, end) 内按日维护的协矩累加量，计算相关系数矩阵"""
+    comoment = WaterQualityComoment.__table__
+    conditions = [comoment.c.parameter_x.in_(fields), comoment.c.parameter_y.in_(fields)]
+    if start is not None:
+        conditions.append(comoment.c.bucket >= bucket_label('daily', start))
+    if end is not None:
+        conditions.append(comoment.c.bucket < bucket_label('daily', end))
+
+    rows = db.session.execute(
+        select(comoment.c.parameter_x, comoment.c.parameter_y, func.sum(comoment.c.pair_count),
+               func.sum(comoment.c.sum_x), func.sum(comoment.c.sum_y), func.sum(comoment.c.sum_xx),
+               func.sum(comoment.c.sum_yy), func.sum(comoment.c.sum_xy))
+        .where(*conditions)
+        .group_by(comoment.c.parameter_x, comoment.c.parameter_y)
+    ).all()
+
+    size = len(fields)
+    positions = {field: index for index, field in enumerate(fields)}
+    moments = np.zeros((6, size, size))
+    for row in rows:
+        i, j = positions[row[0]], positions[row[1]]
+        count, sum_x, sum_y, sum_xx, sum_yy, sum_xy = row[2:]
+        moments[:, i, j] = (count, sum_x, sum_y, sum_xx, sum_yy, sum_xy)
+        moments[:, j, i] = (count, sum_y, sum_x, sum_yy, sum_xx, sum_xy)
+
+    # 对角线：参数与自身，样本数取日汇总的有效值个数
+    rollup = WaterQualityRollup.__table__
+    diagonal = [rollup.c.granularity == 'daily', rollup.c.parameter.in_(fields)]
+    if start is not None:
+        diagonal.append(rollup.c.bucket >= bucket_label('daily', start))
+    if end is not None:
+        diagonal.append(rollup.c.bucket < bucket_label('daily', end))
+    for parameter, count, total, total_sq in db.session.execute(
+        select(rollup.c.parameter, func.sum(rollup.c.value_count), func.sum(rollup.c.value_sum),
+               func.sum(rollup.c.value_sum_sq))
+        .where(*diagonal)
+        .group_by(rollup.c.parameter)
+    ):
+        i = positions[parameter]
+        moments[:, i, i] = (count, total, total, total_sq, total_sq, total_sq)
+
+    count = moments[0]
+    return correlation_from_moments(*moments), count
+
+
+def is_day_aligned(value):
+    return value is None or (value.hour, value.minute, value.second, value.microsecond) == (0, 0, 0, 0)
+
+
+def correlation_matrix(fields, start=None, end=None, lag=0):
+    """
+    计算参数两两的相关系数，start 闭区间、end 开区间，lag 为小时数
+
+    返回 (相关系数矩阵, 有效样本数矩阵, 数据来源)，来源为 'comoments' 或 'snapshot'。
+    """
+    if abs(lag) > MAX_LAG_HOURS:
+        raise ValueError(f'滞后不能超过 {MAX_LAG_HOURS} 小时')
+    if lag == 0 and is_day_aligned(start) and is_day_aligned(end):
+        corr, count = comoment_correlation(fields, start, end)
+        return corr, count, 'comoments'
+    corr, count = snapshot_correlation(fields, start, end, lag)
+    return corr, count, 'snapshot'
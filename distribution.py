@@ -0,0 +1,102 @@
+"""
+参数分布统计
+
+所有参数组成一个二维数组，整体排序一次（NaN 排在每列末尾），之后：
+- 最小、最大值直接取排序后每列的首个、最后一个有效值
+- 分位数在排序结果上按下标线性插值，与 np.percentile 的默认方法一致
+- 等宽直方图用 searchsorted 在排序结果上定位各分箱边界
+均值和标准差按列整体计算，不逐个参数、逐个值循环。
+"""
+
+import numpy as np
+
+# 默认分位数（百分比）
+DEFAULT_PERCENTILES = [5, 25, 50, 75, 95]
+
+# 默认与最大的直方图分箱数
+DEFAULT_BINS = 20
+MAX_BINS = 200
+
+
+def parse_percentiles(value):
+    """解析逗号分隔的百分位，例如 '5,50,95'"""
+    if not value:
+        return list(DEFAULT_PERCENTILES)
+    try:
+        percentiles = [float(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValueError(f'无效的百分位: {value}')
+    if not percentiles or any(p < 0 or p > 100 for p in percentiles):
+        raise ValueError('百分位必须在 0 到 100 之间')
+    return percentiles
+
+
+def percentile_label(percentile):
+    """百分位的键名，如 p5、p99.9"""
+    return f'p{percentile:g}'
+
+
+def describe(matrix, percentiles=DEFAULT_PERCENTILES, bins=DEFAULT_BINS):
+    """
+    计算 n×p 数组每一列的分布统计，NaN 视为缺失
+
+    返回每列一个字典：count、min、max、mean、std（总体标准差）、percentiles、histogram，
+    没有有效值的列除 count 外均为 None。
+    """
+    matrix = np.asarray(matrix, dtype='float64')
+    rows, size = matrix.shape
+    valid = ~np.isnan(matrix)
+    counts = valid.sum(axis=0)
+    has_values = counts > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(valid, matrix, 0.0).sum(axis=0) / counts
+        stds = np.sqrt((np.where(valid, matrix - means, 0.0) ** 2).sum(axis=0) / counts)
+
+    ordered = np.sort(matrix, axis=0)
+    columns = np.arange(size)
+    last = np.maximum(counts - 1, 0)
+    minimums = ordered[0] if rows else np.full(size, np.nan)
+    maximums = ordered[last, columns] if rows else np.full(size, np.nan)
+
+    # 分位数：在每列前 count 个有效值上线性插值
+    quantiles = np.asarray(percentiles, dtype='float64')[:, None] / 100.0
+    positions = quantiles * last
+    lower = np.floor(positions).astype('int64')
+    upper = np.ceil(positions).astype('int64')
+    if rows:
+        low_values = ordered[lower, columns]
+        high_values = ordered[upper, columns]
+        percentile_values = low_values + (high_values - low_values) * (positions - lower)
+    else:
+        percentile_values = np.full((len(percentiles), size), np.nan)
+
+    results = []
+    for column in range(size):
+        count = int(counts[column])
+        if not has_values[column]:
+            results.append({'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None,
+                            'percentiles': {percentile_label(p): None for p in percentiles},
+                            'histogram': {'edges': [], 'counts': []}})
+            continue
+
+        minimum, maximum = float(minimums[column]), float(maximums[column])
+        if maximum > minimum:
+            edges = np.linspace(minimum, maximum, bins + 1)
+        else:
+            edges = np.array([minimum - 0.5, maximum + 0.5])
+        # 各分箱左闭右开，最后一个分箱包含最大值
+        bounds = np.searchsorted(ordered[:count, column], edges, side='left')
+        bounds[-1] = count
+
+        results.append({
+            'count': count,
+            'min': minimum,
+            'max': maximum,
+            'mean': float(means[column]),
+            'std': float(stds[column]),
+            'percentiles': {percentile_label(p): float(value)
+                            for p, value in zip(percentiles, percentile_values[:, column])},
+            'histogram': {'edges': edges.tolist(), 'counts': np.diff(bounds).tolist()}
+        })
+    return results
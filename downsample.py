@@ -0,0 +1,94 @@
+"""
+时序数据降采样
+
+把任意长度的序列缩减到目标点数，供长时间范围的图表使用：
+- lttb：Largest-Triangle-Three-Buckets，保留曲线形状，逐桶选面积最大的点
+- minmax：每个桶保留最小值和最大值，不会漏掉尖峰，适合查看预警
+缺失值（NaN）先剔除，返回原数组中的下标，调用方据此取出时间和数值。
+"""
+
+import numpy as np
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+# 默认与最大的目标点数
+DEFAULT_POINTS = 1000
+MAX_POINTS = 10000
+
+# 目标点数的下限，LTTB 至少需要首尾两点加一个桶
+MIN_POINTS = 3
+
+
+def lttb_indices(x, y, points):
+    """
+    LTTB 降采样，x、y 为不含 NaN 的 float64 数组，返回选中点的下标
+
+    首尾两点固定保留，中间的点按数量均分为 points - 2 个桶。
+    下一个桶的均值用 reduceat 一次算出，每个桶内的三角形面积整体计算。
+    """
+    size = len(x)
+    if points >= size:
+        return np.arange(size)
+
+    edges = np.floor(np.linspace(1, size - 1, points - 1)).astype('int64')
+    means_x = np.add.reduceat(x[1:size - 1], edges[:-1] - 1) / np.diff(edges)
+    means_y = np.add.reduceat(y[1:size - 1], edges[:-1] - 1) / np.diff(edges)
+    # 最后一个桶的"下一个桶"是末尾的点
+    means_x = np.append(means_x[1:], x[-1])
+    means_y = np.append(means_y[1:], y[-1])
+
+    selected = np.empty(points, dtype='int64')
+    selected[0] = 0
+    selected[-1] = size - 1
+    anchor = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        ax, ay = x[anchor], y[anchor]
+        areas = np.abs((ax - means_x[bucket]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (means_y[bucket] - ay))
+        anchor = lo + int(areas.argmax())
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def minmax_indices(x, y, points):
+    """
+    每个桶保留最小值和最大值的下标，按时间顺序返回
+
+    桶按点数均分，首尾两点固定保留，最多返回 points 个点。
+    """
+    size = len(y)
+    if points >= size:
+        return np.arange(size)
+
+    buckets = max((points - 2) // 2, 1)
+    ids = np.arange(size) * buckets // size
+    # 先按桶、再按值排序，每个桶的第一个、最后一个即最小、最大值
+    order = np.lexsort((y, ids))
+    starts = np.searchsorted(ids, np.arange(buckets))
+    ends = np.append(starts[1:], size)
+    selected = np.concatenate(([0, size - 1], order[starts], order[ends - 1]))
+    return np.unique(selected)
+
+
+def downsample_indices(timestamps, values, points=DEFAULT_POINTS, method='lttb'):
+    """
+    对一条序列降采样，返回保留点在原数组中的下标（已按时间排序）
+
+    timestamps 为 int64 纳秒或 datetime64 数组，values 中的 NaN 不会被选中。
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f'不支持的降采样方法: {method}，可选: {", ".join(DOWNSAMPLE_METHODS)}')
+    points = min(max(int(points), MIN_POINTS), MAX_POINTS)
+
+    values = np.asarray(values, dtype='float64')
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) <= points:
+        return valid
+
+    # 以秒为单位、相对第一个点计时，避免纳秒时间戳转 float64 丢失精度
+    times = np.asarray(timestamps).view('int64')[valid]
+    x = (times - times[0]) / 1e9
+    y = values[valid]
+    if method == 'lttb':
+        return valid[lttb_indices(x, y, points)]
+    return valid[minmax_indices(x, y, points)]
@@ -0,0 +1,236 @@
+"""
+流式导出
+
+原始监测数据按 (timestamp, id) 键集分批读取，每批编码后立即输出，
+内存中最多只有一批数据。支持 CSV、NDJSON，安装 pyarrow 时支持 Parquet
+（每批写为一个行组）。
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer
+
+from models import db, WaterQualityData
+from records import records_query
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖
+    pa = None
+    pq = None
+
+# 导出格式与 MIME 类型
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# 每批读取、编码的行数
+DEFAULT_EXPORT_BATCH = 2000
+
+
+def check_format(fmt):
+    """校验导出格式，不支持时抛出 ValueError"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'不支持的导出格式: {fmt}，可选: {", ".join(EXPORT_FORMATS)}')
+    if fmt == 'parquet' and pa is None:
+        raise ValueError('导出 Parquet 需要安装 pyarrow')
+    return fmt
+
+
+def export_filename(prefix, fmt):
+    """带时间戳的下载文件名"""
+    return f'{prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{fmt}'
+
+
+def iter_record_batches(fields, start=None, end=None, batch_size=DEFAULT_EXPORT_BATCH):
+    """
+    按 (timestamp, id) 顺序分批读取记录
+
+    每批单独查询、读完即释放连接，导出期间不会长时间占用 SQLite 的读锁而阻塞导入。
+    """
+    after = None
+    while True:
+        query = records_query(fields, start, end, after).limit(batch_size)
+        with db.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1].timestamp, rows[-1].id)
+
+
+def csv_value(value):
+    """CSV 单元格：空值为空串，时间用 'YYYY-MM-DD HH:MM:SS'"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    return value
+
+
+def csv_chunks(columns, batches):
+    """逐批编码 CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_chunks(columns, batches):
+    """逐批编码 NDJSON，每行一个 JSON 对象"""
+    for batch in batches:
+        lines = [json.dumps(dict(zip(columns, map(json_value, row))), ensure_ascii=False) for row in batch]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class ChunkSink(io.RawIOBase):
+    """只追加的输出流，ParquetWriter 写入的字节可随时取走"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def pop(self):
+        """取走已写入的字节"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_chunks(columns, batches, schema=None):
+    """逐批编码 Parquet，每批一个行组；schema 为空时按第一批推断"""
+    sink = ChunkSink()
+    writer = None
+    for batch in batches:
+        arrays = [list(column) for column in zip(*batch)] or [[] for _ in columns]
+        if schema is None:
+            schema = pa.Table.from_arrays([pa.array(values) for values in arrays], names=columns).schema
+        if writer is None:
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(arrays, schema)], schema=schema
+        ))
+        yield sink.pop()
+    if writer is None:
+        if schema is None:
+            schema = pa.schema([(column, pa.string()) for column in columns])
+        writer = pq.ParquetWriter(sink, schema)
+    writer.close()
+    yield sink.pop()
+
+
+def record_schema(columns):
+    """按数据库列类型生成 Parquet schema"""
+    table = WaterQualityData.__table__
+    fields = []
+    for column in columns:
+        column_type = table.c[column].type
+        if isinstance(column_type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column_type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column_type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column_type, DateTime):
+            arrow_type = pa.timestamp('us')
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields)
+
+
+def encode_batches(fmt, columns, batches, schema=None):
+    """将按批产生的行元组编码为指定格式的字节块"""
+    if fmt == 'csv':
+        return csv_chunks(columns, batches)
+    if fmt == 'ndjson':
+        return ndjson_chunks(columns, batches)
+    return parquet_chunks(columns, batches, schema)
+
+
+def export_records(fmt, fields, start=None, end=None, batch_size=DEFAULT_EXPORT_BATCH):
+    """导出原始监测数据，返回字节块生成器"""
+    check_format(fmt)
+    columns = ['id', 'timestamp'] + fields
+    schema = record_schema(columns) if fmt == 'parquet' else None
+    return encode_batches(fmt, columns, iter_record_batches(fields, start, end, batch_size), schema)
+
+
+def prediction_points(predictions):
+    """
+    预测点序列，返回 (时间, 预测值) 迭代器
+
+    兼容逐点的 [{'time', 'value'}] 和按列的 {'time': [...], 'value': [...]} 两种结构。
+    """
+    if isinstance(predictions, dict):
+        return zip(predictions.get('time', []), predictions.get('value', []))
+    return ((pred['time'], pred['value']) for pred in predictions)
+
+
+def prediction_table(predictions):
+    """
+    将前端提交的预测结果整理为 (列名, 行生成器)
+
+    单参数预测为 Time, Predicted_Value 两列，多参数预测每个参数一列。
+    预测结果可以是默认的逐点结构，也可以是 format=columnar 的按列结构。
+    """
+    if 'single' in predictions:
+        return ['Time', 'Predicted_Value'], prediction_points(predictions['single'].get('predictions', []))
+
+    results = predictions.get('multi', {}).get('results') or {}
+    if not results:
+        return ['Time'], iter(())
+    parameters = list(results.keys())
+    series = [prediction_points(results[param]['predictions']) for param in parameters]
+    rows = ((points[0][0], *[value for _, value in points]) for points in zip(*series))
+    return ['Time'] + parameters, rows
+
+
+def batched(rows, batch_size):
+    """将行迭代器切分为列表批次"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_predictions(fmt, predictions, batch_size=DEFAULT_EXPORT_BATCH):
+    """导出预测结果，返回字节块生成器"""
+    check_format(fmt)
+    columns, rows = prediction_table(predictions)
+    return encode_batches(fmt, columns, batched(rows, batch_size))
@@ -0,0 +1,192 @@
+"""
+预测模型的特征构造
+
+各参数先按小时取均值排成连续的小时网格（没有数据的小时为 NaN），
+再对整列做 shift / rolling 得到特征，不逐行循环：
+- 目标参数前 1、2、3、6、12、24 小时的值
+- 目标参数截至上一小时的 6、24 小时滑动均值和标准差
+- 小时、星期
+- 其他参数截至上一小时的 24 小时滑动均值（缺失时沿用之前的值，完全没有数据的参数不参与）
+外推时逐小时递归：每一步用已有数据和之前各步的预测值计算同样的特征。
+特征按时序存储快照的指纹缓存，数据不变时不重复计算。
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+# 目标参数的滞后小时数
+FEATURE_LAGS = (1, 2, 3, 6, 12, 24)
+
+# 目标参数滑动统计的窗口（小时）
+ROLLING_WINDOWS = (6, 24)
+
+# 其他参数滑动均值的窗口（小时）
+EXOGENOUS_WINDOW = 24
+
+# 递归外推需要保留的历史小时数
+HISTORY_HOURS = max(max(FEATURE_LAGS), max(ROLLING_WINDOWS))
+
+# 少于该数量的训练样本时不训练
+MIN_TRAINING_ROWS = 10
+
+# 缓存的特征集数量
+DEFAULT_FEATURE_ENTRIES = 32
+
+HOUR_NS = 3600 * 10 ** 9
+
+FeatureSet = namedtuple('FeatureSet', ['target_parameter', 'X', 'y', 'hours', 'feature_names', 'state'])
+
+
+def hourly_frame(timestamps, columns):
+    """
+    按小时取均值，返回以连续小时为索引的 DataFrame
+
+    timestamps 为 int64 纳秒时间戳，columns 为 {列名: 等长数组}。
+    """
+    hours = timestamps // HOUR_NS
+    first = hours[0]
+    positions = hours - first
+    size = int(positions[-1]) + 1
+    data = {}
+    for name, values in columns.items():
+        valid = ~np.isnan(values)
+        counts = np.bincount(positions[valid], minlength=size)
+        sums = np.bincount(positions[valid], weights=values[valid], minlength=size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            data[name] = np.where(counts > 0, sums / counts, np.nan)
+    index = pd.DatetimeIndex((first + np.arange(size)) * HOUR_NS)
+    return pd.DataFrame(data, index=index)
+
+
+def target_feature_names(target_param):
+    names = [f'{target_param}_lag_{lag}' for lag in FEATURE_LAGS]
+    for window in ROLLING_WINDOWS:
+        names += [f'{target_param}_mean_{window}', f'{target_param}_std_{window}']
+    return names + ['hour', 'day_of_week']
+
+
+def build_features(hourly, target_param):
+    """在小时网格上计算全部特征，返回 (特征 DataFrame, 目标值 Series)"""
+    target = hourly[target_param]
+    features = {f'{target_param}_lag_{lag}': target.shift(lag) for lag in FEATURE_LAGS}
+    previous = target.shift(1)
+    for window in ROLLING_WINDOWS:
+        rolling = previous.rolling(window, min_periods=1)
+        features[f'{target_param}_mean_{window}'] = rolling.mean()
+        features[f'{target_param}_std_{window}'] = previous.rolling(window, min_periods=2).std()
+    features['hour'] = hourly.index.hour
+    features['day_of_week'] = hourly.index.dayofweek
+
+    # 其他参数一起做一次滑动均值；完全没有数据的参数不作为特征，否则每一小时都会因缺失值被丢弃
+    others = hourly.drop(columns=[target_param])
+    others = others.loc[:, others.notna().any().to_numpy()]
+    exogenous = others.shift(1).rolling(EXOGENOUS_WINDOW, min_periods=1).mean().ffill()
+    exogenous.columns = [f'{name}_mean_{EXOGENOUS_WINDOW}' for name in exogenous.columns]
+    return pd.concat([pd.DataFrame(features, index=hourly.index), exogenous], axis=1), target
+
+
+def build_feature_set(hourly, target_param, min_rows=MIN_TRAINING_ROWS):
+    """
+    构造训练集和递归外推的初始状态
+
+    只使用目标值和全部特征都有值的小时，样本少于 min_rows 或目标参数没有数据时返回 None。
+    """
+    features, target = build_features(hourly, target_param)
+    valid = target.notna().to_numpy() & features.notna().all(axis=1).to_numpy()
+    if np.count_nonzero(valid) < min_rows or not target.notna().any():
+        return None
+
+    # 外推从目标参数最后一个有值的小时开始
+    last = int(np.flatnonzero(target.notna().to_numpy())[-1])
+    history = target.iloc[:last + 1].ffill().to_numpy()[-HISTORY_HOURS:]
+    exogenous = [name for name in features.columns if name not in target_feature_names(target_param)]
+    state = {
+        'last_hour': hourly.index[last],
+        'history': history,
+        # 其他参数在外推期间保持最后的滑动均值
+        'exogenous': features[exogenous].iloc[last].to_numpy()
+    }
+    return FeatureSet(target_param, features.to_numpy()[valid], target.to_numpy()[valid],
+                      hourly.index[valid], list(features.columns), state)
+
+
+def step_features(history, hour, exogenous):
+    """递归外推中一个小时的特征，顺序与 build_features 相同"""
+    row = [history[-lag] for lag in FEATURE_LAGS]
+    for window in ROLLING_WINDOWS:
+        recent = history[-window:]
+        row += [np.nanmean(recent), np.nanstd(recent, ddof=1) if len(recent) > 1 else np.nan]
+    row += [hour.hour, hour.dayofweek]
+    return np.concatenate([row, exogenous])
+
+
+def recursive_forecast(model, state, steps):
+    """从最后一个小时起逐小时预测 steps 步，每一步的预测值作为之后各步的滞后特征"""
+    history = list(state['history'])
+    predictions = np.empty(steps)
+    for step in range(steps):
+        hour = state['last_hour'] + pd.Timedelta(hours=step + 1)
+        features = step_features(np.asarray(history), hour, state['exogenous'])
+        predictions[step] = model.predict(features[None, :])[0]
+        history.append(predictions[step])
+    return predictions
+
+
+class FeatureCache:
+    """按 (快照指纹, 参数列表) 缓存小时网格，按 (快照指纹, 目标参数) 缓存特征集"""
+
+    def __init__(self, max_entries=DEFAULT_FEATURE_ENTRIES):
+        self.max_entries = max_entries
+        self._hourly = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, snapshot, target_param, parameters):
+        """
+        获取目标参数的特征集
+
+        parameters 为 {参数名: 时序存储字段}，全部作为小时网格的列。
+        """
+        key = (snapshot.fingerprint, target_param, tuple(parameters))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        hourly = self.hourly(snapshot, parameters)
+        feature_set = None if hourly is None else build_feature_set(hourly, target_param)
+        with self._lock:
+            self._entries[key] = feature_set
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return feature_set
+
+    def hourly(self, snapshot, parameters):
+        """快照的小时网格，只保留最近一个快照的结果"""
+        key = (snapshot.fingerprint, tuple(parameters))
+        with self._lock:
+            if self._hourly is not None and self._hourly[0] == key:
+                return self._hourly[1]
+        if snapshot.empty:
+            return None
+        hourly = hourly_frame(snapshot.timestamps,
+                              {name: snapshot.column(field) for name, field in parameters.items()})
+        with self._lock:
+            self._hourly = (key, hourly)
+        return hourly
+
+    def clear(self):
+        with self._lock:
+            self._hourly = None
+            self._entries.clear()
+
+
+# 全局共享的特征缓存
+feature_cache = FeatureCache()
@@ -0,0 +1,263 @@
+"""
+预测模型的数据准备、训练与外推
+
+特征由 features 模块在小时网格上构造（目标参数的滞后值、滑动统计、时间及其他参数的滑动均值），
+训练线性回归、随机森林或在线学习的 RLS 模型，再逐小时递归外推。
+训练只使用最近 window_days 天、每隔 stride 小时取一个的样本，训练耗时有上限；
+评估按时间顺序做滚动起点回测，不会用未来的数据训练。
+训练好的模型由 model_registry 缓存复用，在线模型在数据更新后只用新增的小时增量学习。
+"""
+
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
+
+from models import SOURCE_COLUMN_MAP
+from features import (build_feature_set, hourly_frame, recursive_forecast, feature_cache, HISTORY_HOURS,
+                      EXOGENOUS_WINDOW)
+from online_learning import RecursiveLeastSquares
+
+# 可预测的参数（源数据列名）及显示信息
+PREDICTION_PARAMETERS = {
+    'Dissolved Oxygen': {'name': '溶解氧', 'unit': 'mg/L'},
+    'Temperature': {'name': '温度', 'unit': '°C'},
+    'pH': {'name': 'pH值', 'unit': ''},
+    'Salinity': {'name': '盐度', 'unit': 'PSU'},
+    'Chlorophyll': {'name': '叶绿素', 'unit': 'μg/L'},
+    'Turbidity': {'name': '浊度', 'unit': 'NTU'},
+    'Specific Conductance': {'name': '电导率', 'unit': 'mS/cm'},
+    'Average Water Speed': {'name': '平均水流速度', 'unit': 'm/s'},
+    'Average Water Direction': {'name': '平均水流方向', 'unit': '°'}
+}
+
+# 支持的模型，其他取值按线性回归处理
+MODEL_TYPES = ('linear', 'random_forest', 'online')
+
+# 回测使用的样本比例（最后这部分按时间分成若干段）
+TEST_FRACTION = 0.2
+
+# 训练窗口（天），0 表示使用全部历史
+DEFAULT_WINDOW_DAYS = 180
+MAX_WINDOW_DAYS = 3650
+
+# 样本间隔（小时）
+DEFAULT_STRIDE = 1
+MAX_STRIDE = 24
+
+# 滚动起点回测的段数，1 即按时间顺序留出最后 20%
+DEFAULT_BACKTEST_FOLDS = 1
+MAX_BACKTEST_FOLDS = 10
+
+TrainingOptions = namedtuple('TrainingOptions', ['window_days', 'stride', 'backtest_folds'])
+
+DEFAULT_TRAINING_OPTIONS = TrainingOptions(DEFAULT_WINDOW_DAYS, DEFAULT_STRIDE, DEFAULT_BACKTEST_FOLDS)
+
+
+def normalize_model_type(model_type):
+    return model_type if model_type in MODEL_TYPES else 'linear'
+
+
+def get_prediction_frame(snapshot, target_param):
+    """从时序存储取出单个预测参数的数据，列名沿用源数据列名"""
+    field = SOURCE_COLUMN_MAP.get(target_param)
+    if target_param not in PREDICTION_PARAMETERS or field not in snapshot.columns:
+        return None
+    return snapshot.to_frame([field]).rename(columns={field: target_param})
+
+
+def feature_parameters(snapshot):
+    """参与构造特征的参数 {参数名: 时序存储字段}"""
+    return {param: SOURCE_COLUMN_MAP[param] for param in PREDICTION_PARAMETERS
+            if SOURCE_COLUMN_MAP.get(param) in snapshot.columns}
+
+
+def parse_training_options(data):
+    """从请求体解析 window_days、stride、backtest_folds，未指定的使用默认值"""
+    options = TrainingOptions(
+        int(data.get('window_days', DEFAULT_WINDOW_DAYS)),
+        int(data.get('stride', DEFAULT_STRIDE)),
+        int(data.get('backtest_folds', DEFAULT_BACKTEST_FOLDS))
+    )
+    if not 0 <= options.window_days <= MAX_WINDOW_DAYS:
+        raise ValueError(f'训练窗口必须在 0 到 {MAX_WINDOW_DAYS} 天之间')
+    if not 1 <= options.stride <= MAX_STRIDE:
+        raise ValueError(f'样本间隔必须在 1 到 {MAX_STRIDE} 小时之间')
+    if not 1 <= options.backtest_folds <= MAX_BACKTEST_FOLDS:
+        raise ValueError(f'回测段数必须在 1 到 {MAX_BACKTEST_FOLDS} 之间')
+    return options
+
+
+def parse_prediction_parameters(values):
+    """解析多变量预测的参数列表，忽略不支持的参数并去重，没有有效参数时抛出 ValueError"""
+    params = tuple(dict.fromkeys(p for p in values or [] if p in PREDICTION_PARAMETERS))
+    if not params:
+        raise ValueError('请至少选择一个支持的预测参数')
+    return params
+
+
+def get_feature_set(snapshot, target_param):
+    """从时序存储快照构造（或从缓存取出）目标参数的特征集，数据不足时返回 None"""
+    if target_param not in PREDICTION_PARAMETERS or SOURCE_COLUMN_MAP.get(target_param) not in snapshot.columns:
+        return None
+    return feature_cache.get(snapshot, target_param, feature_parameters(snapshot))
+
+
+def prepare_prediction_data(target_param, timestamps, columns):
+    """
+    由时间戳和 {参数名: 数组} 构造特征集
+
+    用于没有时序存储快照的场景（如并行训练的子进程），数据不足时返回 None。
+    """
+    if target_param not in columns or len(timestamps) == 0:
+        return None
+    return build_feature_set(hourly_frame(timestamps, columns), target_param)
+
+
+def get_recent_features(snapshot, target_param, since):
+    """
+    只用 since 之后的数据构造特征集，用于在线模型的增量更新
+
+    since 之前多取构造滞后和滑动特征所需的小时数，计算量与历史长度无关。
+    """
+    start = pd.Timestamp(since) - pd.Timedelta(hours=HISTORY_HOURS + EXOGENOUS_WINDOW)
+    recent = snapshot.slice(start)
+    if recent.empty or SOURCE_COLUMN_MAP.get(target_param) not in recent.columns:
+        return None
+    hourly = hourly_frame(recent.timestamps,
+                          {param: recent.column(field) for param, field in feature_parameters(snapshot).items()})
+    return build_feature_set(hourly, target_param, min_rows=0)
+
+
+def build_model(model_type, n_jobs=None):
+    """n_jobs 为随机森林并行训练的线程数，结果与单线程相同"""
+    model_type = normalize_model_type(model_type)
+    if model_type == 'random_forest':
+        return RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10, n_jobs=n_jobs)
+    if model_type == 'online':
+        return RecursiveLeastSquares()
+    return LinearRegression()
+
+
+def evaluate(y_true, y_pred):
+    return {
+        'mse': float(mean_squared_error(y_true, y_pred)),
+        'r2': float(r2_score(y_true, y_pred)),
+        'mae': float(mean_absolute_error(y_true, y_pred))
+    }
+
+
+def training_rows(features, options):
+    """按训练窗口和样本间隔选出训练样本的下标，始终保留最新的样本"""
+    count = len(features.X)
+    first = 0
+    if options.window_days:
+        start = features.hours[-1] - pd.Timedelta(days=options.window_days)
+        first = int(features.hours.searchsorted(start, side='right'))
+    return np.arange(count - 1, first - 1, -options.stride)[::-1]
+
+
+def backtest_splits(count, folds):
+    """
+    滚动起点回测的各段 (起点, 终点)
+
+    最后 TEST_FRACTION 的样本按时间分成 folds 段，每段用它之前的全部样本训练。
+    """
+    size = max(int(count * TEST_FRACTION) // folds, 1)
+    return [(count - (folds - fold) * size, count - (folds - fold - 1) * size) for fold in range(folds)]
+
+
+def train_model(features, model_type, n_jobs=None, options=DEFAULT_TRAINING_OPTIONS):
+    """
+    在特征集上回测并训练模型
+
+    先按时间顺序回测，再用窗口内的全部样本训练最终模型（在线模型回测时边评估边学习，不重复训练）。
+    返回 (模型, 评估指标, 外推所需的元数据)，样本不足时返回 (None, None, None)。
+    评估指标包含训练耗时 training_time（秒）和使用的样本数 rows_used。
+    """
+    started = time.perf_counter()
+    rows = training_rows(features, options)
+    X, y = features.X[rows], features.y[rows]
+    splits = backtest_splits(len(X), options.backtest_folds)
+    if len(X) < 10 or splits[0][0] < 2:
+        return None, None, None
+
+    online = normalize_model_type(model_type) == 'online'
+    model = None
+    actual, predicted, folds = [], [], []
+    for start, end in splits:
+        if online:
+            # 在线模型：先用之前的数据训练，之后每段先预测再学习
+            if model is None:
+                model = build_model(model_type).fit(X[:start], y[:start])
+            fold_pred = model.predict(X[start:end])
+            model.partial_fit(X[start:end], y[start:end])
+        else:
+            fold_pred = build_model(model_type, n_jobs).fit(X[:start], y[:start]).predict(X[start:end])
+        actual.append(y[start:end])
+        predicted.append(fold_pred)
+        folds.append(dict(evaluate(y[start:end], fold_pred), start=features.hours[rows[start]].isoformat(),
+                          rows=end - start))
+
+    if not online:
+        model = build_model(model_type, n_jobs).fit(X, y)
+
+    performance = evaluate(np.concatenate(actual), np.concatenate(predicted))
+    if len(folds) > 1:
+        performance['folds'] = folds
+    performance.update({
+        'window_days': options.window_days,
+        'stride': options.stride,
+        'rows_used': len(X),
+        'training_time': round(time.perf_counter() - started, 4)
+    })
+
+    meta = {
+        'last_time': features.state['last_hour'],
+        'trained_until': features.hours[-1],
+        'features': features.feature_names,
+        'rows': len(X),
+        'options': options._asdict(),
+        'state': features.state
+    }
+    return model, performance, meta
+
+
+def update_model(model, performance, meta, features):
+    """
+    用 trained_until 之后的新数据增量更新在线模型（就地修改 model）
+
+    新数据足够时先用更新前的模型在新数据上评估（先预测后学习），否则沿用原评估指标。
+    返回 (评估指标, 元数据, 新增样本数)。
+    """
+    started = time.perf_counter()
+    new = features.hours > meta['trained_until']
+    X, y = features.X[new], features.y[new]
+    performance = dict(performance)
+    if len(X) >= 10:
+        performance.update(evaluate(y, model.predict(X)))
+        performance.pop('folds', None)
+    if len(X):
+        model.partial_fit(X, y)
+    performance.update({'rows_used': len(X), 'training_time': round(time.perf_counter() - started, 4)})
+
+    meta = dict(meta, **{
+        'last_time': features.state['last_hour'],
+        'trained_until': features.hours[new][-1] if len(X) else meta['trained_until'],
+        'features': features.feature_names,
+        'rows': meta['rows'] + len(X),
+        'state': features.state
+    })
+    return performance, meta, len(X)
+
+
+def forecast(model, meta, forecast_hours):
+    """从最后一个有数据的小时起逐小时递归外推，返回 (时间列表, 预测值数组)"""
+    last_time = meta['last_time']
+    future_times = [last_time + timedelta(hours=i) for i in range(1, forecast_hours + 1)]
+    return future_times, recursive_forecast(model, meta['state'], forecast_hours)
@@ -1,24 +1,20 @@
-import pandas as pd
-import math
-from app import app, db
-from models import WaterQualityData
-from datetime import datetime
+from app import app
+from models import WaterQualityData, upgrade_schema
+from ingest import import_file
 import os
 
 def setup_database():
     """设置数据库，确保表存在"""
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
         print("数据库表已就绪")
 
-def clean_value(value):
-    """清理 nan 值"""
-    if isinstance(value, float) and math.isnan(value):
-        return None
-    return value
+def import_water_quality_data(mode='incremental'):
+    """
+    导入水质数据到数据库
 
-def import_water_quality_data():
-    """导入水质数据到数据库"""
+    mode 为 'incremental' 时只写入上次导入之后新增的记录，'replace' 时清空后全量导入
+    """
     print("开始导入水质数据...")
     setup_database()
 
@@ -29,81 +25,16 @@ def import_water_quality_data():
             print("错误: 找不到数据文件")
             return
 
-
         try:
-            df = pd.read_excel(file_path, sheet_name='brisbane_water_quality')
-            print(f"成功读取数据，共 {len(df)} 行")
+            stats = import_file(file_path, mode=mode)
         except Exception as e:
-            print(f"读取文件失败: {e}")
+            print(f"导入失败: {e}")
             return
-
-        # 清空现有数据
-        WaterQualityData.query.delete()
-        db.session.commit()
-        print("现有数据已清空")
-
-        records_imported = 0
-        errors = 0
-
-        print("开始导入数据...")
-        for index, row in df.iterrows():
-            try:
-                # 跳过无效数据
-                if pd.isna(row['Timestamp']) or pd.isna(row['Record number']):
-                    continue
-
-                # 处理时间戳
-                timestamp = row['Timestamp']
-                if isinstance(timestamp, str):
-                    try:
-                        timestamp = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        continue
-
-                # 创建水质数据记录
-                water_data = WaterQualityData(
-                    timestamp=timestamp,
-                    record_number=int(clean_value(row['Record number'])),
-                    average_water_speed=clean_value(row.get('Average Water Speed')),
-                    average_water_direction=clean_value(row.get('Average Water Direction')),
-                    chlorophyll=clean_value(row.get('Chlorophyll')),
-                    chlorophyll_quality=clean_value(row.get('Chlorophyll [quality]')),
-                    temperature=clean_value(row.get('Temperature')),
-                    temperature_quality=clean_value(row.get('Temperature [quality]')),
-                    dissolved_oxygen=clean_value(row.get('Dissolved Oxygen')),
-                    dissolved_oxygen_quality=clean_value(row.get('Dissolved Oxygen [quality]')),
-                    dissolved_oxygen_saturation=clean_value(row.get('Dissolved Oxygen (%Saturation)')),
-                    dissolved_oxygen_saturation_quality=clean_value(row.get('Dissolved Oxygen (%Saturation) [quality]')),
-                    ph=clean_value(row.get('pH')),
-                    ph_quality=clean_value(row.get('pH [quality]')),
-                    salinity=clean_value(row.get('Salinity')),
-                    salinity_quality=clean_value(row.get('Salinity [quality]')),
-                    specific_conductance=clean_value(row.get('Specific Conductance')),
-                    specific_conductance_quality=clean_value(row.get('Specific Conductance [quality]')),
-                    turbidity=clean_value(row.get('Turbidity')),
-                    turbidity_quality=clean_value(row.get('Turbidity [quality]'))
-                )
-
-                # 计算数据质量评分
-                water_data.data_quality_score = water_data.calculate_quality_score()
-
-                db.session.add(water_data)
-                records_imported += 1
-
-                # 每200条提交一次
-                if records_imported % 200 == 0:
-                    db.session.commit()
-                    print(f"已导入 {records_imported} 条记录...")
-
-            except Exception as e:
-                errors += 1
-                continue
-
-        # 最终提交
-        db.session.commit()
         print(f"\n数据导入完成！")
-        print(f"成功导入: {records_imported} 条记录")
-        print(f"导入失败: {errors} 条记录")
+        print(f"成功导入: {stats['imported']} 条记录")
+        print(f"跳过: {stats['skipped']} 条记录")
+        print(f"耗时: {stats['elapsed']:.2f} 秒，{stats['rows_per_sec']:.0f} 行/秒")
+        print(f"已导入的最大记录号: {stats['high_water_mark']}")
 
         # 显示统计信息
         total_records = WaterQualityData.query.count()
@@ -135,7 +66,8 @@ if __name__ == '__main__':
 
     user_input = input("\n是否继续导入数据？(y/n): ").strip().lower()
     if user_input in ['y', 'yes']:
-        import_water_quality_data()
+        mode_input = input("是否清空现有数据后全量导入？默认只导入新增数据 (y/n): ").strip().lower()
+        import_water_quality_data(mode='replace' if mode_input in ['y', 'yes'] else 'incremental')
     else:
         print("操作已取消")
 
@@ -0,0 +1,600 @@
+"""
+水质数据批量导入引擎
+
+按列（pandas/NumPy）完成空值清洗、时间解析和质量评分计算，
+再以 executemany 方式批量写入数据库。源文件按固定行数流式读取，
+内存占用与文件大小无关。
+"""
+
+import glob
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, update, or_
+
+from models import (db, WaterQualityData, DataImportLog, SOURCE_COLUMN_MAP,
+                    MEASUREMENT_FIELDS, QUALITY_FIELDS)
+from rollups import (refresh_rollups, refresh_rollups_at, clear_rollups, rebuild_rollups_in,
+                     SQLITE_DATETIME_FORMAT)
+from cache import bump_data_version
+from alert_evaluator import clear_alert_events
+
+# 每次 executemany 写入的行数
+DEFAULT_BATCH_SIZE = 5000
+
+# 按记录号查询已有记录时每条语句的记录号个数（SQLite 的参数个数有上限）
+LOOKUP_BATCH_SIZE = 500
+
+# 流式读取源文件时每个批次的行数
+DEFAULT_CHUNK_SIZE = 10000
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 可导入的源文件扩展名
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+CSV_EXTENSIONS = ('.csv', '.txt')
+SOURCE_EXTENSIONS = EXCEL_EXTENSIONS + CSV_EXTENSIONS
+
+# Excel 源文件的工作表名
+EXCEL_SHEET_NAME = 'brisbane_water_quality'
+
+# 增量导入时参与变更比较、冲突时被更新的字段（不含 created_at）
+UPSERT_FIELDS = ['timestamp'] + MEASUREMENT_FIELDS + QUALITY_FIELDS + ['data_quality_score']
+
+
+def parse_timestamps(series):
+    """向量化解析时间列，已是 datetime 的单元格原样保留，无法解析的字符串置为 NaT"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series, format=TIMESTAMP_FORMAT, errors='coerce')
+
+
+def calculate_quality_scores(frame):
+    """向量化计算数据质量评分，逻辑与 WaterQualityData.calculate_quality_score 一致"""
+    qualities = frame[QUALITY_FIELDS].to_numpy(dtype='float64')
+    valid = ~np.isnan(qualities)
+    counts = valid.sum(axis=1)
+    totals = np.where(valid, qualities, 0.0).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.clip(totals / (counts * 1000), 0, 1)
+    return np.where(counts > 0, scores, 1.0)
+
+
+def prepare_frame(df):
+    """
+    将源数据表清洗为 WaterQualityData 字段列
+
+    返回 (frame, skipped)，skipped 为因时间戳/记录号无效或记录号重复而丢弃的行数
+    """
+    frame = pd.DataFrame(index=df.index)
+    for source_column, field in SOURCE_COLUMN_MAP.items():
+        if source_column in df.columns:
+            frame[field] = df[source_column]
+        else:
+            frame[field] = np.nan
+
+    frame['timestamp'] = parse_timestamps(frame['timestamp'])
+    frame['record_number'] = pd.to_numeric(frame['record_number'], errors='coerce')
+
+    total = len(frame)
+    frame = frame[frame['timestamp'].notna() & frame['record_number'].notna()]
+    # 同一文件内记录号重复时保留最后一条
+    frame = frame.drop_duplicates(subset='record_number', keep='last')
+    skipped = total - len(frame)
+
+    frame['record_number'] = frame['record_number'].astype('int64')
+    for field in MEASUREMENT_FIELDS:
+        frame[field] = pd.to_numeric(frame[field], errors='coerce').astype('float64')
+    for field in QUALITY_FIELDS:
+        frame[field] = pd.to_numeric(frame[field], errors='coerce').round().astype('Int64')
+
+    frame['data_quality_score'] = calculate_quality_scores(frame)
+    return frame.reset_index(drop=True), skipped
+
+
+def frame_to_records(frame):
+    """将清洗后的列转换为 Core insert 所需的字典列表，NaN/NA 转为 None"""
+    columns = {}
+    for field in frame.columns:
+        series = frame[field]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.dt.to_pydatetime().tolist()
+        else:
+            values = series.astype(object).where(series.notna(), None).tolist()
+        columns[field] = values
+
+    fields = list(columns.keys())
+    return [dict(zip(fields, row)) for row in zip(*columns.values())]
+
+
+def frame_to_sqlite_rows(frame):
+    """
+    将清洗后的列转换为 SQLite DBAPI 可直接使用的元组列表
+
+    时间列按 SQLAlchemy SQLite DateTime 的存储格式向量化转为字符串，
+    避免 Core 对每一行做参数类型处理。
+    """
+    columns = []
+    for field in frame.columns:
+        series = frame[field]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime(SQLITE_DATETIME_FORMAT)
+        columns.append(series.astype(object).where(series.notna(), None).tolist())
+    return list(zip(*columns))
+
+
+def sqlite_insert_statement(conn, fields):
+    """按给定列顺序生成 qmark 风格的 INSERT 语句"""
+    quote = conn.dialect.identifier_preparer.quote
+    columns = ', '.join(quote(field) for field in fields)
+    placeholders = ', '.join('?' for _ in fields)
+    return f'INSERT INTO {quote(WaterQualityData.__tablename__)} ({columns}) VALUES ({placeholders})'
+
+
+def with_row_defaults(frame):
+    """补齐批量写入时不会自动填充的列默认值"""
+    now = datetime.utcnow()
+    return frame.assign(created_at=now, updated_at=now, is_anomaly=False)
+
+
+def sqlite_upsert_statement(conn, fields):
+    """
+    生成按 record_number 冲突更新的 INSERT ... ON CONFLICT 语句
+
+    只有字段值确实变化时才执行更新，未变化的行不产生写入。
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    assignments = ', '.join(f'{quote(field)} = excluded.{quote(field)}'
+                            for field in UPSERT_FIELDS + ['updated_at'])
+    changed = ' OR '.join(f'{quote(field)} IS NOT excluded.{quote(field)}' for field in UPSERT_FIELDS)
+    return (f'{sqlite_insert_statement(conn, fields)} '
+            f'ON CONFLICT ({quote("record_number")}) DO UPDATE SET {assignments} WHERE {changed}')
+
+
+def bulk_upsert(conn, frame, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    按 record_number 分批 upsert，返回实际新增或变更的行数
+
+    SQLite 使用 INSERT ... ON CONFLICT DO UPDATE，其他数据库使用对应方言的 Core 语句。
+    """
+    table = WaterQualityData.__table__
+    frame = with_row_defaults(frame)
+    written = 0
+
+    if conn.dialect.name == 'sqlite':
+        rows = frame_to_sqlite_rows(frame)
+        statement = sqlite_upsert_statement(conn, list(frame.columns))
+        for start in range(0, len(rows), batch_size):
+            result = conn.exec_driver_sql(statement, rows[start:start + batch_size])
+            written += max(result.rowcount, 0)
+        return written
+
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        raise ValueError(f'增量导入不支持数据库类型: {conn.dialect.name}')
+
+    records = frame_to_records(frame)
+    for start in range(0, len(records), batch_size):
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['record_number'],
+            set_={field: statement.excluded[field] for field in UPSERT_FIELDS + ['updated_at']},
+            where=or_(*[table.c[field].is_distinct_from(statement.excluded[field])
+                        for field in UPSERT_FIELDS])
+        )
+        result = conn.execute(statement, records[start:start + batch_size])
+        written += max(result.rowcount, 0)
+    return written
+
+
+def moved_timestamps(conn, frame):
+    """
+    批次中已存在、且原时间不在本批时间跨度内的记录的原时间
+
+    需要在 upsert 之前读取，这些记录更新后原来所在的汇总分组也要重算。
+    """
+    table = WaterQualityData.__table__
+    start = frame['timestamp'].min().to_pydatetime()
+    end = frame['timestamp'].max().to_pydatetime()
+    numbers = frame['record_number'].tolist()
+    timestamps = []
+    for offset in range(0, len(numbers), LOOKUP_BATCH_SIZE):
+        timestamps += conn.execute(
+            select(table.c.timestamp).where(
+                table.c.record_number.in_(numbers[offset:offset + LOOKUP_BATCH_SIZE]),
+                or_(table.c.timestamp < start, table.c.timestamp > end))
+        ).scalars().all()
+    return timestamps
+
+
+def clear_measurements(conn):
+    """清空原始数据及其汇总、预警事件"""
+    conn.execute(WaterQualityData.__table__.delete())
+    clear_rollups(conn)
+    clear_alert_events(conn)
+    bump_data_version(conn)
+
+
+def new_stats():
+    """创建一份空的导入统计"""
+    return {'imported': 0, 'skipped': 0, 'max_record_number': None, 'write_seconds': 0.0}
+
+
+def write_prepared_batch(conn, frame, skipped, stats, high_water_mark=None, update_existing=False,
+                         batch_size=DEFAULT_BATCH_SIZE, update_rollups=True):
+    """
+    写入一个已清洗的批次并累计到 stats
+
+    high_water_mark 不为空且未要求回写历史数据时，只写入记录号大于它的行。
+    update_rollups=False 时不重算汇总，由调用方在事务结束前统一重建。
+    """
+    started = time.perf_counter()
+    if high_water_mark is not None and not update_existing:
+        is_new = frame['record_number'] > high_water_mark
+        skipped += int((~is_new).sum())
+        frame = frame[is_new]
+
+    moved = moved_timestamps(conn, frame) if update_rollups and len(frame) else []
+    # 跨批次的重复记录号同样按"后者覆盖前者"处理
+    written = bulk_upsert(conn, frame, batch_size)
+    if written:
+        bump_data_version(conn)
+    if written and update_rollups:
+        refresh_rollups(conn, frame['timestamp'].min().to_pydatetime(),
+                        frame['timestamp'].max().to_pydatetime())
+        refresh_rollups_at(conn, moved)
+    stats['imported'] += written
+    # 已存在且没有变化的行同样计为跳过
+    stats['skipped'] += skipped + len(frame) - written
+    if len(frame):
+        batch_max = int(frame['record_number'].max())
+        stats['max_record_number'] = max(batch_max, stats['max_record_number'] or batch_max)
+    stats['write_seconds'] += time.perf_counter() - started
+
+
+def finish_stats(stats, started):
+    """补充总耗时、解析耗时和吞吐量"""
+    elapsed = time.perf_counter() - started
+    stats['elapsed'] = elapsed
+    stats.setdefault('parse_seconds', max(elapsed - stats['write_seconds'], 0.0))
+    stats['rows_per_sec'] = stats['imported'] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+def write_batches(batches, mode='incremental', high_water_mark=None, update_existing=False,
+                  batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    将源数据批次依次清洗并写入数据库，返回导入统计信息
+
+    batches 为源列名 DataFrame 的可迭代对象，任一时刻只持有一个批次。
+    replace 模式下清空、全部写入和汇总重建在同一事务中完成，读取方始终看到完整数据；
+    incremental 模式每批单独提交，中途失败后重跑是安全的。
+    每批写入后调用 progress(stats, conn)，conn 为当前写入事务的连接。
+    """
+    if mode not in ('replace', 'incremental'):
+        raise ValueError(f'未知的导入模式: {mode}')
+    if mode == 'replace':
+        high_water_mark = None
+
+    started = time.perf_counter()
+    stats = new_stats()
+
+    def write(conn, df):
+        frame, skipped = prepare_frame(df)
+        write_prepared_batch(conn, frame, skipped, stats, high_water_mark, update_existing, batch_size,
+                             update_rollups=(mode != 'replace'))
+        if progress is not None:
+            progress(stats, conn)
+
+    if mode == 'replace':
+        with db.engine.begin() as conn:
+            clear_measurements(conn)
+            for df in batches:
+                write(conn, df)
+            # 全量替换时逐批重算汇总代价较高，写完后一次性重建
+            rollup_started = time.perf_counter()
+            rebuild_rollups_in(conn)
+            stats['write_seconds'] += time.perf_counter() - rollup_started
+    else:
+        for df in batches:
+            with db.engine.begin() as conn:
+                write(conn, df)
+
+    return finish_stats(stats, started)
+
+
+def detect_import_type(file_path):
+    """根据扩展名判断源文件类型"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in EXCEL_EXTENSIONS:
+        return 'excel'
+    if extension in CSV_EXTENSIONS:
+        return 'csv'
+    raise ValueError(f'不支持的文件类型: {extension}')
+
+
+def iter_excel_batches(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """以 openpyxl 只读模式逐行读取工作表，每 chunk_size 行产出一个批次"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook[EXCEL_SHEET_NAME].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_csv_batches(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """分块读取 CSV，每 chunk_size 行产出一个批次"""
+    with pd.read_csv(file_path, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def iter_source_batches(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """流式读取源文件，内存占用只与 chunk_size 有关，与文件大小无关"""
+    if detect_import_type(file_path) == 'excel':
+        return iter_excel_batches(file_path, chunk_size)
+    return iter_csv_batches(file_path, chunk_size)
+
+
+def create_import_log(file_path, mode, imported_by=None, started_at=None):
+    """为一个源文件创建导入日志（未提交）"""
+    log = DataImportLog(
+        filename=os.path.abspath(file_path),
+        import_type=detect_import_type(file_path),
+        import_mode=mode,
+        imported_by=imported_by,
+        started_at=started_at or datetime.utcnow()
+    )
+    db.session.add(log)
+    return log
+
+
+def update_import_log_progress(conn, log_id, stats):
+    """在写入事务中更新导入日志的进度"""
+    log_table = DataImportLog.__table__
+    conn.execute(update(log_table).where(log_table.c.id == log_id).values(
+        status='running',
+        records_imported=stats['imported'],
+        records_skipped=stats['skipped']
+    ))
+
+
+def complete_import_log(log_id, stats, high_water_mark=None, error=None):
+    """导入结束后写回最终状态、统计、耗时和新的最大记录号"""
+    log = db.session.get(DataImportLog, log_id)
+    log.records_imported = stats['imported']
+    log.records_skipped = stats['skipped']
+    log.parse_seconds = stats.get('parse_seconds')
+    log.write_seconds = stats['write_seconds']
+    log.completed_at = datetime.utcnow()
+    if error is None:
+        log.status = 'success'
+        log.high_water_mark = max((mark for mark in (high_water_mark, stats['max_record_number'])
+                                   if mark is not None), default=None)
+    else:
+        log.status = 'failed'
+        log.error_message = error
+        log.high_water_mark = high_water_mark
+    db.session.commit()
+    return log
+
+
+def import_file(file_path, mode='incremental', update_existing=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                batch_size=DEFAULT_BATCH_SIZE, imported_by=None, progress=None):
+    """
+    流式导入一个源文件并记录 DataImportLog
+
+    mode 为 'replace'（清空后全量导入）或 'incremental'（按该文件上次导入的
+    最大记录号只写入新增数据）。每个批次写入后在同一事务中更新日志的
+    records_imported / records_skipped，并调用 progress(stats)。
+    需要在应用上下文中调用。
+    """
+    high_water_mark = (DataImportLog.get_high_water_mark(os.path.abspath(file_path))
+                       if mode == 'incremental' else None)
+    log = create_import_log(file_path, mode, imported_by)
+    db.session.commit()
+    # 写入事务期间不能再经由 ORM 会话访问数据库
+    log_id = log.id
+
+    def on_batch(stats, conn):
+        update_import_log_progress(conn, log_id, stats)
+        if progress is not None:
+            progress(stats)
+
+    started = time.perf_counter()
+    stats = new_stats()
+    try:
+        stats = write_batches(iter_source_batches(file_path, chunk_size), mode, high_water_mark,
+                              update_existing, batch_size, progress=on_batch)
+    except Exception as e:
+        db.session.rollback()
+        complete_import_log(log_id, finish_stats(stats, started), high_water_mark, error=str(e))
+        raise
+
+    log = complete_import_log(log_id, stats, high_water_mark)
+    stats['high_water_mark'] = log.high_water_mark
+    return stats
+
+
+def collect_source_files(patterns):
+    """将目录、通配符或文件路径展开为按名称排序的源文件列表"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern)
+        for path in candidates:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in SOURCE_EXTENSIONS:
+                paths.add(path)
+    return sorted(paths)
+
+
+# 进程池工作进程中用于回传批次的队列
+_batch_queue = None
+
+
+def _init_parse_worker(batch_queue):
+    """进程池初始化：保存批次队列"""
+    global _batch_queue
+    _batch_queue = batch_queue
+
+
+def parse_file_worker(file_path, chunk_size):
+    """
+    在工作进程中流式读取并清洗一个源文件
+
+    每个清洗好的批次以 ('batch', frame, skipped) 放入队列，队列有界，
+    写入跟不上时读取自动等待；结束时放入 ('done', parse_seconds) 或 ('error', 信息)。
+    """
+    started = time.perf_counter()
+    try:
+        for df in iter_source_batches(file_path, chunk_size):
+            frame, skipped = prepare_frame(df)
+            _batch_queue.put((file_path, 'batch', (frame, skipped)))
+    except Exception as e:
+        _batch_queue.put((file_path, 'error', str(e)))
+        return
+    _batch_queue.put((file_path, 'done', time.perf_counter() - started))
+
+
+def import_files(file_paths, mode='incremental', update_existing=False, workers=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE, imported_by=None,
+                 progress=None):
+    """
+    并行导入多个源文件
+
+    文件在进程池中读取和清洗，清洗好的批次经有界队列交给调用线程统一写入，
+    满足 SQLite 单写入者的限制。每个文件单独记录一条 DataImportLog，
+    文件完成时调用 progress(file_path, stats)。
+    replace 模式下清空、全部文件的写入和汇总重建在同一事务中完成，读取方始终看到
+    完整的旧数据或新数据；任一文件失败时整体回滚，各文件的日志在事务结束后写回。
+    需要在应用上下文中调用，返回 {文件路径: 统计信息}。
+    """
+    if mode not in ('replace', 'incremental'):
+        raise ValueError(f'未知的导入模式: {mode}')
+
+    # 同一批导入的日志使用相同的开始时间，replace 之后的最大记录号判断依赖于此
+    run_started = datetime.utcnow()
+    jobs = {}
+    for path in file_paths:
+        high_water_mark = (DataImportLog.get_high_water_mark(os.path.abspath(path))
+                           if mode == 'incremental' else None)
+        log = create_import_log(path, mode, imported_by, started_at=run_started)
+        jobs[path] = {'log': log, 'high_water_mark': high_water_mark, 'stats': new_stats(),
+                      'started': time.perf_counter()}
+    db.session.commit()
+    for job in jobs.values():
+        job['log_id'] = job.pop('log').id
+
+    results = {}
+    # replace 模式下已结束文件的 (解析耗时, 错误)，事务结束后再写回日志
+    pending = {}
+
+    def finish(path, parse_seconds=None, error=None):
+        job = jobs[path]
+        stats = job['stats']
+        if parse_seconds is not None:
+            stats['parse_seconds'] = parse_seconds
+        finish_stats(stats, job['started'])
+        log = complete_import_log(job['log_id'], stats, job['high_water_mark'], error=error)
+        stats['high_water_mark'] = log.high_water_mark
+        stats['error'] = error
+        results[path] = stats
+        if progress is not None:
+            progress(path, stats)
+
+    def file_done(path, parse_seconds=None, error=None):
+        if mode == 'replace':
+            pending[path] = (parse_seconds, error)
+        else:
+            finish(path, parse_seconds, error)
+
+    def write(conn, path, frame, skipped):
+        job = jobs[path]
+        write_prepared_batch(conn, frame, skipped, job['stats'], job['high_water_mark'], update_existing,
+                             batch_size, update_rollups=(mode != 'replace'))
+        update_import_log_progress(conn, job['log_id'], job['stats'])
+
+    replace_conn = db.engine.connect() if mode == 'replace' else None
+    failure = None
+    try:
+        if replace_conn is not None:
+            transaction = replace_conn.begin()
+            clear_measurements(replace_conn)
+
+        workers = workers or os.cpu_count() or 1
+        batch_queue = multiprocessing.Queue(maxsize=workers * 2)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                                 initargs=(batch_queue,)) as pool:
+            futures = {pool.submit(parse_file_worker, path, chunk_size): path for path in file_paths}
+            while len(results) + len(pending) < len(jobs):
+                try:
+                    path, kind, payload = batch_queue.get(timeout=1)
+                except queue.Empty:
+                    # 工作进程异常退出时不会再有消息，直接按失败结束
+                    for future, path in futures.items():
+                        if (path not in results and path not in pending and future.done()
+                                and future.exception() is not None):
+                            file_done(path, error=str(future.exception()))
+                    continue
+
+                if kind == 'batch':
+                    frame, skipped = payload
+                    if replace_conn is None:
+                        with db.engine.begin() as conn:
+                            write(conn, path, frame, skipped)
+                    else:
+                        write(replace_conn, path, frame, skipped)
+                elif kind == 'done':
+                    file_done(path, parse_seconds=payload)
+                else:
+                    file_done(path, error=payload)
+
+        if replace_conn is not None and not any(error for _, error in pending.values()):
+            # 全量替换时逐批重算汇总代价较高，写完后一次性重建
+            rebuild_rollups_in(replace_conn)
+            transaction.commit()
+    except Exception as e:
+        if replace_conn is None:
+            raise
+        failure = e
+    finally:
+        # 未提交的事务随连接关闭回滚
+        if replace_conn is not None:
+            replace_conn.close()
+
+    if mode == 'replace':
+        error = str(failure) if failure is not None else next(
+            (error for _, error in pending.values() if error), None)
+        for path in jobs:
+            parse_seconds, file_error = pending.get(path, (None, None))
+            if error is not None:
+                # 已写入的数据随事务回滚
+                jobs[path]['stats']['imported'] = 0
+            if error is not None and file_error is None:
+                file_error = f'同批导入失败，已整体回滚: {error}'
+            finish(path, parse_seconds, file_error)
+        if failure is not None:
+            raise failure
+
+    return results
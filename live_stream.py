@@ -0,0 +1,252 @@
+"""
+实时数据推送（Server-Sent Events）
+
+进程内只有一个轮询线程：每轮查询一次新增的监测数据和预警事件，
+序列化一次后分发给所有连接的浏览器，N 个页面只产生一次查询。
+每个连接有一个有界队列，消费过慢的连接在队列满时丢弃积压消息，
+改为推送一条 resync 事件，由前端重新拉取完整数据。
+"""
+
+import json
+import queue
+import threading
+import time
+
+from sqlalchemy import select, func
+
+from models import db, WaterQualityData, AlertEvent, AlertRule
+from alert_engine import get_parameter_unit
+from alert_evaluator import event_to_dict
+from cache import get_data_version
+
+# 轮询新数据的间隔（秒）
+DEFAULT_POLL_INTERVAL = 2.0
+
+# 没有消息时发送心跳的间隔（秒）
+DEFAULT_HEARTBEAT_INTERVAL = 15.0
+
+# 每个连接最多积压的消息数
+DEFAULT_QUEUE_SIZE = 100
+
+# 单轮新增记录超过该数量（如批量导入）时只通知前端重新拉取
+MAX_PUSH_ROWS = 500
+
+# 数据流展示的参数及正常范围
+STREAM_PARAMETERS = [
+    ('temperature', '温度', 15, 28),
+    ('dissolved_oxygen', '溶解氧', 5, 10),
+    ('ph', 'pH值', 6.5, 8.5),
+    ('turbidity', '浊度', 0, 5),
+    ('chlorophyll', '叶绿素', 0, 3),
+    ('salinity', '盐度', 0, 35)
+]
+
+STREAM_FIELDS = [param_field for param_field, _, _, _ in STREAM_PARAMETERS]
+
+
+def stream_items(records):
+    """将监测记录展开为数据流条目，每个有值的参数一条"""
+    items = []
+    for record in records:
+        for param_field, param_name, min_val, max_val in STREAM_PARAMETERS:
+            value = getattr(record, param_field)
+            if value is None:
+                continue
+            items.append({
+                'timestamp': record.timestamp.isoformat(),
+                'parameter': param_name,
+                'value': float(value),
+                'status': 'warning' if value < min_val or value > max_val else 'normal',
+                'unit': get_parameter_unit(param_field)
+            })
+    return items
+
+
+def stream_parameter_info():
+    """按列返回数据流时共享的参数元数据"""
+    return [{
+        'field': param_field,
+        'name': param_name,
+        'unit': get_parameter_unit(param_field),
+        'min': min_val,
+        'max': max_val
+    } for param_field, param_name, min_val, max_val in STREAM_PARAMETERS]
+
+
+def format_event(event, data):
+    """按 SSE 格式编码一条消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+RESYNC_MESSAGE = format_event('resync', {})
+
+
+class Subscriber:
+    """一个浏览器连接"""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def send(self, message):
+        """放入消息，队列已满时丢弃积压并改发 resync"""
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(RESYNC_MESSAGE)
+
+
+class Broadcaster:
+    """
+    进程内的 SSE 广播器
+
+    第一个连接到来时启动轮询线程，最后一个连接断开后线程退出。
+    """
+
+    def __init__(self, poll_interval=DEFAULT_POLL_INTERVAL, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._first_data_id = None
+        self._last_data_id = None
+        self._last_record_number = None
+        self._last_event_id = None
+        self._data_version = None
+        self.polls = 0
+        self.messages = 0
+
+    def subscribe(self, app):
+        """注册一个连接，必要时启动轮询线程"""
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), name='sse-broadcaster',
+                                                daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, message):
+        """分发一条已编码的消息给全部连接"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.send(message)
+        self.messages += 1
+
+    def _run(self, app):
+        with app.app_context():
+            self._reset_positions()
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            time.sleep(self.poll_interval)
+            with app.app_context():
+                try:
+                    self.poll()
+                except Exception as e:
+                    print(f"实时推送错误: {e}")
+                finally:
+                    db.session.remove()
+
+    def _data_id_range(self):
+        """监测数据当前的最小 ID，以及最大 ID 和该行的记录号"""
+        with db.engine.connect() as conn:
+            first, last = conn.execute(select(func.min(WaterQualityData.id), func.max(WaterQualityData.id))).one()
+            record_number = self._record_number_at(conn, last)
+        return first or 0, last or 0, record_number
+
+    @staticmethod
+    def _record_number_at(conn, data_id):
+        """指定 ID 的记录号，记录不存在时为 None"""
+        if not data_id:
+            return None
+        return conn.execute(select(WaterQualityData.record_number).where(WaterQualityData.id == data_id)).scalar()
+
+    def _reset_positions(self):
+        """从当前最新的记录开始推送"""
+        self._first_data_id, self._last_data_id, self._last_record_number = self._data_id_range()
+        with db.engine.connect() as conn:
+            self._last_event_id = conn.execute(select(func.max(AlertEvent.id))).scalar() or 0
+        self._data_version = get_data_version()
+
+    def poll(self):
+        """查询一轮新增数据和预警事件并推送"""
+        self.polls += 1
+        version = get_data_version()
+        if version != self._data_version:
+            with db.engine.connect() as conn:
+                first = conn.execute(select(func.min(WaterQualityData.id))).scalar() or 0
+                record_number = self._record_number_at(conn, self._last_data_id)
+            if first != self._first_data_id or record_number != self._last_record_number:
+                # 全量替换后 SQLite 会重用记录 ID，已推送位置上的记录变了，无法增量推送
+                self._reset_positions()
+                self.publish(RESYNC_MESSAGE)
+                return
+            self._data_version = version
+
+        records = WaterQualityData.query.filter(WaterQualityData.id > self._last_data_id).order_by(
+            WaterQualityData.id).limit(MAX_PUSH_ROWS + 1).all()
+        if len(records) > MAX_PUSH_ROWS:
+            self._reset_positions()
+            self.publish(RESYNC_MESSAGE)
+            return
+        if records:
+            self._last_data_id = records[-1].id
+            self._last_record_number = records[-1].record_number
+            records.sort(key=lambda record: record.timestamp, reverse=True)
+            self.publish(format_event('readings', {'data': stream_items(records)}))
+
+        rows = db.session.query(AlertEvent, AlertRule).join(AlertRule, AlertEvent.rule_id == AlertRule.id).filter(
+            AlertEvent.id > self._last_event_id).order_by(AlertEvent.id).limit(MAX_PUSH_ROWS + 1).all()
+        if len(rows) > MAX_PUSH_ROWS:
+            self._reset_positions()
+            self.publish(RESYNC_MESSAGE)
+        elif rows:
+            self._last_event_id = rows[-1][0].id
+            self.publish(format_event('alerts', {'alerts': [event_to_dict(event, rule) for event, rule in rows]}))
+
+    def stream(self, subscriber):
+        """单个连接的响应体生成器，空闲时发送心跳注释保持连接"""
+        try:
+            yield f"retry: {int(self.poll_interval * 1000) * 2}\n\n"
+            while True:
+                try:
+                    yield subscriber.queue.get(timeout=self.heartbeat_interval)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        """连接数等运行状态"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'running': self._thread is not None and self._thread.is_alive(),
+            'polls': self.polls,
+            'messages': self.messages,
+            'queued': sum(s.queue.qsize() for s in subscribers),
+            'dropped': sum(s.dropped for s in subscribers)
+        }
+
+
+# 全局共享的广播器
+broadcaster = Broadcaster()
@@ -0,0 +1,340 @@
+"""
+训练好的预测模型的注册与缓存
+
+模型按 (预测参数, 模型类型, 训练选项) 缓存，并记录训练时的数据版本号：
+- 版本号未变化时直接复用内存中的模型，预测只需一次 predict()
+- 内存中没有时从 prediction_models 表找到同一版本的记录，用 joblib 加载模型文件
+- 都没有时重新训练，保存模型文件并写入 PredictionModel 记录，旧版本的记录停用、文件删除
+- 在线模型（online）有旧版本时不重新训练，只用新增的数据增量更新后另存为新版本
+内存中的模型数量有上限，按 LRU 淘汰。
+一次需要训练多个模型时分发到进程池并行训练，单个模型在当前进程内用多线程训练。
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+import joblib
+import pandas as pd
+from flask import current_app
+from sqlalchemy import select, insert, update
+
+from models import db, PredictionModel
+from cache import get_data_version
+from timeseries_store import time_series_store
+from forecasting import (normalize_model_type, feature_parameters, get_feature_set, get_recent_features, train_model,
+                         update_model, DEFAULT_TRAINING_OPTIONS)
+from training_pool import train_parallel
+
+# 内存中最多保留的模型数
+DEFAULT_MAX_MODELS = 16
+
+# 模型文件目录（位于 instance 目录下）
+MODEL_DIRNAME = 'models'
+
+TrainedModel = namedtuple('TrainedModel', ['record_id', 'target_parameter', 'model_type', 'model',
+                                           'performance', 'meta', 'data_version'])
+
+
+def model_dir():
+    path = os.path.join(current_app.instance_path, MODEL_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def artifact_name(target_param, model_type, data_version, options=DEFAULT_TRAINING_OPTIONS):
+    """模型文件名，参数名中的空格等字符替换为下划线，非默认的训练选项加在文件名中"""
+    slug = ''.join(char if char.isalnum() else '_' for char in target_param).lower()
+    if options != DEFAULT_TRAINING_OPTIONS:
+        slug += f'_w{options.window_days}_s{options.stride}_f{options.backtest_folds}'
+    return f'{slug}_{model_type}_v{data_version}.joblib'
+
+
+def options_match(model_config, options):
+    """模型记录的训练选项是否与 options 相同，没有记录选项的视为默认选项"""
+    config = json.loads(model_config or '{}')
+    return config.get('options', DEFAULT_TRAINING_OPTIONS._asdict()) == options._asdict()
+
+
+def remove_artifact(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ModelRegistry:
+    """线程安全的模型缓存，同一模型同时只会被训练一次"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_MODELS):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._training_locks = {}
+        self.hits = 0
+        self.loads = 0
+        self.trainings = 0
+        self.updates = 0
+        self.evictions = 0
+
+    def _cached(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.data_version != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _training_lock(self, key):
+        with self._lock:
+            return self._training_locks.setdefault(key, threading.Lock())
+
+    def get(self, target_param, model_type, options=DEFAULT_TRAINING_OPTIONS):
+        """
+        获取当前数据版本下训练好的模型
+
+        参数不存在或有效数据不足时返回 None。
+        """
+        return self.get_many([target_param], model_type, options)[target_param]
+
+    def get_many(self, target_params, model_type, options=DEFAULT_TRAINING_OPTIONS):
+        """
+        获取多个参数当前数据版本下的模型，返回 {参数: 模型或 None}
+
+        缓存和模型文件都没有的参数一起训练：多于一个时分发到进程池并行训练。
+        """
+        model_type = normalize_model_type(model_type)
+        version = get_data_version()
+        results = {}
+        missing = []
+        for target_param in dict.fromkeys(target_params):
+            entry = self._cached((target_param, model_type, options), version)
+            if entry is not None:
+                self.hits += 1
+                results[target_param] = entry
+            else:
+                missing.append(target_param)
+        if not missing:
+            return results
+
+        # 按固定顺序获取训练锁，避免并发请求互相等待
+        locks = [self._training_lock((target_param, model_type, options)) for target_param in sorted(missing)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            untrained = []
+            for target_param in missing:
+                # 等待期间其他线程可能已经训练好
+                entry = self._cached((target_param, model_type, options), version)
+                if entry is None:
+                    entry = self._load(target_param, model_type, version, options)
+                    if entry is not None:
+                        self._put((target_param, model_type, options), entry)
+                results[target_param] = entry
+                if entry is None:
+                    untrained.append(target_param)
+
+            if model_type == 'online':
+                # 在线模型优先在上一版本的基础上增量更新
+                for target_param in list(untrained):
+                    entry = self._update(target_param, model_type, version, options)
+                    if entry is not None:
+                        self._put((target_param, model_type, options), entry)
+                        results[target_param] = entry
+                        untrained.remove(target_param)
+
+            if len(untrained) == 1:
+                trained = {untrained[0]: self._train(untrained[0], model_type, version, options)}
+            elif untrained:
+                trained = self._train_parallel(untrained, model_type, version, options)
+            else:
+                trained = {}
+            for target_param, entry in trained.items():
+                if entry is not None:
+                    self._put((target_param, model_type, options), entry)
+                results[target_param] = entry
+        finally:
+            for lock in locks:
+                lock.release()
+        return results
+
+    def _find(self, target_param, model_type, options, *conditions):
+        """最新的一条训练选项相同、已启用的模型记录"""
+        table = PredictionModel.__table__
+        rows = db.session.execute(
+            select(table.c.id, table.c.artifact_path, table.c.performance_metrics, table.c.model_config)
+            .where(table.c.target_parameter == target_param, table.c.model_type == model_type,
+                   table.c.is_active.is_(True), *conditions)
+            .order_by(table.c.data_version.desc(), table.c.id.desc())
+        ).all()
+        db.session.commit()
+        return next((row for row in rows if row.artifact_path and options_match(row.model_config, options)), None)
+
+    def _load(self, target_param, model_type, version, options):
+        """从 prediction_models 表和模型文件加载同一数据版本的模型"""
+        row = self._find(target_param, model_type, options, PredictionModel.data_version == version)
+        if row is None:
+            return None
+
+        try:
+            artifact = joblib.load(os.path.join(model_dir(), row.artifact_path))
+        except (OSError, EOFError, ValueError) as e:
+            print(f"模型文件加载失败 {row.artifact_path}: {e}")
+            return None
+        self.loads += 1
+        return TrainedModel(row.id, target_param, model_type, artifact['model'], json.loads(row.performance_metrics),
+                            artifact['meta'], version)
+
+    def _update(self, target_param, model_type, version, options):
+        """加载最近一个版本的在线模型，用之后新增的数据更新，没有可用的旧版本时返回 None"""
+        row = self._find(target_param, model_type, options, PredictionModel.data_version < version)
+        if row is None:
+            return None
+        try:
+            artifact = joblib.load(os.path.join(model_dir(), row.artifact_path))
+        except (OSError, EOFError, ValueError) as e:
+            print(f"模型文件加载失败 {row.artifact_path}: {e}")
+            return None
+
+        model, meta = artifact['model'], artifact['meta']
+        snapshot = time_series_store.refresh(force=False)
+        end = snapshot.time_range()[1]
+        if end is None or end < meta['trained_until']:
+            # 数据被整体替换或删减，需要重新训练
+            return None
+
+        features = get_recent_features(snapshot, target_param, meta['trained_until'])
+        if features is None or features.feature_names != meta['features']:
+            # 新数据中有值的参数与训练时不同，特征对不上，需要重新训练
+            return None
+        performance, meta, added = update_model(model, json.loads(row.performance_metrics), meta, features)
+
+        filename = artifact_name(target_param, model_type, version, options)
+        joblib.dump({'model': model, 'meta': meta}, os.path.join(model_dir(), filename))
+        self.updates += 1
+        record_id = self._register(target_param, model_type, options, version, filename, performance, meta)
+        print(f"模型增量更新完成: {target_param} {model_type}，数据版本 {version}，"
+              f"新增 {added} 条数据，耗时 {performance['training_time']:.3f} 秒")
+        return TrainedModel(record_id, target_param, model_type, model, performance, meta, version)
+
+    def _train(self, target_param, model_type, version, options):
+        """在当前进程内训练并持久化模型，随机森林使用全部 CPU"""
+        # 刷新时序存储，保证训练数据不早于 version
+        snapshot = time_series_store.refresh(force=False)
+        features = get_feature_set(snapshot, target_param)
+        if features is None:
+            return None
+
+        model, performance, meta = train_model(features, model_type, n_jobs=-1, options=options)
+        if model is None:
+            return None
+
+        filename = artifact_name(target_param, model_type, version, options)
+        joblib.dump({'model': model, 'meta': meta}, os.path.join(model_dir(), filename))
+        return self._finish(target_param, model_type, options, version, filename, model, performance, meta)
+
+    def _train_parallel(self, target_params, model_type, version, options):
+        """在进程池中并行训练多个参数的模型，子进程写入模型文件后在这里加载登记"""
+        snapshot = time_series_store.refresh(force=False)
+        # 子进程需要全部参数来构造特征
+        columns = {param: snapshot.column(field) for param, field in feature_parameters(snapshot).items()}
+        filenames = {target_param: artifact_name(target_param, model_type, version, options)
+                     for target_param in target_params if target_param in columns}
+
+        outcomes = train_parallel(snapshot.timestamps, columns, list(filenames), model_type, options,
+                                  {target_param: os.path.join(model_dir(), filename)
+                                   for target_param, filename in filenames.items()})
+
+        trained = {target_param: None for target_param in target_params}
+        for target_param, outcome in outcomes.items():
+            if outcome is None:
+                continue
+            performance, meta = outcome
+            model = joblib.load(os.path.join(model_dir(), filenames[target_param]))['model']
+            trained[target_param] = self._finish(target_param, model_type, options, version,
+                                                 filenames[target_param], model, performance, meta)
+        return trained
+
+    def _finish(self, target_param, model_type, options, version, filename, model, performance, meta):
+        """登记训练好的模型"""
+        self.trainings += 1
+        record_id = self._register(target_param, model_type, options, version, filename, performance, meta)
+        print(f"模型训练完成: {target_param} {model_type}，数据版本 {version}，"
+              f"{meta['rows']} 条数据，耗时 {performance['training_time']:.2f} 秒")
+        return TrainedModel(record_id, target_param, model_type, model, performance, meta, version)
+
+    def _register(self, target_param, model_type, options, version, filename, performance, meta):
+        """写入 PredictionModel 记录，停用并删除同一模型、同一训练选项的旧版本"""
+        table = PredictionModel.__table__
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.artifact_path, table.c.model_config)
+                .where(table.c.target_parameter == target_param, table.c.model_type == model_type,
+                       table.c.is_active.is_(True))
+            ).all()
+            # 其他训练选项的模型各自保留
+            stale = [row for row in rows if options_match(row.model_config, options)]
+            if stale:
+                conn.execute(update(table).where(table.c.id.in_([row.id for row in stale]))
+                             .values(is_active=False, updated_at=now))
+            record_id = conn.execute(insert(table).values(
+                name=f'{target_param} {model_type}',
+                model_type=model_type,
+                target_parameter=target_param,
+                input_parameters=json.dumps(meta['features']),
+                model_config=json.dumps({
+                    'last_time': pd.Timestamp(meta['last_time']).isoformat(),
+                    'trained_until': pd.Timestamp(meta['trained_until']).isoformat(),
+                    'rows': meta['rows'],
+                    'options': options._asdict(),
+                    'training_seconds': performance['training_time']
+                }),
+                performance_metrics=json.dumps(performance),
+                data_version=version,
+                artifact_path=filename,
+                is_active=True,
+                created_at=now,
+                updated_at=now
+            )).inserted_primary_key[0]
+
+        for row in stale:
+            if row.artifact_path and row.artifact_path != filename:
+                remove_artifact(os.path.join(model_dir(), row.artifact_path))
+        return record_id
+
+    def clear(self):
+        """清空内存中的模型"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            entries = [
+                {'parameter': key[0], 'model_type': key[1], 'options': key[2]._asdict(),
+                 'data_version': entry.data_version}
+                for key, entry in self._entries.items()
+            ]
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'loads': self.loads,
+            'trainings': self.trainings,
+            'updates': self.updates,
+            'evictions': self.evictions
+        }
+
+
+# 全局共享的模型缓存
+model_registry = ModelRegistry()
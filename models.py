@@ -1,12 +1,34 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, func, inspect, literal
+from sqlalchemy.engine import Engine
 from datetime import datetime
+import sqlite3
 import json
 
 
 db = SQLAlchemy()
 
+# SQLite 连接等待写锁的最长时间（毫秒）
+SQLITE_BUSY_TIMEOUT_MS = 30000
+
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """
+    SQLite 连接开启 WAL 日志并设置忙等待
+
+    导入、预警评估线程和接口请求会同时访问数据库，WAL 模式下读不阻塞写，
+    写锁被占用时等待 busy_timeout 而不是立即报 database is locked。
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.close()
+
 class User(UserMixin, db.Model):
     """用户模型"""
     __tablename__ = 'users'
@@ -50,6 +72,44 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+# 源数据表（Excel/CSV）列名与 WaterQualityData 字段的对应关系
+SOURCE_COLUMN_MAP = {
+    'Timestamp': 'timestamp',
+    'Record number': 'record_number',
+    'Average Water Speed': 'average_water_speed',
+    'Average Water Direction': 'average_water_direction',
+    'Chlorophyll': 'chlorophyll',
+    'Chlorophyll [quality]': 'chlorophyll_quality',
+    'Temperature': 'temperature',
+    'Temperature [quality]': 'temperature_quality',
+    'Dissolved Oxygen': 'dissolved_oxygen',
+    'Dissolved Oxygen [quality]': 'dissolved_oxygen_quality',
+    'Dissolved Oxygen (%Saturation)': 'dissolved_oxygen_saturation',
+    'Dissolved Oxygen (%Saturation) [quality]': 'dissolved_oxygen_saturation_quality',
+    'pH': 'ph',
+    'pH [quality]': 'ph_quality',
+    'Salinity': 'salinity',
+    'Salinity [quality]': 'salinity_quality',
+    'Specific Conductance': 'specific_conductance',
+    'Specific Conductance [quality]': 'specific_conductance_quality',
+    'Turbidity': 'turbidity',
+    'Turbidity [quality]': 'turbidity_quality'
+}
+
+# 测量值字段（浮点）
+MEASUREMENT_FIELDS = [
+    'average_water_speed', 'average_water_direction', 'chlorophyll',
+    'temperature', 'dissolved_oxygen', 'dissolved_oxygen_saturation',
+    'ph', 'salinity', 'specific_conductance', 'turbidity'
+]
+
+# 质量码字段（整数），参与数据质量评分
+QUALITY_FIELDS = [
+    'chlorophyll_quality', 'temperature_quality', 'dissolved_oxygen_quality',
+    'dissolved_oxygen_saturation_quality', 'ph_quality', 'salinity_quality',
+    'specific_conductance_quality', 'turbidity_quality'
+]
+
 class WaterQualityData(db.Model):
     """水质监测数据模型"""
     __tablename__ = 'water_quality_data'
@@ -97,7 +157,7 @@ class WaterQualityData(db.Model):
 
     # 元数据
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     def calculate_quality_score(self):
         """计算数据质量评分"""
@@ -143,24 +203,88 @@ class WaterQualityData(db.Model):
     def __repr__(self):
         return f'<WaterQualityData {self.record_number} at {self.timestamp}>'
 
+class WaterQualityRollup(db.Model):
+    """水质数据按小时/日/月的汇总，随数据导入增量维护"""
+    __tablename__ = 'water_quality_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket', 'parameter', name='uq_rollup_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hourly, daily, monthly
+    bucket = db.Column(db.String(16), nullable=False)  # 2024-01-01 05:00 / 2024-01-01 / 2024-01
+    parameter = db.Column(db.String(50), nullable=False)
+    value_count = db.Column(db.Integer, nullable=False)
+    value_sum = db.Column(db.Float, nullable=False)
+    value_sum_sq = db.Column(db.Float, nullable=False)  # 平方和，用于计算标准差
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<WaterQualityRollup {self.granularity} {self.bucket} {self.parameter}>'
+
+
+class WaterQualityComoment(db.Model):
+    """两两参数按日的协矩累加量（只统计两者都有值的记录），用于相关性分析"""
+    __tablename__ = 'water_quality_comoments'
+    __table_args__ = (
+        db.UniqueConstraint('bucket', 'parameter_x', 'parameter_y', name='uq_comoment_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.String(10), nullable=False)  # 2024-01-01
+    parameter_x = db.Column(db.String(50), nullable=False)
+    parameter_y = db.Column(db.String(50), nullable=False)  # 按 MEASUREMENT_FIELDS 顺序排在 parameter_x 之后
+    pair_count = db.Column(db.Integer, nullable=False)
+    sum_x = db.Column(db.Float, nullable=False)
+    sum_y = db.Column(db.Float, nullable=False)
+    sum_xx = db.Column(db.Float, nullable=False)
+    sum_yy = db.Column(db.Float, nullable=False)
+    sum_xy = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<WaterQualityComoment {self.bucket} {self.parameter_x} {self.parameter_y}>'
+
 class DataImportLog(db.Model):
     """数据导入日志"""
     __tablename__ = 'data_import_logs'
 
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, index=True)
     import_type = db.Column(db.String(50), nullable=False)  # excel, csv, manual
+    import_mode = db.Column(db.String(20), default='replace')  # replace, incremental
     records_imported = db.Column(db.Integer, default=0)
     records_skipped = db.Column(db.Integer, default=0)
-    status = db.Column(db.String(20), default='pending')  # pending, success, failed
+    high_water_mark = db.Column(db.Integer, nullable=True)  # 该文件已导入的最大记录号
+    status = db.Column(db.String(20), default='pending')  # pending, running, success, failed
     error_message = db.Column(db.Text, nullable=True)
     imported_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
+    parse_seconds = db.Column(db.Float, nullable=True)  # 读取和清洗耗时
+    write_seconds = db.Column(db.Float, nullable=True)  # 写入数据库耗时
 
     # 关系
     importer = db.relationship('User', backref=db.backref('import_logs', lazy=True))
 
+    @classmethod
+    def get_high_water_mark(cls, filename):
+        """获取某个源文件成功导入过的最大记录号，最近一次全量替换之前的记录不再有效"""
+        last_replace = db.session.query(func.max(cls.started_at)).filter(
+            cls.import_mode == 'replace',
+            cls.status == 'success'
+        ).scalar()
+
+        query = db.session.query(func.max(cls.high_water_mark)).filter(
+            cls.filename == filename,
+            cls.status == 'success'
+        )
+        if last_replace is not None:
+            query = query.filter(cls.started_at >= last_replace)
+        return query.scalar()
+
 class AlertRule(db.Model):
     """预警规则"""
     __tablename__ = 'alert_rules'
@@ -170,11 +294,12 @@ class AlertRule(db.Model):
     parameter = db.Column(db.String(50), nullable=False)  # temperature, dissolved_oxygen, etc.
     operator = db.Column(db.String(10), nullable=False)  # >, <, >=, <=, ==
     threshold = db.Column(db.Float, nullable=False)
-    severity = db.Column(db.String(20), default='warning')  # info, warning, critical
+    severity = db.Column(db.String(20), default='warning')  # info, attention, warning, critical
     is_active = db.Column(db.Boolean, default=True)
     description = db.Column(db.Text, nullable=True)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # 规则变化时重新编译
 
     # 关系
     creator = db.relationship('User', backref=db.backref('alert_rules', lazy=True))
@@ -184,10 +309,10 @@ class AlertEvent(db.Model):
     __tablename__ = 'alert_events'
 
     id = db.Column(db.Integer, primary_key=True)
-    rule_id = db.Column(db.Integer, db.ForeignKey('alert_rules.id'))
-    data_id = db.Column(db.Integer, db.ForeignKey('water_quality_data.id'))
+    rule_id = db.Column(db.Integer, db.ForeignKey('alert_rules.id'), index=True)
+    data_id = db.Column(db.Integer, db.ForeignKey('water_quality_data.id'), index=True)
     parameter_value = db.Column(db.Float, nullable=False)
-    triggered_at = db.Column(db.DateTime, default=datetime.utcnow)
+    triggered_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # 触发预警的数据时间
     is_acknowledged = db.Column(db.Boolean, default=False)
     acknowledged_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     acknowledged_at = db.Column(db.DateTime, nullable=True)
@@ -218,11 +343,13 @@ class PredictionModel(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    model_type = db.Column(db.String(50), nullable=False)  # lstm, arima, prophet, etc.
-    target_parameter = db.Column(db.String(50), nullable=False)
+    model_type = db.Column(db.String(50), nullable=False)  # linear, random_forest, online
+    target_parameter = db.Column(db.String(50), nullable=False, index=True)
     input_parameters = db.Column(db.Text, nullable=False)  # JSON格式存储输入参数
     model_config = db.Column(db.Text, nullable=False)  # JSON格式存储模型配置
     performance_metrics = db.Column(db.Text, nullable=True)  # JSON格式存储性能指标
+    data_version = db.Column(db.Integer, nullable=True)  # 训练时的数据版本号
+    artifact_path = db.Column(db.String(255), nullable=True)  # instance/models 下的模型文件名
     is_active = db.Column(db.Boolean, default=False)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -260,11 +387,60 @@ class SystemSetting(db.Model):
         else:
             return self.value
 
+# 新版本给已有表增加的列 {表名: [列名]}，db.create_all() 只建缺失的表，不会给已存在的表加列
+UPGRADE_COLUMNS = {
+    'data_import_logs': ['import_mode', 'high_water_mark', 'parse_seconds', 'write_seconds'],
+    'alert_rules': ['updated_at'],
+    'prediction_models': ['data_version', 'artifact_path'],
+}
+
+# 新加的列在已有行上的初始值取自同一行的另一列 {(表名, 列名): 来源列名}
+UPGRADE_BACKFILL = {
+    ('alert_rules', 'updated_at'): 'created_at',
+}
+
+
+def upgrade_schema():
+    """
+    升级已有数据库的表结构，可重复执行
+
+    先建缺失的表，再用 ALTER TABLE ADD COLUMN 补上 UPGRADE_COLUMNS 中缺失的列
+    （有固定默认值的列，已有行同时取该默认值；UPGRADE_BACKFILL 中的列从同一行的
+    另一列复制），最后补建缺失的索引。
+    需要在应用上下文中调用。
+    """
+    db.create_all()
+    with db.engine.begin() as conn:
+        quote = conn.dialect.identifier_preparer.quote
+        inspector = inspect(conn)
+        for table_name, names in UPGRADE_COLUMNS.items():
+            existing = {column['name'] for column in inspector.get_columns(table_name)}
+            for name in names:
+                if name in existing:
+                    continue
+                column = db.metadata.tables[table_name].c[name]
+                ddl = (f'ALTER TABLE {quote(table_name)} ADD COLUMN {quote(name)} '
+                       f'{column.type.compile(dialect=conn.dialect)}')
+                if column.default is not None and column.default.is_scalar:
+                    default = literal(column.default.arg, column.type)
+                    ddl += f' DEFAULT {default.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})}'
+                conn.exec_driver_sql(ddl)
+                source = UPGRADE_BACKFILL.get((table_name, name))
+                if source is not None:
+                    conn.exec_driver_sql(f'UPDATE {quote(table_name)} SET {quote(name)} = {quote(source)}')
+                print(f"数据表 {table_name} 已添加列 {name}")
+
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
 def init_db(app):
     """初始化数据库"""
-    db.init_app(app)
+    if 'sqlalchemy' not in app.extensions:
+        db.init_app(app)
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
 
         # 创建默认管理员用户（如果不存在）
         admin = User.query.filter_by(username='admin').first()
@@ -287,6 +463,7 @@ def init_db(app):
             ('default_time_range', '7', 'integer', '默认时间范围（天）'),
             ('alert_check_interval', '300', 'integer', '预警检查间隔（秒）'),
             ('max_upload_size', '50', 'integer', '最大上传文件大小（MB）'),
+            ('data_version', '0', 'integer', '数据版本号，每次导入数据后递增'),
         ]
 
         for key, value, value_type, description in default_settings:
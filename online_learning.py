@@ -0,0 +1,77 @@
+"""
+在线学习模型
+
+带遗忘因子的递推最小二乘（RLS）线性模型：
+- fit() 一次求解指数加权的最小二乘，与从零开始逐行 partial_fit() 的结果相同
+- partial_fit() 只用新增的数据更新系数和逆相关矩阵，耗时与历史长度无关
+遗忘因子小于 1 时越早的数据权重越小，模型能跟上水质的季节变化。
+状态只有系数和 (特征数+1)² 的矩阵，随模型文件一起保存。
+"""
+
+import numpy as np
+
+# 遗忘因子，0.999 约相当于最近 1000 小时的数据
+DEFAULT_FORGETTING = 0.999
+
+# 初始的岭回归正则项
+DEFAULT_RIDGE = 1e-3
+
+
+class RecursiveLeastSquares:
+    """带截距的 RLS 线性回归，接口与 sklearn 的回归模型一致"""
+
+    def __init__(self, forgetting=DEFAULT_FORGETTING, ridge=DEFAULT_RIDGE):
+        self.forgetting = forgetting
+        self.ridge = ridge
+        self.coef_ = None
+        self.intercept_ = 0.0
+        self.P_ = None
+        self.n_samples_seen_ = 0
+
+    @staticmethod
+    def _design(X):
+        X = np.asarray(X, dtype='float64')
+        return np.hstack([X, np.ones((len(X), 1))])
+
+    def fit(self, X, y):
+        """按时间顺序的全部数据一次求解"""
+        Z = self._design(X)
+        y = np.asarray(y, dtype='float64')
+        n, size = Z.shape
+        # 第 i 行的权重为 forgetting^(n-1-i)，先验项同样随时间衰减
+        weights = self.forgetting ** np.arange(n - 1, -1, -1, dtype='float64')
+        A = (Z * weights[:, None]).T @ Z + self.forgetting ** n * self.ridge * np.eye(size)
+        self.P_ = np.linalg.pinv(A, hermitian=True)
+        theta = self.P_ @ ((Z * weights[:, None]).T @ y)
+        self._set_theta(theta)
+        self.n_samples_seen_ = n
+        return self
+
+    def partial_fit(self, X, y):
+        """用新增的数据逐行更新"""
+        Z = self._design(X)
+        y = np.asarray(y, dtype='float64')
+        if self.P_ is None:
+            size = Z.shape[1]
+            self.P_ = np.eye(size) / self.ridge
+            self._set_theta(np.zeros(size))
+        theta = np.append(self.coef_, self.intercept_)
+        P = self.P_
+        for z, target in zip(Z, y):
+            Pz = P @ z
+            gain = Pz / (self.forgetting + z @ Pz)
+            theta = theta + gain * (target - z @ theta)
+            P = (P - np.outer(gain, Pz)) / self.forgetting
+            # 保持对称，避免舍入误差累积
+            P = (P + P.T) / 2
+        self.P_ = P
+        self._set_theta(theta)
+        self.n_samples_seen_ += len(Z)
+        return self
+
+    def _set_theta(self, theta):
+        self.coef_ = theta[:-1]
+        self.intercept_ = float(theta[-1])
+
+    def predict(self, X):
+        return np.asarray(X, dtype='float64') @ self.coef_ + self.intercept_
@@ -0,0 +1,96 @@
+"""
+图表接口的紧凑响应格式与压缩
+
+?format=columnar 时按列返回并行数组，参数名称、单位等元数据只出现一次，
+数值直接取自查询结果或 DataFrame 列，不逐行构造字典。
+响应体按 Accept-Encoding 进行 gzip 或 brotli（安装 brotli 时）压缩。
+"""
+
+import gzip
+from functools import wraps
+
+from flask import request, current_app
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖
+    brotli = None
+
+# 响应格式
+ROW_FORMAT = 'rows'
+COLUMNAR_FORMAT = 'columnar'
+
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def response_format():
+    """当前请求要求的响应格式，查询参数优先，POST 请求也可在 JSON 中指定"""
+    fmt = request.args.get('format')
+    if fmt is None and request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            fmt = body.get('format')
+    return COLUMNAR_FORMAT if fmt == COLUMNAR_FORMAT else ROW_FORMAT
+
+
+def is_columnar():
+    return response_format() == COLUMNAR_FORMAT
+
+
+def rows_to_columns(names, rows):
+    """将查询结果的行元组转置为 {列名: 值列表}"""
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+    return {name: list(values) for name, values in zip(names, columns)}
+
+
+def series_values(series):
+    """pandas Series 转为列表，NaN 转为 None"""
+    if series.isna().any():
+        return series.astype(object).where(series.notna(), None).tolist()
+    return series.tolist()
+
+
+def format_times(series, fmt='%Y-%m-%d %H:%M:%S'):
+    """时间列整体格式化为字符串列表"""
+    return series.dt.strftime(fmt).tolist()
+
+
+def negotiate_encoding():
+    """按 Accept-Encoding 选择压缩方式，不压缩时返回 None"""
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(supported)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compressed_response(view):
+    """
+    按 Accept-Encoding 压缩接口响应
+
+    放在 conditional_response 外层；ETag 已按协商的压缩方式区分，
+    压缩后的响应与未压缩的响应不会共用同一个 ETag。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = current_app.make_response(view(*args, **kwargs))
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or response.is_streamed or
+                'Content-Encoding' in response.headers):
+            return response
+
+        encoding = negotiate_encoding()
+        data = response.get_data()
+        if encoding is None or len(data) < MIN_COMPRESS_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+    return wrapper
@@ -0,0 +1,209 @@
+"""
+预测任务队列
+
+预测请求提交后立即返回任务 ID，训练和外推在有上限的线程池中执行，
+客户端轮询 /api/prediction/jobs/<id> 获取进度和结果：
+- 参数相同且尚未结束的任务只执行一次，重复提交返回同一个任务
+- 成功的结果按 (任务类型, 请求参数, 数据版本号) 缓存，数据版本变化后整体失效
+已结束的任务只保留最近的若干个。
+
+任务状态和结果缓存都保存在进程内存中，应用必须以单进程方式运行（flask run、
+python app.py，或 gunicorn -w 1 --threads N 这类单进程多线程部署）；
+多进程部署时查询进度的请求可能落到没有该任务的进程而返回 404。
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from models import db
+from cache import ResponseCache, get_data_version
+
+# 同时执行的预测任务数
+DEFAULT_JOB_WORKERS = 2
+
+# 排队和执行中的任务上限，超出时拒绝新任务
+DEFAULT_MAX_PENDING_JOBS = 64
+
+# 保留的已结束任务数
+DEFAULT_MAX_FINISHED_JOBS = 200
+
+# 预测结果缓存的条目数和有效期（秒）
+DEFAULT_RESULT_ENTRIES = 64
+DEFAULT_RESULT_TTL = 3600
+
+
+class JobQueueFull(Exception):
+    """排队的任务过多"""
+
+
+class PredictionJob:
+    """一个预测任务的状态：queued、running、succeeded、failed"""
+
+    def __init__(self, kind, key):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = '排队中'
+        self.result = None
+        self.error = None
+        self.cached = False
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def update(self, progress, message):
+        """任务函数通过该回调报告进度（0 到 1）"""
+        self.progress = progress
+        self.message = message
+
+    def succeed(self, result):
+        self.result = result
+        self.status = 'succeeded'
+        self.progress = 1.0
+        self.message = '完成'
+        self.finished_at = datetime.utcnow()
+
+    def fail(self, error):
+        self.error = error
+        self.status = 'failed'
+        self.message = '失败'
+        self.finished_at = datetime.utcnow()
+
+    def to_dict(self, include_result=True):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'message': self.message,
+            'cached': self.cached,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if self.status == 'failed':
+            data['error'] = self.error
+        if include_result and self.status == 'succeeded':
+            data['result'] = self.result
+        return data
+
+
+class PredictionJobQueue:
+    """线程池执行的预测任务队列，负责去重和结果缓存"""
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, max_pending=DEFAULT_MAX_PENDING_JOBS,
+                 max_finished=DEFAULT_MAX_FINISHED_JOBS, result_entries=DEFAULT_RESULT_ENTRIES,
+                 result_ttl=DEFAULT_RESULT_TTL):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.results = ResponseCache(max_entries=result_entries, ttl=result_ttl)
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.failures = 0
+
+    def _get_executor(self):
+        # 需持有锁
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='prediction-job')
+        return self._executor
+
+    def submit(self, app, kind, params, func):
+        """
+        提交任务，返回 PredictionJob
+
+        params 为可哈希的请求参数，与任务类型、数据版本号一起作为去重和缓存的键；
+        func(progress) 在线程池中带应用上下文执行，返回可 JSON 序列化的结果。
+        """
+        version = get_data_version()
+        key = (kind, params, version)
+        cached = self.results.get(key, version)
+
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                self.deduplicated += 1
+                return job
+
+            job = PredictionJob(kind, key)
+            self.submitted += 1
+            if cached is not None:
+                job.cached = True
+                job.succeed(cached)
+                self._remember(job)
+                return job
+
+            if len(self._inflight) >= self.max_pending:
+                raise JobQueueFull('预测任务过多，请稍后再试')
+            self._inflight[key] = job
+            self._remember(job)
+            self._get_executor().submit(self._run, app, job, func, version)
+        return job
+
+    def _run(self, app, job, func, version):
+        job.status = 'running'
+        job.message = '执行中'
+        job.started_at = datetime.utcnow()
+        with app.app_context():
+            try:
+                result = func(job.update)
+            except Exception as e:
+                self.failures += 1
+                print(f"预测任务失败 {job.id}: {e}")
+                job.fail(str(e))
+            else:
+                self.results.set(job.key, result, version)
+                job.succeed(result)
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._inflight.pop(job.key, None)
+                    self._prune()
+
+    def _remember(self, job):
+        # 需持有锁
+        self._jobs[job.id] = job
+        self._prune()
+
+    def _prune(self):
+        """删除超出保留数量的最早结束的任务，需持有锁"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                'workers': self.max_workers,
+                'pending': len(self._inflight),
+                'max_pending': self.max_pending,
+                'jobs': statuses,
+                'submitted': self.submitted,
+                'deduplicated': self.deduplicated,
+                'failures': self.failures,
+                'results': self.results.stats()
+            }
+
+
+# 全局共享的预测任务队列（进程内，见模块说明）
+prediction_jobs = PredictionJobQueue()
@@ -0,0 +1,119 @@
+"""
+原始监测数据的分页读取
+
+按 (timestamp, id) 做键集分页：游标记录上一页最后一行的位置，
+下一页从该位置之后继续读取，借助 timestamp 索引，任意深度的翻页代价相同。
+只查询请求的字段。
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import select, and_, or_
+
+from models import db, WaterQualityData, MEASUREMENT_FIELDS, QUALITY_FIELDS
+from payloads import rows_to_columns
+
+# 可以请求的字段，timestamp 与 id 作为分页位置总会返回
+RECORD_FIELDS = (['record_number'] + MEASUREMENT_FIELDS + QUALITY_FIELDS +
+                 ['data_quality_score', 'is_anomaly', 'anomaly_type', 'created_at', 'updated_at'])
+
+# 每页默认行数与上限
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+
+def parse_fields(value):
+    """解析逗号分隔的字段列表，为空时返回全部字段，含未知字段时抛出 ValueError"""
+    if not value:
+        return list(RECORD_FIELDS)
+    fields = []
+    for field in value.split(','):
+        field = field.strip()
+        if not field or field in fields or field in ('id', 'timestamp'):
+            continue
+        if field not in RECORD_FIELDS:
+            raise ValueError(f'未知的字段: {field}')
+        fields.append(field)
+    return fields
+
+
+def encode_cursor(timestamp, record_id):
+    """将分页位置编码为不透明的游标字符串"""
+    raw = json.dumps([timestamp.isoformat(), record_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (timestamp, id)，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, record_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(record_id)
+    except (ValueError, TypeError):
+        raise ValueError(f'无效的游标: {cursor}')
+
+
+def records_query(fields, start=None, end=None, after=None, descending=False):
+    """
+    构造按 (timestamp, id) 排序的查询，start 闭区间、end 开区间
+
+    after 为 (timestamp, id) 时只返回该位置之后（倒序时为之前）的记录。
+    """
+    table = WaterQualityData.__table__
+    query = select(table.c.id, table.c.timestamp, *[table.c[field] for field in fields])
+    if start is not None:
+        query = query.where(table.c.timestamp >= start)
+    if end is not None:
+        query = query.where(table.c.timestamp < end)
+
+    if after is not None:
+        timestamp, record_id = after
+        if descending:
+            # timestamp <= 条件让 SQLite 直接在索引上定位起点
+            query = query.where(table.c.timestamp <= timestamp, or_(
+                table.c.timestamp < timestamp, and_(table.c.timestamp == timestamp, table.c.id < record_id)))
+        else:
+            query = query.where(table.c.timestamp >= timestamp, or_(
+                table.c.timestamp > timestamp, and_(table.c.timestamp == timestamp, table.c.id > record_id)))
+
+    if descending:
+        return query.order_by(table.c.timestamp.desc(), table.c.id.desc())
+    return query.order_by(table.c.timestamp, table.c.id)
+
+
+def serialize_value(value):
+    """时间转为 ISO 字符串，其余原样返回"""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def fetch_page(fields, start=None, end=None, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False,
+               columnar=False):
+    """
+    读取一页记录
+
+    返回 (记录, 下一页游标)，没有更多数据时游标为 None。
+    记录默认为字典列表，columnar=True 时为 {字段: 值列表}。
+    """
+    limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+    after = decode_cursor(cursor) if cursor else None
+    # 多取一行用于判断是否还有下一页
+    query = records_query(fields, start, end, after, descending).limit(limit + 1)
+
+    with db.engine.connect() as conn:
+        rows = conn.execute(query).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    names = ['id', 'timestamp'] + fields
+    if columnar:
+        data = rows_to_columns(names, rows)
+        data['timestamp'] = [value.isoformat() for value in data['timestamp']]
+        for field in ('created_at', 'updated_at'):
+            if field in data:
+                data[field] = [serialize_value(value) for value in data[field]]
+    else:
+        data = [dict(zip(names, map(serialize_value, row))) for row in rows]
+    next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None
+    return data, next_cursor
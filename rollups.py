@@ -0,0 +1,380 @@
+"""
+小时/日/月汇总表的维护与查询
+
+小时汇总由原始数据聚合，日汇总由小时汇总聚合，月汇总由日汇总聚合。
+两两参数按日的协矩累加量与汇总一起维护，供相关性分析使用。
+每批数据写入后只重算该批时间跨度覆盖到的分组，以及被 upsert 移到其他时间的
+记录原来所在的分组，重算（而不是累加）保证 upsert 修改已有记录后汇总依然正确。
+"""
+
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select, insert, delete, func, literal
+
+from models import db, WaterQualityData, WaterQualityRollup, WaterQualityComoment, MEASUREMENT_FIELDS
+from analytics import BUCKET_FORMATS
+from cache import bump_data_version
+
+# 由细到粗的汇总粒度，后一级由前一级聚合得到
+ROLLUP_GRANULARITIES = ['hourly', 'daily', 'monthly']
+
+# 各粒度分组标签的长度（小时标签截取前10位即为日标签，前7位即为月标签）
+LABEL_LENGTHS = {'hourly': 16, 'daily': 10, 'monthly': 7}
+
+ROLLUP_COLUMNS = ['granularity', 'bucket', 'parameter', 'value_count', 'value_sum',
+                  'value_sum_sq', 'min_value', 'max_value', 'updated_at']
+
+COMOMENT_COLUMNS = ['bucket', 'parameter_x', 'parameter_y', 'pair_count', 'sum_x', 'sum_y',
+                    'sum_xx', 'sum_yy', 'sum_xy', 'updated_at']
+
+# SQLAlchemy 在 SQLite 中存储 DateTime 使用的格式
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def bucket_floor(granularity, value):
+    """时间所在分组的起点"""
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'hourly':
+        return value
+    value = value.replace(hour=0)
+    if granularity == 'daily':
+        return value
+    return value.replace(day=1)
+
+
+def next_bucket(granularity, value):
+    """下一个分组的起点，value 必须是分组起点"""
+    if granularity == 'hourly':
+        return value + timedelta(hours=1)
+    if granularity == 'daily':
+        return value + timedelta(days=1)
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def bucket_label(granularity, value):
+    """时间对应的分组标签，与 SQL 中 strftime 的结果一致"""
+    return value.strftime(BUCKET_FORMATS[granularity])
+
+
+def read_measurements(conn, start, end):
+    """
+    按时间顺序读取 [start, end) 内的原始数据
+
+    返回 (每行的小时标签数组, (行数, 参数数) 的测量值矩阵)，缺失值为 NaN。
+    """
+    table = WaterQualityData.__table__
+    rows = conn.execute(
+        select(func.strftime(BUCKET_FORMATS['hourly'], table.c.timestamp),
+               *[table.c[field] for field in MEASUREMENT_FIELDS])
+        .where(table.c.timestamp >= start, table.c.timestamp < end)
+        .order_by(table.c.timestamp)
+    ).all()
+    labels = np.array([row[0] for row in rows], dtype=f'U{LABEL_LENGTHS["hourly"]}')
+    values = np.array([row[1:] for row in rows], dtype='float64').reshape(len(rows), len(MEASUREMENT_FIELDS))
+    return labels, values
+
+
+def insert_rows(conn, table, columns, rows):
+    """
+    批量写入按 columns 顺序排列的元组
+
+    SQLite 下直接走 DBAPI executemany，省去 Core 对每一行的参数处理，
+    时间列需要事先用 db_timestamp 转换。
+    """
+    if not rows:
+        return
+    if conn.dialect.name == 'sqlite':
+        quote = conn.dialect.identifier_preparer.quote
+        conn.exec_driver_sql(f'INSERT INTO {quote(table.name)} ({", ".join(quote(c) for c in columns)}) '
+                             f'VALUES ({", ".join("?" for _ in columns)})', rows)
+    else:
+        conn.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+
+def db_timestamp(conn, value):
+    """insert_rows 写入的时间值：SQLite 下为 SQLAlchemy DateTime 的存储格式"""
+    return value.strftime(SQLITE_DATETIME_FORMAT) if conn.dialect.name == 'sqlite' else value
+
+
+def group_starts(labels):
+    """已排序的标签数组中每组第一行的下标"""
+    return np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+
+
+def hourly_rows(labels, values, now):
+    """
+    由 read_measurements 的结果计算各小时各参数的汇总
+
+    各参数一起用 reduceat 分组求和，返回按 ROLLUP_COLUMNS 顺序排列的元组列表。
+    """
+    starts = group_starts(labels)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    counts = np.add.reduceat(valid.astype('int64'), starts)
+    sums = np.add.reduceat(filled, starts)
+    squares = np.add.reduceat(filled * filled, starts)
+    minimums = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+    maximums = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+    groups, fields = np.nonzero(counts)
+    columns = [labels[starts[groups]].tolist(), np.array(MEASUREMENT_FIELDS)[fields].tolist()]
+    columns += [array[groups, fields].tolist() for array in (counts, sums, squares, minimums, maximums)]
+    return [('hourly', *row, now) for row in zip(*columns)]
+
+
+def parent_from_child(granularity, child, start, end, now):
+    """由下一级汇总聚合 [start, end) 内的日/月汇总"""
+    rollup = WaterQualityRollup.__table__
+    bucket = func.substr(rollup.c.bucket, 1, LABEL_LENGTHS[granularity])
+    return (
+        select(literal(granularity), bucket, rollup.c.parameter, func.sum(rollup.c.value_count),
+               func.sum(rollup.c.value_sum), func.sum(rollup.c.value_sum_sq),
+               func.min(rollup.c.min_value), func.max(rollup.c.max_value), literal(now))
+        .where(rollup.c.granularity == child,
+               rollup.c.bucket >= bucket_label(child, start),
+               rollup.c.bucket < bucket_label(child, end))
+        .group_by(bucket, rollup.c.parameter)
+    )
+
+
+def comoment_rows(labels, values, now):
+    """
+    由 read_measurements 的结果计算各日各参数对的协矩
+
+    每天用几次矩阵乘法一起算出全部参数对，不必按参数对逐一扫描原始数据。
+    返回按 COMOMENT_COLUMNS 顺序排列的元组列表。
+    """
+    days = labels.astype(f'U{LABEL_LENGTHS["daily"]}')
+    valid = ~np.isnan(values)
+    mask = valid.astype('float64')
+    filled = np.where(valid, values, 0.0)
+    upper_x, upper_y = np.triu_indices(len(MEASUREMENT_FIELDS), 1)
+    starts = group_starts(days)
+    ends = np.r_[starts[1:], len(days)]
+
+    rows = []
+    for start, end in zip(starts, ends):
+        m, v = mask[start:end], filled[start:end]
+        # sums[i, j] 为参数 i 在参数 i、j 都有值的记录上的和，squares 同理
+        counts = (m.T @ m)[upper_x, upper_y]
+        sums = v.T @ m
+        squares = (v * v).T @ m
+        products = (v.T @ v)[upper_x, upper_y]
+        for k in np.flatnonzero(counts):
+            x, y = upper_x[k], upper_y[k]
+            rows.append((str(days[start]), MEASUREMENT_FIELDS[x], MEASUREMENT_FIELDS[y], int(counts[k]),
+                         float(sums[x, y]), float(sums[y, x]), float(squares[x, y]), float(squares[y, x]),
+                         float(products[k]), now))
+    return rows
+
+
+def refresh_rollups(conn, start, end):
+    """
+    重算 [start, end] 时间跨度覆盖到的所有分组
+
+    按整天读取一遍原始数据，在内存中算出小时汇总和日协矩，日、月汇总再由下一级汇总聚合。
+    需要在写入原始数据的同一事务中调用。
+    """
+    rollup = WaterQualityRollup.__table__
+    comoment = WaterQualityComoment.__table__
+    now = datetime.utcnow()
+    lo = bucket_floor('daily', start)
+    hi = next_bucket('daily', bucket_floor('daily', end))
+    labels, values = read_measurements(conn, lo, hi)
+
+    conn.execute(delete(rollup).where(
+        rollup.c.granularity == 'hourly',
+        rollup.c.bucket >= bucket_label('hourly', lo),
+        rollup.c.bucket < bucket_label('hourly', hi)
+    ))
+    conn.execute(delete(comoment).where(
+        comoment.c.bucket >= bucket_label('daily', lo),
+        comoment.c.bucket < bucket_label('daily', hi)
+    ))
+    if len(labels):
+        stamp = db_timestamp(conn, now)
+        insert_rows(conn, rollup, ROLLUP_COLUMNS, hourly_rows(labels, values, stamp))
+        insert_rows(conn, comoment, COMOMENT_COLUMNS, comoment_rows(labels, values, stamp))
+
+    for child, granularity in zip(ROLLUP_GRANULARITIES, ROLLUP_GRANULARITIES[1:]):
+        lo = bucket_floor(granularity, start)
+        hi = next_bucket(granularity, bucket_floor(granularity, end))
+        conn.execute(delete(rollup).where(
+            rollup.c.granularity == granularity,
+            rollup.c.bucket >= bucket_label(granularity, lo),
+            rollup.c.bucket < bucket_label(granularity, hi)
+        ))
+        conn.execute(insert(rollup).from_select(ROLLUP_COLUMNS,
+                                                parent_from_child(granularity, child, lo, hi, now)))
+
+
+def refresh_rollups_at(conn, timestamps):
+    """
+    重算若干时间点所在日期的所有分组
+
+    用于 upsert 把已有记录移到其他时间后，重算记录原来所在的分组。
+    """
+    for day in sorted({bucket_floor('daily', value) for value in timestamps}):
+        refresh_rollups(conn, day, next_bucket('daily', day) - timedelta(microseconds=1))
+
+
+def clear_rollups(conn):
+    """清空全部汇总"""
+    conn.execute(delete(WaterQualityRollup.__table__))
+    conn.execute(delete(WaterQualityComoment.__table__))
+
+
+def rebuild_rollups_in(conn):
+    """在给定事务中根据全部原始数据重建汇总"""
+    table = WaterQualityData.__table__
+    clear_rollups(conn)
+    start, end = conn.execute(select(func.min(table.c.timestamp), func.max(table.c.timestamp))).one()
+    if start is not None:
+        refresh_rollups(conn, start, end)
+
+
+def rebuild_rollups():
+    """根据原始数据重建全部汇总，返回重建后的汇总行数"""
+    with db.engine.begin() as conn:
+        rebuild_rollups_in(conn)
+        bump_data_version(conn)
+        return conn.execute(select(func.count()).select_from(WaterQualityRollup.__table__)).scalar()
+
+
+def ensure_rollups():
+    """已有原始数据但汇总表为空时（如升级后首次启动）重建汇总"""
+    has_rollups = (db.session.query(WaterQualityRollup.id).first() is not None and
+                   db.session.query(WaterQualityComoment.id).first() is not None)
+    has_data = db.session.query(WaterQualityData.id).first() is not None
+    db.session.commit()
+    if has_data and not has_rollups:
+        print("汇总表为空，开始重建...")
+        print(f"汇总重建完成，共 {rebuild_rollups()} 行")
+
+
+def rollup_series(granularity, fields, start=None, end=None, limit=None):
+    """
+    从汇总表读取分组统计
+
+    返回与 [start, end) 有重叠的整个分组；limit 不为空时只返回最近的 limit 个分组。
+    返回 (分组标签列表, {参数: {'count','mean','std','min','max': 列表}})，缺失值为 None。
+    """
+    rollup = WaterQualityRollup.__table__
+    conditions = [rollup.c.granularity == granularity, rollup.c.parameter.in_(fields)]
+    if start is not None:
+        conditions.append(rollup.c.bucket >= bucket_label(granularity, start))
+    if end is not None:
+        conditions.append(rollup.c.bucket <= bucket_label(granularity, end - timedelta(microseconds=1)))
+
+    if limit is not None:
+        recent = db.session.execute(
+            select(rollup.c.bucket).where(*conditions).distinct()
+            .order_by(rollup.c.bucket.desc()).limit(limit)
+        ).scalars().all()
+        if not recent:
+            return [], {field: empty_stats() for field in fields}
+        conditions.append(rollup.c.bucket >= recent[-1])
+
+    rows = db.session.execute(
+        select(rollup.c.bucket, rollup.c.parameter, rollup.c.value_count, rollup.c.value_sum,
+               rollup.c.value_sum_sq, rollup.c.min_value, rollup.c.max_value)
+        .where(*conditions)
+        .order_by(rollup.c.bucket)
+    ).all()
+
+    labels = sorted({row.bucket for row in rows})
+    positions = {label: index for index, label in enumerate(labels)}
+    stats = {field: empty_stats(len(labels)) for field in fields}
+    for row in rows:
+        index = positions[row.bucket]
+        mean = row.value_sum / row.value_count
+        variance = max(row.value_sum_sq / row.value_count - mean * mean, 0.0)
+        field_stats = stats[row.parameter]
+        field_stats['count'][index] = row.value_count
+        field_stats['mean'][index] = mean
+        field_stats['std'][index] = math.sqrt(variance)
+        field_stats['min'][index] = row.min_value
+        field_stats['max'][index] = row.max_value
+    return labels, stats
+
+
+def empty_stats(size=0):
+    """空的分组统计"""
+    return {key: [None] * size for key in ('count', 'mean', 'std', 'min', 'max')}
+
+
+def compare_groups(expected, actual, tolerance):
+    """比对 {键: 数值元组} 两个字典，返回 (键, 说明) 列表"""
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        if key not in actual:
+            mismatches.append((key, '汇总缺失'))
+        elif key not in expected:
+            mismatches.append((key, '多余的汇总'))
+        elif not all(math.isclose(e, a, rel_tol=tolerance, abs_tol=tolerance)
+                     for e, a in zip(expected[key], actual[key])):
+            mismatches.append((key, f'期望 {expected[key]}，实际 {actual[key]}'))
+    return mismatches
+
+
+def check_rollups(tolerance=1e-6):
+    """
+    将各粒度汇总和日协矩与原始数据直接聚合的结果逐组比对
+
+    返回不一致项列表，每项为 (粒度, 分组, 参数, 说明)；协矩的粒度记为 comoment，
+    参数记为 "参数x,参数y"。
+    """
+    table = WaterQualityData.__table__
+    rollup = WaterQualityRollup.__table__
+    comoment = WaterQualityComoment.__table__
+    mismatches = []
+
+    for granularity in ROLLUP_GRANULARITIES:
+        bucket = func.strftime(BUCKET_FORMATS[granularity], table.c.timestamp)
+        expected = {}
+        for field in MEASUREMENT_FIELDS:
+            column = table.c[field]
+            rows = db.session.execute(
+                select(bucket, func.count(column), func.sum(column), func.sum(column * column),
+                       func.min(column), func.max(column))
+                .group_by(bucket).having(func.count(column) > 0)
+            ).all()
+            for label, *values in rows:
+                expected[(label, field)] = tuple(values)
+
+        actual = {}
+        for row in db.session.execute(
+            select(rollup.c.bucket, rollup.c.parameter, rollup.c.value_count, rollup.c.value_sum,
+                   rollup.c.value_sum_sq, rollup.c.min_value, rollup.c.max_value)
+            .where(rollup.c.granularity == granularity)
+        ):
+            actual[(row.bucket, row.parameter)] = tuple(row[2:])
+
+        for (label, field), message in compare_groups(expected, actual, tolerance):
+            mismatches.append((granularity, label, field, message))
+
+    day = func.strftime(BUCKET_FORMATS['daily'], table.c.timestamp)
+    expected = {}
+    for i, field_x in enumerate(MEASUREMENT_FIELDS):
+        for field_y in MEASUREMENT_FIELDS[i + 1:]:
+            x, y = table.c[field_x], table.c[field_y]
+            rows = db.session.execute(
+                select(day, func.count(), func.sum(x), func.sum(y), func.sum(x * x), func.sum(y * y),
+                       func.sum(x * y))
+                .where(x.isnot(None), y.isnot(None))
+                .group_by(day)
+            ).all()
+            for label, *values in rows:
+                expected[(label, f'{field_x},{field_y}')] = tuple(values)
+
+    actual = {}
+    for row in db.session.execute(
+        select(comoment.c.bucket, comoment.c.parameter_x, comoment.c.parameter_y, comoment.c.pair_count,
+               comoment.c.sum_x, comoment.c.sum_y, comoment.c.sum_xx, comoment.c.sum_yy, comoment.c.sum_xy)
+    ):
+        actual[(row.bucket, f'{row.parameter_x},{row.parameter_y}')] = tuple(row[3:])
+
+    for (label, pair), message in compare_groups(expected, actual, tolerance):
+        mismatches.append(('comoment', label, pair, message))
+    return mismatches
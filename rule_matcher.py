@@ -0,0 +1,248 @@
+"""
+预警规则编译与匹配
+
+AlertRule 表中的规则按参数、运算符分组，每组按阈值排序，并预先算好
+"阈值区间内级别最高的规则"的前缀/后缀数组。判断一个值只需对每组做一次
+二分查找（单值用 bisect，整列用 np.searchsorted），与规则数量基本无关。
+规则表有变化时自动重新编译。
+"""
+
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import select, func
+
+from models import db, AlertRule
+
+# 级别越高数值越大，0 表示未触发
+SEVERITY_RANK = {'info': 1, 'attention': 2, 'warning': 3, 'critical': 4}
+
+# 过低类运算符（值小于阈值触发）与过高类运算符
+LOW_OPERATORS = ('<', '<=')
+HIGH_OPERATORS = ('>', '>=')
+
+# 两次检查规则表是否有变化的最小间隔（秒）
+DEFAULT_CHECK_INTERVAL = 5.0
+
+Rule = namedtuple('Rule', ['id', 'parameter', 'operator', 'threshold', 'severity'])
+
+
+def rules_from_config(config):
+    """将 {参数: {级别: {'min': x, 'max': y}}} 格式的配置转换为规则列表"""
+    rules = []
+    for parameter, levels in config.items():
+        for severity, threshold in levels.items():
+            if 'min' in threshold:
+                rules.append(Rule(None, parameter, '<', float(threshold['min']), severity))
+            if 'max' in threshold:
+                rules.append(Rule(None, parameter, '>', float(threshold['max']), severity))
+    return rules
+
+
+class ThresholdGroup:
+    """同一参数、同一运算符的规则，按阈值升序排列"""
+
+    def __init__(self, operator, indexes, thresholds, ranks):
+        order = np.argsort(thresholds, kind='stable')
+        self.operator = operator
+        self.thresholds = np.asarray(thresholds, dtype='float64')[order]
+        self.threshold_list = self.thresholds.tolist()
+        self.indexes = np.asarray(indexes, dtype='int64')[order]
+        ranks = np.asarray(ranks)[order]
+
+        # best[k] 为可匹配规则区间内级别最高的规则下标，-1 表示无匹配；
+        # 同级别时取更极端的阈值（过低取最小阈值，过高取最大阈值）
+        size = len(self.thresholds)
+        best = np.full(size + 1, -1, dtype='int64')
+        if operator in LOW_OPERATORS:
+            # 匹配的是阈值排在 k 之后的全部规则，best[k] 为后缀最优
+            for k in range(size - 1, -1, -1):
+                following = best[k + 1]
+                best[k] = k if following < 0 or ranks[k] >= ranks[following] else following
+        else:
+            # 匹配的是阈值排在 k 之前的全部规则，best[k] 为前缀最优
+            for k in range(1, size + 1):
+                previous = best[k - 1]
+                best[k] = k - 1 if previous < 0 or ranks[k - 1] >= ranks[previous] else previous
+        self.best = np.where(best >= 0, self.indexes[np.maximum(best, 0)], -1)
+        self.best_list = self.best.tolist()
+
+    def position(self, value):
+        """单个值在排序阈值中的位置"""
+        if self.operator == '<':
+            return bisect_right(self.threshold_list, value)
+        if self.operator == '<=':
+            return bisect_left(self.threshold_list, value)
+        if self.operator == '>':
+            return bisect_left(self.threshold_list, value)
+        return bisect_right(self.threshold_list, value)
+
+    def positions(self, values):
+        """整列数据在排序阈值中的位置"""
+        side = 'right' if self.operator in ('<', '>=') else 'left'
+        return np.searchsorted(self.thresholds, values, side=side)
+
+    def match(self, value):
+        """单个值匹配到的最高级别规则下标，-1 表示无匹配"""
+        return self.best_list[self.position(value)]
+
+    def match_array(self, values):
+        """整列数据匹配到的最高级别规则下标数组"""
+        return self.best[self.positions(values)]
+
+
+class CompiledRules:
+    """编译后的全部规则"""
+
+    def __init__(self, rules, fingerprint=None):
+        self.rules = list(rules)
+        self.fingerprint = fingerprint
+        self.ranks = np.array([SEVERITY_RANK.get(rule.severity, 0) for rule in self.rules] + [0], dtype='int8')
+        self.is_low = np.array([rule.operator in LOW_OPERATORS for rule in self.rules] + [False])
+
+        by_parameter = {}
+        for index, rule in enumerate(self.rules):
+            by_parameter.setdefault(rule.parameter, {}).setdefault(rule.operator, []).append(index)
+
+        # 组的顺序决定同级别时的取舍：先过低、后过高，最后是等值
+        self.groups = {}
+        self.equals = {}
+        for parameter, operators in by_parameter.items():
+            groups = []
+            for operator in LOW_OPERATORS + HIGH_OPERATORS:
+                indexes = operators.get(operator)
+                if indexes:
+                    groups.append(ThresholdGroup(operator, indexes, [self.rules[i].threshold for i in indexes],
+                                                 [self.ranks[i] for i in indexes]))
+            self.groups[parameter] = groups
+
+            equals = {}
+            for index in operators.get('==', []):
+                current = equals.get(self.rules[index].threshold)
+                if current is None or self.ranks[index] > self.ranks[current]:
+                    equals[self.rules[index].threshold] = index
+            self.equals[parameter] = equals
+
+        self.level_thresholds = self._level_thresholds()
+
+    def __len__(self):
+        return len(self.rules)
+
+    @property
+    def parameters(self):
+        return list(self.groups.keys())
+
+    def _better(self, current, candidate):
+        """返回级别更高的规则下标，级别相同保留 current"""
+        if candidate < 0:
+            return current
+        if current < 0 or self.ranks[candidate] > self.ranks[current]:
+            return candidate
+        return current
+
+    def classify(self, parameter, value):
+        """单个值匹配到的最高级别规则，没有匹配或值无效时返回 None"""
+        if value is None or value != value:
+            return None
+        best = -1
+        for group in self.groups.get(parameter, []):
+            best = self._better(best, group.match(value))
+        equal = self.equals.get(parameter, {}).get(value)
+        if equal is not None:
+            best = self._better(best, equal)
+        return self.rules[best] if best >= 0 else None
+
+    def classify_array(self, parameter, values):
+        """
+        整列数据匹配到的最高级别规则下标数组
+
+        没有匹配或缺失值为 -1；同级别时按 过低、过高、等值 的顺序取第一个。
+        """
+        values = np.asarray(values, dtype='float64')
+        candidates = [group.match_array(values) for group in self.groups.get(parameter, [])]
+        for threshold, index in self.equals.get(parameter, {}).items():
+            candidates.append(np.where(values == threshold, index, -1))
+        if not candidates:
+            return np.full(len(values), -1, dtype='int64')
+
+        stacked = np.vstack(candidates)
+        best = stacked[self.ranks[stacked].argmax(axis=0), np.arange(len(values))]
+        best[np.isnan(values)] = -1
+        return best
+
+    def _level_thresholds(self):
+        """每个参数、级别的阈值区间，格式与 ALERT_RULES 相同"""
+        config = {}
+        ordered = sorted(self.rules, key=lambda rule: -SEVERITY_RANK.get(rule.severity, 0))
+        for rule in ordered:
+            level = config.setdefault(rule.parameter, {}).setdefault(rule.severity, {})
+            if rule.operator in LOW_OPERATORS:
+                level['min'] = max(level.get('min', rule.threshold), rule.threshold)
+            elif rule.operator in HIGH_OPERATORS:
+                level['max'] = min(level.get('max', rule.threshold), rule.threshold)
+        return config
+
+    def threshold_for(self, rule):
+        """规则所在级别的阈值区间"""
+        return self.level_thresholds[rule.parameter][rule.severity]
+
+
+def load_active_rules():
+    """从 AlertRule 表读取启用的规则"""
+    table = AlertRule.__table__
+    with db.engine.connect() as conn:
+        rows = conn.execute(
+            select(table.c.id, table.c.parameter, table.c.operator, table.c.threshold, table.c.severity)
+            .where(table.c.is_active.is_(True))
+            .order_by(table.c.id)
+        ).all()
+    return [Rule(row.id, row.parameter, row.operator, float(row.threshold), row.severity) for row in rows]
+
+
+class RuleMatcher:
+    """
+    线程安全的规则匹配器
+
+    与时序存储相同，读取方通过 get() 拿到编译好的规则后一直使用；
+    规则表有增删改时重新编译并整体替换引用。
+    """
+
+    def __init__(self, fallback=None, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.fallback = fallback or []
+        self.check_interval = check_interval
+        self._compiled = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def fingerprint(self):
+        """规则表当前的指纹，任意一行增删改都会变化"""
+        table = AlertRule.__table__
+        with db.engine.connect() as conn:
+            row = conn.execute(select(
+                func.count(), func.max(table.c.id), func.max(table.c.updated_at)
+            )).one()
+        return tuple(row)
+
+    def refresh(self, force=True):
+        """重新编译规则；force=False 时只在规则表有变化时编译"""
+        with self._lock:
+            fingerprint = self.fingerprint()
+            self._checked_at = time.monotonic()
+            if not force and self._compiled is not None and self._compiled.fingerprint == fingerprint:
+                return self._compiled
+
+            # 规则表没有任何记录时使用默认配置，保证预警功能可用；
+            # 有记录但全部停用时不产生预警
+            rules = load_active_rules() if fingerprint[0] else self.fallback
+            self._compiled = CompiledRules(rules, fingerprint)
+            return self._compiled
+
+    def get(self):
+        """获取编译好的规则，首次访问或规则表有变化时重新编译"""
+        compiled = self._compiled
+        if compiled is None or time.monotonic() - self._checked_at >= self.check_interval:
+            compiled = self.refresh(force=False)
+        return compiled
@@ -5,6 +5,8 @@ class AlertsCenter {
         this.alertRules = {};
         this.isLoading = false;
         this.refreshInterval = null;
+        this.eventSource = null;
+        this.reloadTimer = null;
         this.filteredAlerts = [];
         this.isFiltered = false;
         this.currentFilter = {};
@@ -15,7 +17,7 @@ class AlertsCenter {
         console.log('🚀 初始化预警监控中心...');
         this.setupEventListeners();
         await this.loadAlertRules();
-        await this.loadHistoricalAlerts();
+        await this.loadAlertEvents();
         this.initCharts();
         this.setupAutoRefresh();
         console.log('✅ 预警监控中心初始化完成');
@@ -34,12 +36,13 @@ class AlertsCenter {
         }
     }
 
-    async loadHistoricalAlerts() {
+    async loadAlertEvents() {
         if (this.isLoading) return;
         this.isLoading = true;
 
         try {
-            const response = await fetch('/api/alerts/historical');
+            // 读取后台评估线程写入的预警事件（最近200条）
+            const response = await fetch('/api/alerts/events?per_page=200');
             const data = await response.json();
             if (data.success) {
                 this.alerts = data.alerts || [];
@@ -48,7 +51,7 @@ class AlertsCenter {
                 this.updateCharts();
             }
         } catch (error) {
-            console.error('❌ 加载历史预警失败:', error);
+            console.error('❌ 加载预警事件失败:', error);
         } finally {
             this.isLoading = false;
         }
@@ -70,8 +73,42 @@ class AlertsCenter {
     }
 
     setupAutoRefresh() {
+        // 优先使用 SSE 推送，不支持时退回到30秒轮询
+        if (window.EventSource) {
+            this.connectStream();
+        } else {
+            this.startPolling();
+        }
+    }
+
+    startPolling() {
+        if (this.refreshInterval) return;
+        this.refreshInterval = setInterval(() => this.loadAlertEvents(), 30000);
+    }
+
+    stopPolling() {
         if (this.refreshInterval) clearInterval(this.refreshInterval);
-        this.refreshInterval = setInterval(() => this.loadHistoricalAlerts(), 30000);
+        this.refreshInterval = null;
+    }
+
+    connectStream() {
+        this.eventSource = new EventSource('/api/stream');
+        const reload = () => this.scheduleReload();
+        this.eventSource.addEventListener('alerts', reload);
+        this.eventSource.addEventListener('readings', reload);
+        this.eventSource.addEventListener('resync', reload);
+        // 连接断开期间临时轮询，重连成功后停止
+        this.eventSource.onerror = () => this.startPolling();
+        this.eventSource.onopen = () => this.stopPolling();
+    }
+
+    scheduleReload() {
+        // 短时间内的多条推送合并为一次刷新
+        if (this.reloadTimer) clearTimeout(this.reloadTimer);
+        this.reloadTimer = setTimeout(() => {
+            this.reloadTimer = null;
+            this.loadAlertEvents();
+        }, 1000);
     }
 
     updateAlertOverview() {
@@ -81,7 +118,7 @@ class AlertsCenter {
             const criticalCount = alertsToCount.filter(a => a.level === 'critical' && a.status === 'active').length;
             const warningCount = alertsToCount.filter(a => a.level === 'warning' && a.status === 'active').length;
             const attentionCount = alertsToCount.filter(a => a.level === 'attention' && a.status === 'active').length;
-            const resolvedCount = alertsToCount.filter(a => a.status === 'resolved').length;
+            const resolvedCount = alertsToCount.filter(a => a.status !== 'active').length;
 
             this.safeUpdateElement('critical-count', criticalCount);
             this.safeUpdateElement('warning-count', warningCount);
@@ -470,11 +507,13 @@ class AlertsCenter {
     }
 
     handleRefresh() {
-        this.loadHistoricalAlerts();
+        this.loadAlertEvents();
     }
 
     destroy() {
-        if (this.refreshInterval) clearInterval(this.refreshInterval);
+        this.stopPolling();
+        if (this.reloadTimer) clearTimeout(this.reloadTimer);
+        if (this.eventSource) this.eventSource.close();
         if (this.trendChart) this.trendChart.dispose();
         if (this.distributionChart) this.distributionChart.dispose();
     }
@@ -4,6 +4,8 @@ class DataStream {
         this.isPlaying = true;
         this.data = [];
         this.currentIndex = 0;
+        this.eventSource = null;
+        this.maxItems = 300;
     }
 
     async init() {
@@ -13,9 +15,41 @@ class DataStream {
         this.setSlowSpeed(); // 关键：初始化时设置速度
         this.startAutoScroll();
         this.updateStats();
+        this.connectStream();
         console.log('✅ 数据流初始化完成');
     }
 
+    connectStream() {
+        // 通过 SSE 接收服务器推送的新数据，不再轮询
+        if (!window.EventSource) return;
+
+        this.eventSource = new EventSource('/api/stream');
+        this.eventSource.addEventListener('readings', (event) => {
+            const payload = JSON.parse(event.data);
+            this.data = payload.data.concat(this.data).slice(0, this.maxItems);
+            this.renderData();
+            this.updateStats();
+            console.log(`📡 收到 ${payload.data.length} 条推送数据`);
+        });
+        // 数据被整体替换或推送积压过多时，重新拉取完整数据
+        this.eventSource.addEventListener('resync', () => this.refreshData());
+        this.eventSource.onerror = () => {
+            const dataStatus = document.getElementById('dataStatus');
+            if (dataStatus) dataStatus.textContent = '重连中';
+        };
+        this.eventSource.onopen = () => {
+            const dataStatus = document.getElementById('dataStatus');
+            if (dataStatus) dataStatus.textContent = '在线';
+        };
+    }
+
+    disconnectStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+
     setSlowSpeed() {
         const streamElement = document.getElementById('dataStream');
         if (streamElement) {
@@ -231,6 +265,7 @@ class Dashboard {
 
     destroy() {
         console.log('🧹 清理仪表盘资源');
+        this.dataStream.disconnectStream();
     }
 }
 
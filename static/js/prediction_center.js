@@ -128,9 +128,12 @@ function setupModelDescription() {
 function updateModelDescription() {
     const modelSelect = document.getElementById('modelSelect');
     const description = document.getElementById('modelDescription');
-    description.textContent = modelSelect.value === 'linear'
-        ? '线性回归：适用于线性趋势预测，计算速度快，适合初步分析'
-        : '随机森林：适用于复杂非线性关系，预测精度高，适合精细分析';
+    const descriptions = {
+        linear: '线性回归：适用于线性趋势预测，计算速度快，适合初步分析',
+        random_forest: '随机森林：适用于复杂非线性关系，预测精度高，适合精细分析',
+        online: '在线学习：新数据到达后只做增量更新，无需重新训练，适合持续接入的监测数据'
+    };
+    description.textContent = descriptions[modelSelect.value] || descriptions.linear;
 }
 
 // 执行预测（合并单参数和多参数）
@@ -161,7 +164,8 @@ async function performPrediction(type) {
         const requestBody = isSingle ? {
             parameter: selectedParams[0],
             model: document.getElementById('modelSelect').value,
-            hours: parseInt(forecastHours)
+            hours: parseInt(forecastHours),
+            window_days: parseInt(document.getElementById('trainingWindow').value) || 0
         } : {
             parameters: selectedParams,
             hours: parseInt(forecastHours)
@@ -173,9 +177,17 @@ async function performPrediction(type) {
             body: JSON.stringify(requestBody)
         });
 
-        const data = await response.json();
+        const submitted = await response.json();
+        if (!response.ok || !submitted.success) {
+            showError('预测失败: ' + (submitted.error || '未知错误'));
+            return;
+        }
 
-        if (response.ok && data.success) {
+        // 预测在后台任务中执行，轮询任务状态直到完成
+        const job = await waitForPredictionJob(submitted.job, submitted.status_url, loadingElement);
+        const data = job.status === 'succeeded' ? job.result : {success: false, error: job.error};
+
+        if (data.success) {
             currentPredictions[type] = data;
             isSingle ? renderSinglePredictionChart(data) : renderMultiPredictionChart(data);
             isSingle ? updatePerformanceMetrics(data.model_performance) : updateMultiPerformanceMetrics(data.results);
@@ -192,6 +204,30 @@ async function performPrediction(type) {
     }
 }
 
+// 轮询预测任务，返回结束（成功或失败）的任务
+async function waitForPredictionJob(job, statusUrl, loadingElement) {
+    const messageElement = loadingElement.querySelector('p');
+    const defaultMessage = messageElement.textContent;
+    let delay = 300;
+    try {
+        while (job.status === 'queued' || job.status === 'running') {
+            messageElement.textContent = `${job.message} (${Math.round(job.progress * 100)}%)`;
+            await new Promise(resolve => setTimeout(resolve, delay));
+            delay = Math.min(delay * 1.5, 2000);
+
+            const response = await fetch(statusUrl);
+            const data = await response.json();
+            if (!response.ok || !data.success) {
+                return {status: 'failed', error: data.error || '任务状态查询失败'};
+            }
+            job = data.job;
+        }
+        return job;
+    } finally {
+        messageElement.textContent = defaultMessage;
+    }
+}
+
 // 渲染单参数预测图表
 function renderSinglePredictionChart(data) {
     const ctx = document.getElementById('singlePredictionChart').getContext('2d');
@@ -297,6 +333,11 @@ function updatePerformanceMetrics(performance) {
     if (performance.r2 > 0.7) r2Element.classList.add('bg-success');
     else if (performance.r2 > 0.5) r2Element.classList.add('bg-warning');
     else r2Element.classList.add('bg-danger');
+
+    // 评估指标来自按时间顺序的回测
+    const windowText = performance.window_days ? `最近 ${performance.window_days} 天` : '全部历史';
+    document.getElementById('trainingInfo').textContent =
+        `训练数据：${windowText}，${performance.rows_used} 个小时样本，训练耗时 ${performance.training_time.toFixed(2)} 秒（指标为按时间顺序回测的结果）`;
 }
 
 // 更新多变量性能指标
@@ -0,0 +1,37 @@
+"""测试公共夹具：使用临时 SQLite 数据库的独立应用"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__, instance_path=str(tmp_path / 'instance'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "test.db"}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def source_frame(record_numbers, timestamps, temperature=None):
+    """构造源列名格式的数据表"""
+    count = len(record_numbers)
+    temperature = temperature if temperature is not None else [20.0 + i for i in range(count)]
+    return pd.DataFrame({
+        'Timestamp': pd.to_datetime(timestamps),
+        'Record number': record_numbers,
+        'Temperature': temperature,
+        'Temperature [quality]': [1000] * count,
+        'pH': [8.0] * count
+    })
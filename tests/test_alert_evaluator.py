@@ -0,0 +1,37 @@
+import pandas as pd
+
+from conftest import source_frame
+from ingest import write_batches
+from alert_evaluator import evaluate_pending, read_checkpoint
+from models import db, AlertEvent, AlertRule, SQLITE_BUSY_TIMEOUT_MS
+
+
+def hourly_times(count):
+    return pd.date_range('2024-01-01 00:00', periods=count, freq='h')
+
+
+def event_levels():
+    """{原始记录 id: 预警级别}"""
+    rows = db.session.query(AlertEvent.data_id, AlertRule.severity).join(AlertRule).all()
+    db.session.commit()
+    return dict(rows)
+
+
+def test_evaluator_only_reads_records_after_the_checkpoint(app):
+    write_batches([source_frame([1, 2, 3], hourly_times(3), temperature=[20.0, 40.0, 8.0])])
+    assert evaluate_pending() == (3, 2)
+    assert event_levels() == {2: 'critical', 3: 'warning'}
+    assert evaluate_pending() == (0, 0)
+
+    # 新增记录和被修改的记录在下一轮评估，修改后的记录先删除旧事件
+    write_batches([source_frame([2, 4], hourly_times(4)[[1, 3]], temperature=[20.0, 4.0])], update_existing=True)
+    assert evaluate_pending(batch_size=1) == (2, 1)
+    assert event_levels() == {3: 'warning', 4: 'critical'}
+    with db.engine.connect() as conn:
+        assert read_checkpoint(conn)[1] == 4
+
+
+def test_sqlite_connections_use_wal_and_busy_timeout(app):
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == SQLITE_BUSY_TIMEOUT_MS
@@ -0,0 +1,112 @@
+import pytest
+from flask import jsonify
+
+import cache
+from cache import ResponseCache, cached_response, conditional_response, bump_data_version, get_data_version
+from models import db
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    monkeypatch.setattr(cache, 'response_cache', ResponseCache())
+    calls = []
+
+    @app.route('/api/values')
+    @cached_response
+    def values():
+        calls.append(1)
+        return jsonify({'success': True, 'calls': len(calls)})
+
+    @app.route('/api/broken')
+    @cached_response
+    def broken():
+        calls.append(1)
+        return jsonify({'success': False, 'error': 'boom'})
+
+    app.calls = calls
+    return app.test_client()
+
+
+def get(app, client, url, **kwargs):
+    """每个请求使用独立的应用上下文（与线上一致），g 中的数据版本号不会跨请求保留"""
+    with app.app_context():
+        return client.get(url, **kwargs)
+
+
+def test_lru_evicts_least_recently_used_entry():
+    store = ResponseCache(max_entries=2)
+    store.set('a', 1, version=0)
+    store.set('b', 2, version=0)
+    assert store.get('a', version=0) == 1
+    store.set('c', 3, version=0)
+
+    assert store.get('b', version=0) is None
+    assert (store.get('a', version=0), store.get('c', version=0)) == (1, 3)
+    assert store.stats()['evictions'] == 1
+
+
+def test_entries_expire_and_newer_version_clears_cache():
+    store = ResponseCache(ttl=0)
+    store.set('a', 1, version=0)
+    assert store.get('a', version=0) is None
+
+    store = ResponseCache()
+    store.set('a', 1, version=0)
+    assert store.get('a', version=1) is None
+    # 旧版本的结果不再写入
+    store.set('a', 1, version=0)
+    assert store.get('a', version=1) is None
+    assert store.stats()['invalidations'] == 1
+
+
+def test_cached_response_is_keyed_by_args_and_invalidated_by_imports(client, app):
+    assert get(app, client, '/api/values?days=7').get_json()['calls'] == 1
+    assert get(app, client, '/api/values?days=7').get_json()['calls'] == 1
+    assert get(app, client, '/api/values?days=30').get_json()['calls'] == 2
+
+    with db.engine.begin() as conn:
+        bump_data_version(conn)
+    assert get_data_version() == 1
+    assert get(app, client, '/api/values?days=7').get_json()['calls'] == 3
+    assert cache.response_cache.stats()['hits'] == 1
+
+
+def test_failed_responses_are_not_cached(client, app):
+    get(app, client, '/api/broken')
+    get(app, client, '/api/broken')
+    assert len(app.calls) == 2
+
+
+def test_matching_etag_returns_304_without_running_the_view(app):
+    calls = []
+
+    @app.route('/api/latest')
+    @conditional_response
+    def latest():
+        calls.append(1)
+        return jsonify({'success': True})
+
+    client = app.test_client()
+    first = get(app, client, '/api/latest')
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+
+    second = get(app, client, '/api/latest', headers={'If-None-Match': etag})
+    assert (second.status_code, second.data, second.headers['ETag']) == (304, b'', etag)
+    assert len(calls) == 1
+
+    with db.engine.begin() as conn:
+        bump_data_version(conn)
+    third = get(app, client, '/api/latest', headers={'If-None-Match': etag})
+    assert third.status_code == 200 and third.headers['ETag'] != etag
+    assert get(app, client, '/api/latest?days=7').headers['ETag'] != third.headers['ETag']
+
+
+def test_failed_responses_get_no_etag(app):
+    @app.route('/api/failing')
+    @conditional_response
+    def failing():
+        return jsonify({'success': False, 'error': 'boom'})
+
+    response = get(app, app.test_client(), '/api/failing')
+    assert 'ETag' not in response.headers
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from correlation import MIN_PAIR_COUNT, cross_correlation, correlation_matrix
+from ingest import write_batches
+from timeseries_store import time_series_store
+
+FIELDS = ['temperature', 'ph', 'salinity']
+
+
+def random_frame(count=120, seed=0):
+    """三天的 20 分钟间隔数据，参数之间相关且带缺失值"""
+    rng = np.random.default_rng(seed)
+    temperature = rng.normal(20, 2, count)
+    ph = 8 + 0.1 * temperature + rng.normal(0, 0.2, count)
+    salinity = 30 - 0.5 * temperature + rng.normal(0, 1, count)
+    for values in (temperature, ph, salinity):
+        values[rng.random(count) < 0.1] = np.nan
+    return pd.DataFrame({
+        'Timestamp': pd.date_range('2024-01-01', periods=count, freq='20min'),
+        'Record number': np.arange(1, count + 1),
+        'Temperature': temperature,
+        'pH': ph,
+        'Salinity': salinity
+    })
+
+
+def pandas_reference(df, start=None, end=None):
+    """pandas 的 pairwise-complete 相关系数（[start, end) 内）"""
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df['Timestamp'] >= start
+    if end is not None:
+        mask &= df['Timestamp'] < end
+    frame = df.loc[mask, ['Temperature', 'pH', 'Salinity']]
+    return frame.corr(min_periods=MIN_PAIR_COUNT).to_numpy()
+
+
+def test_cross_correlation_matches_pandas():
+    df = random_frame(seed=1)
+    matrix = df[['Temperature', 'pH', 'Salinity']].to_numpy()
+    corr, count = cross_correlation(matrix, matrix)
+
+    np.testing.assert_allclose(corr, pandas_reference(df), rtol=1e-10)
+    assert count[0, 1] == (df['Temperature'].notna() & df['pH'].notna()).sum()
+
+
+@pytest.mark.parametrize('start, end, source', [
+    (None, None, 'comoments'),
+    (datetime(2024, 1, 2), datetime(2024, 1, 3), 'comoments'),
+    (datetime(2024, 1, 1, 6), datetime(2024, 1, 2, 18, 30), 'snapshot'),
+])
+def test_correlation_matrix_matches_pandas(app, start, end, source):
+    df = random_frame()
+    write_batches([df])
+    time_series_store.refresh()
+
+    corr, _, used = correlation_matrix(FIELDS, start, end)
+    assert used == source
+    np.testing.assert_allclose(corr, pandas_reference(df, start, end), rtol=1e-8)
+
+
+def test_lagged_correlation_shifts_the_second_series(app):
+    df = random_frame(count=240)
+    write_batches([df])
+    time_series_store.refresh()
+
+    corr, _, used = correlation_matrix(FIELDS, lag=2)
+    hourly = df.set_index('Timestamp')[['Temperature', 'pH', 'Salinity']].resample('h').mean()
+    expected = hourly['Temperature'].corr(hourly['pH'].shift(-2), min_periods=MIN_PAIR_COUNT)
+    assert used == 'snapshot'
+    assert corr[0, 1] == pytest.approx(expected, rel=1e-10)
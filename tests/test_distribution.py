@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from distribution import describe, parse_percentiles
+
+
+def test_describe_matches_numpy():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(20, 3, (500, 3))
+    matrix[rng.random((500, 3)) < 0.2] = np.nan
+    matrix[:, 2] = np.nan
+    matrix[:3, 2] = 5.0
+
+    stats = describe(matrix, percentiles=[5, 50, 99.9], bins=10)
+    for column in range(2):
+        values = matrix[~np.isnan(matrix[:, column]), column]
+        result = stats[column]
+        assert result['count'] == len(values)
+        assert (result['min'], result['max']) == (values.min(), values.max())
+        assert result['mean'] == pytest.approx(values.mean())
+        assert result['std'] == pytest.approx(values.std())
+        assert list(result['percentiles'].values()) == pytest.approx(np.percentile(values, [5, 50, 99.9]))
+        counts, edges = np.histogram(values, bins=10)
+        assert result['histogram']['counts'] == counts.tolist()
+        assert result['histogram']['edges'] == pytest.approx(edges)
+
+    # 只有一个取值时为单个分箱
+    assert stats[2]['histogram'] == {'edges': [4.5, 5.5], 'counts': [3]}
+    assert stats[2]['std'] == 0.0
+
+
+def test_empty_columns_have_no_statistics():
+    [result] = describe(np.full((4, 1), np.nan))
+    assert result['count'] == 0 and result['mean'] is None
+    assert describe(np.empty((0, 2)))[1]['percentiles']['p50'] is None
+
+
+def test_parse_percentiles():
+    assert parse_percentiles('5, 50,99.9') == [5.0, 50.0, 99.9]
+    assert parse_percentiles('') == [5, 25, 50, 75, 95]
+    with pytest.raises(ValueError):
+        parse_percentiles('120')
+    with pytest.raises(ValueError):
+        parse_percentiles('a,b')
@@ -0,0 +1,67 @@
+import numpy as np
+
+from downsample import lttb_indices, minmax_indices, downsample_indices
+
+
+def reference_lttb(x, y, points):
+    """逐桶循环的 LTTB，桶的划分与 lttb_indices 相同"""
+    size = len(x)
+    edges = np.floor(np.linspace(1, size - 1, points - 1)).astype('int64')
+    selected = [0]
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_lo, next_hi = edges[bucket + 1], edges[bucket + 2]
+            mean_x, mean_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        else:
+            mean_x, mean_y = x[-1], y[-1]
+        a = selected[-1]
+        areas = [abs((x[a] - mean_x) * (y[i] - y[a]) - (x[a] - x[i]) * (mean_y - y[a])) for i in range(lo, hi)]
+        selected.append(lo + int(np.argmax(areas)))
+    return selected + [size - 1]
+
+
+def test_lttb_matches_reference():
+    rng = np.random.default_rng(0)
+    for size, points in ((50, 10), (1000, 37), (1001, 100)):
+        x = np.cumsum(rng.uniform(0.5, 1.5, size))
+        y = np.cumsum(rng.normal(size=size))
+        indices = lttb_indices(x, y, points)
+        assert len(indices) == points
+        assert indices.tolist() == reference_lttb(x, y, points)
+
+
+def test_minmax_keeps_bucket_extremes():
+    rng = np.random.default_rng(1)
+    size, points = 1000, 42
+    y = rng.normal(size=size)
+    y[500] = 100.0
+    y[700] = -100.0
+    indices = minmax_indices(np.arange(size, dtype='float64'), y, points)
+
+    assert len(indices) <= points
+    assert np.all(np.diff(indices) > 0)
+    assert {0, size - 1, 500, 700} <= set(indices.tolist())
+
+    buckets = (points - 2) // 2
+    ids = np.arange(size) * buckets // size
+    for bucket in range(buckets):
+        members = np.flatnonzero(ids == bucket)
+        assert members[y[members].argmin()] in indices
+        assert members[y[members].argmax()] in indices
+
+
+def test_downsample_skips_missing_values():
+    timestamps = (np.arange(500, dtype='int64') * 60 + 1_700_000_000) * 10 ** 9
+    values = np.sin(np.arange(500) / 10.0)
+    values[::7] = np.nan
+    valid = np.flatnonzero(~np.isnan(values))
+
+    for method in ('lttb', 'minmax'):
+        indices = downsample_indices(timestamps, values, points=50, method=method)
+        assert np.all(np.diff(indices) > 0)
+        assert not np.isnan(values[indices]).any()
+        assert indices[0] == valid[0] and indices[-1] == valid[-1]
+
+    # 点数不超过目标时原样返回全部有效点
+    assert downsample_indices(timestamps[:20], values[:20], points=50).tolist() == valid[valid < 20].tolist()
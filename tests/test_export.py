@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from conftest import source_frame
+from ingest import write_batches
+from export import check_format, csv_value, export_records, export_predictions
+
+TIMES = ['2024-01-01 00:00:00', '2024-01-01 01:00:00']
+
+
+def read_csv(chunks):
+    return list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+
+
+def test_export_records_streams_every_batch(app):
+    write_batches([source_frame([1, 2, 3], pd.date_range('2024-01-01', periods=3, freq='h'))])
+
+    rows = read_csv(export_records('csv', ['temperature', 'ph'], batch_size=2))
+    assert rows[0] == ['id', 'timestamp', 'temperature', 'ph']
+    assert [row[1:3] for row in rows[1:]] == [['2024-01-01 00:00:00', '20.0'], ['2024-01-01 01:00:00', '21.0'],
+                                              ['2024-01-01 02:00:00', '22.0']]
+
+    lines = b''.join(export_records('ndjson', ['temperature'], end=datetime(2024, 1, 1, 2))).splitlines()
+    assert [json.loads(line)['timestamp'] for line in lines] == ['2024-01-01T00:00:00', '2024-01-01T01:00:00']
+
+
+def test_csv_times_have_seconds_precision():
+    assert csv_value(datetime(2024, 1, 1, 8, 30, 15, 123456)) == '2024-01-01 08:30:15'
+    assert csv_value(None) == ''
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_prediction_export_accepts_row_and_columnar_results(columnar):
+    def predictions(values):
+        if columnar:
+            return {'time': TIMES, 'value': values}
+        return [{'time': time, 'value': value} for time, value in zip(TIMES, values)]
+
+    single = {'single': {'predictions': predictions([7.5, 7.6])}}
+    assert read_csv(export_predictions('csv', single)) == [
+        ['Time', 'Predicted_Value'], [TIMES[0], '7.5'], [TIMES[1], '7.6']]
+
+    multi = {'multi': {'results': {'ph': {'predictions': predictions([7.5, 7.6])},
+                                   'temperature': {'predictions': predictions([20.0, 21.0])}}}}
+    assert read_csv(export_predictions('csv', multi)) == [
+        ['Time', 'ph', 'temperature'], [TIMES[0], '7.5', '20.0'], [TIMES[1], '7.6', '21.0']]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        check_format('xlsx')
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from features import HISTORY_HOURS, build_feature_set, hourly_frame, recursive_forecast
+from forecasting import train_model
+from model_registry import ModelRegistry
+from conftest import source_frame
+from ingest import write_batches
+from timeseries_store import time_series_store
+
+
+def hourly_data(hours=24 * 5):
+    times = pd.date_range('2024-01-01', periods=hours, freq='h')
+    cycle = np.sin(2 * np.pi * times.hour / 24)
+    columns = {
+        'Temperature': 20 + 3 * cycle,
+        'Salinity': 30 - cycle,
+        'Turbidity': np.full(hours, np.nan)
+    }
+    return times, columns
+
+
+def test_parameters_without_data_are_not_features():
+    times, columns = hourly_data()
+    features = build_feature_set(hourly_frame(times.as_unit('ns').asi8, columns), 'Temperature')
+
+    assert features is not None
+    assert 'Salinity_mean_24' in features.feature_names
+    assert not any(name.startswith('Turbidity') for name in features.feature_names)
+    # 只有最开始构造滞后特征所需的小时被丢弃
+    assert len(features.y) == len(times) - HISTORY_HOURS
+    assert not np.isnan(features.X).any()
+
+    model, _, meta = train_model(features, 'linear')
+    predictions = recursive_forecast(model, meta['state'], 6)
+    assert np.isfinite(predictions).all()
+
+
+def test_registry_trains_when_some_parameters_were_never_measured(app):
+    # source_frame 只有温度和 pH，其余预测参数完全没有数据
+    times = pd.date_range('2024-01-01', periods=24 * 5, freq='h')
+    temperature = 20 + 3 * np.sin(2 * np.pi * times.hour / 24)
+    write_batches([source_frame(list(range(1, len(times) + 1)), times, temperature=temperature)])
+    time_series_store.refresh()
+
+    trained = ModelRegistry().get('Temperature', 'linear')
+    assert trained is not None
+    assert trained.meta['rows'] == len(times) - HISTORY_HOURS
+
+
+def test_online_model_is_retrained_when_the_feature_layout_changes(app):
+    times = pd.date_range('2024-01-01', periods=24 * 6, freq='h')
+    temperature = 20 + 3 * np.sin(2 * np.pi * times.hour / 24)
+    records = list(range(1, len(times) + 1))
+    write_batches([source_frame(records[:120], times[:120], temperature=temperature[:120])])
+    time_series_store.refresh()
+    registry = ModelRegistry()
+    assert registry.get('Temperature', 'online') is not None
+
+    # 之后的数据开始测量盐度，特征比训练时多一列
+    df = source_frame(records[120:], times[120:], temperature=temperature[120:])
+    df['Salinity'] = 30.0
+    write_batches([df])
+    time_series_store.refresh()
+    retrained = registry.get('Temperature', 'online')
+    assert (registry.updates, registry.trainings) == (0, 2)
+    assert 'Salinity_mean_24' in retrained.meta['features']
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecasting import (TEST_FRACTION, TrainingOptions, backtest_splits, parse_training_options,
+                         prepare_prediction_data, train_model, training_rows)
+
+
+@pytest.mark.parametrize('count, folds', [(100, 1), (100, 4), (1000, 10), (37, 3)])
+def test_backtest_splits_are_contiguous_and_time_ordered(count, folds):
+    splits = backtest_splits(count, folds)
+    assert len(splits) == folds
+    assert splits[-1][1] == count
+    for (start, end), (next_start, _) in zip(splits, splits[1:]):
+        assert start < end == next_start
+    # 回测段只覆盖最后 TEST_FRACTION 的样本，每段之前都有训练数据
+    assert splits[0][0] >= count - int(count * TEST_FRACTION) - folds
+    assert splits[0][0] > 0
+
+
+def test_backtest_single_fold_holds_out_the_tail():
+    assert backtest_splits(100, 1) == [(80, 100)]
+
+
+def feature_set(days=10):
+    times = pd.date_range('2024-01-01', periods=24 * days, freq='h')
+    rng = np.random.default_rng(0)
+    temperature = 20 + 3 * np.sin(2 * np.pi * times.hour / 24) + rng.normal(0, 0.1, len(times))
+    return prepare_prediction_data('Temperature', times.as_unit('ns').asi8, {'Temperature': temperature})
+
+
+def test_training_rows_respect_window_and_stride():
+    features = feature_set()
+    rows = training_rows(features, TrainingOptions(window_days=2, stride=3, backtest_folds=1))
+    assert rows[-1] == len(features.y) - 1
+    assert np.all(np.diff(rows) == 3)
+    assert features.hours[-1] - features.hours[rows[0]] <= pd.Timedelta(days=2)
+
+
+def test_train_model_reports_each_backtest_fold():
+    features = feature_set()
+    options = TrainingOptions(window_days=0, stride=1, backtest_folds=4)
+    model, performance, meta = train_model(features, 'linear', options=options)
+
+    folds = performance['folds']
+    assert len(folds) == 4 and performance['rows_used'] == meta['rows'] == len(features.y)
+    starts = [pd.Timestamp(fold['start']) for fold in folds]
+    assert starts == sorted(starts) and starts[0] > features.hours[0]
+    assert sum(fold['rows'] for fold in folds) == 4 * (int(len(features.y) * TEST_FRACTION) // 4)
+    assert performance['r2'] > 0.9
+
+
+def test_too_few_rows_are_not_trained():
+    features = feature_set(days=2)
+    assert train_model(features, 'linear', options=TrainingOptions(0, 24, 1)) == (None, None, None)
+
+
+def test_training_options_are_validated():
+    assert parse_training_options({}) == TrainingOptions(180, 1, 1)
+    for data in ({'window_days': -1}, {'stride': 0}, {'backtest_folds': 11}):
+        with pytest.raises(ValueError):
+            parse_training_options(data)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from conftest import source_frame
+from ingest import prepare_frame, write_batches
+from models import WaterQualityData, QUALITY_FIELDS
+from rollups import check_rollups
+
+
+def stored():
+    """{记录号: (时间, 温度)}"""
+    return {row.record_number: (row.timestamp, row.temperature) for row in WaterQualityData.query.all()}
+
+
+def hourly_times(count, start='2024-01-01 00:00'):
+    return pd.date_range(start, periods=count, freq='h')
+
+
+def test_prepare_frame_drops_invalid_rows_and_scores_quality():
+    df = pd.DataFrame({
+        'Timestamp': ['2024-01-01 00:00:00', 'not a time', '2024-01-01 01:00:00', '2024-01-01 02:00:00'],
+        'Record number': [1, 2, None, 4],
+        'Temperature': [20.5, 21.0, 22.0, 'bad'],
+        'Temperature [quality]': [1000, 1000, 1000, None],
+        'pH [quality]': [500, None, None, None]
+    })
+    frame, skipped = prepare_frame(df)
+
+    assert skipped == 2
+    assert frame['record_number'].tolist() == [1, 4]
+    assert frame['timestamp'].tolist() == [pd.Timestamp('2024-01-01 00:00'), pd.Timestamp('2024-01-01 02:00')]
+    assert frame['temperature'].iloc[0] == 20.5 and np.isnan(frame['temperature'].iloc[1])
+    # 评分与逐行计算的 WaterQualityData.calculate_quality_score 一致
+    for row in frame.itertuples():
+        record = WaterQualityData(**{field: (None if pd.isna(getattr(row, field)) else getattr(row, field))
+                                     for field in QUALITY_FIELDS})
+        assert row.data_quality_score == record.calculate_quality_score()
+
+
+def test_upsert_skips_unchanged_and_updates_changed_rows(app):
+    df = source_frame([1, 2, 3], hourly_times(3))
+    assert write_batches([df])['imported'] == 3
+
+    stats = write_batches([df])
+    assert (stats['imported'], stats['skipped']) == (0, 3)
+
+    changed = source_frame([1, 2, 3], hourly_times(3), temperature=[20.0, 25.5, 22.0])
+    stats = write_batches([changed])
+    assert (stats['imported'], stats['skipped']) == (1, 2)
+    assert stored()[2][1] == 25.5
+    assert WaterQualityData.query.count() == 3
+
+
+
+def test_duplicate_record_numbers_keep_the_last_row(app):
+    df = source_frame([1, 1, 2], hourly_times(3), temperature=[10.0, 11.0, 12.0])
+    stats = write_batches([df])
+    assert (stats['imported'], stats['skipped']) == (2, 1)
+    assert stored()[1][1] == 11.0
+
+
+def test_high_water_mark_only_writes_newer_records(app):
+    write_batches([source_frame([1, 2, 3], hourly_times(3))])
+
+    df = source_frame([2, 3, 4, 5], hourly_times(4, '2024-01-01 01:00'), temperature=[99.0, 99.0, 30.0, 31.0])
+    stats = write_batches([df], high_water_mark=3)
+    assert (stats['imported'], stats['skipped'], stats['max_record_number']) == (2, 2, 5)
+    # 不回写历史数据时，记录号不超过最大记录号的行保持原值
+    assert stored()[2][1] == 21.0
+    assert sorted(stored()) == [1, 2, 3, 4, 5]
+
+
+def test_update_existing_ignores_the_high_water_mark(app):
+    write_batches([source_frame([1, 2, 3], hourly_times(3))])
+
+    df = source_frame([2, 3], hourly_times(2, '2024-01-01 01:00'), temperature=[99.0, 22.0])
+    stats = write_batches([df], high_water_mark=3, update_existing=True)
+    assert (stats['imported'], stats['skipped']) == (1, 1)
+    assert stored()[2][1] == 99.0
+
+
+def test_replace_clears_existing_rows(app):
+    write_batches([source_frame([1, 2, 3], hourly_times(3))])
+    stats = write_batches([source_frame([10, 11], hourly_times(2, '2024-02-01'))], mode='replace')
+    assert stats['imported'] == 2
+    assert sorted(stored()) == [10, 11]
+    assert check_rollups() == []
@@ -0,0 +1,77 @@
+import json
+
+import pandas as pd
+
+from conftest import source_frame
+from ingest import write_batches
+from live_stream import Broadcaster, Subscriber, RESYNC_MESSAGE
+
+
+def hourly_times(count, start='2024-01-01 00:00'):
+    return pd.date_range(start, periods=count, freq='h')
+
+
+def received(subscriber):
+    """取出队列中的全部消息，返回 [(事件名, 数据)]"""
+    messages = []
+    while not subscriber.queue.empty():
+        lines = subscriber.queue.get_nowait().strip().split('\n')
+        messages.append((lines[0][len('event: '):], json.loads(lines[1][len('data: '):])))
+    return messages
+
+
+def connected(broadcaster):
+    """不启动轮询线程，直接注册一个连接并从当前位置开始推送"""
+    subscriber = Subscriber(broadcaster.queue_size)
+    broadcaster._subscribers.add(subscriber)
+    broadcaster._reset_positions()
+    return subscriber
+
+
+def test_slow_subscriber_gets_a_single_resync():
+    subscriber = Subscriber(queue_size=2)
+    for index in range(5):
+        subscriber.send(f'event: readings\ndata: {index}\n\n')
+    assert list(subscriber.queue.queue) == [RESYNC_MESSAGE]
+    assert subscriber.dropped == 4
+
+
+def test_poll_pushes_new_readings_once(app):
+    write_batches([source_frame([1, 2], hourly_times(2))])
+    broadcaster = Broadcaster()
+    subscriber = connected(broadcaster)
+
+    broadcaster.poll()
+    assert received(subscriber) == []
+
+    write_batches([source_frame([3], hourly_times(1, '2024-01-01 02:00'), temperature=[30.0])])
+    broadcaster.poll()
+    [(event, data)] = received(subscriber)
+    assert event == 'readings'
+    assert {(item['parameter'], item['value'], item['status']) for item in data['data']} == {
+        ('温度', 30.0, 'warning'), ('pH值', 8.0, 'normal')}
+
+    broadcaster.poll()
+    assert received(subscriber) == []
+
+
+def test_replace_import_sends_resync(app):
+    write_batches([source_frame([1, 2], hourly_times(2))])
+    broadcaster = Broadcaster()
+    subscriber = connected(broadcaster)
+
+    write_batches([source_frame([5, 6], hourly_times(2, '2024-02-01'))], mode='replace')
+    broadcaster.poll()
+    assert received(subscriber) == [('resync', {})]
+
+
+def test_stream_sends_heartbeats_and_unsubscribes_on_close():
+    broadcaster = Broadcaster(heartbeat_interval=0.01)
+    subscriber = Subscriber()
+    broadcaster._subscribers.add(subscriber)
+    stream = broadcaster.stream(subscriber)
+
+    assert next(stream).startswith('retry: ')
+    assert next(stream) == ': heartbeat\n\n'
+    stream.close()
+    assert broadcaster.stats()['subscribers'] == 0
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import source_frame
+from ingest import write_batches
+from forecasting import PREDICTION_PARAMETERS
+from models import PredictionModel
+from model_registry import ModelRegistry, model_dir
+from timeseries_store import time_series_store
+
+
+def import_hours(start, count, first_record):
+    """按小时写入带日周期的数据，全部预测参数都有值"""
+    times = pd.date_range(start, periods=count, freq='h')
+    cycle = np.sin(2 * np.pi * times.hour / 24)
+    df = source_frame(list(range(first_record, first_record + count)), times, temperature=20 + 3 * cycle)
+    for offset, param in enumerate(PREDICTION_PARAMETERS):
+        if param not in df.columns:
+            df[param] = 10 + offset + cycle
+    write_batches([df])
+    time_series_store.refresh()
+
+
+def active_models():
+    return PredictionModel.query.filter_by(is_active=True).all()
+
+
+def test_models_are_reused_loaded_and_retrained_per_data_version(app):
+    import_hours('2024-01-01', 24 * 5, 1)
+    registry = ModelRegistry()
+
+    trained = registry.get('Temperature', 'linear')
+    assert trained is not None and registry.trainings == 1
+    [record] = active_models()
+    assert record.data_version == trained.data_version
+    assert os.path.exists(os.path.join(model_dir(), record.artifact_path))
+
+    assert registry.get('Temperature', 'linear') is trained
+    assert registry.hits == 1
+
+    # 进程重启后从模型文件加载，不重新训练
+    restarted = ModelRegistry()
+    loaded = restarted.get('Temperature', 'linear')
+    assert (restarted.loads, restarted.trainings, loaded.record_id) == (1, 0, trained.record_id)
+
+    # 新的数据版本重新训练，旧版本停用并删除模型文件
+    import_hours('2024-01-06', 24, 24 * 5 + 1)
+    retrained = registry.get('Temperature', 'linear')
+    assert retrained.data_version == trained.data_version + 1
+    [current] = active_models()
+    assert current.id == retrained.record_id
+    assert not os.path.exists(os.path.join(model_dir(), record.artifact_path))
+
+
+def test_unknown_parameter_returns_none(app):
+    import_hours('2024-01-01', 24 * 5, 1)
+    assert ModelRegistry().get('Unknown', 'linear') is None
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecasting import DEFAULT_TRAINING_OPTIONS, prepare_prediction_data, train_model, update_model
+from online_learning import RecursiveLeastSquares
+
+
+def regression_data(rows=300, features=4, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, features))
+    y = X @ rng.normal(size=features) + 0.5 + rng.normal(scale=0.1, size=rows)
+    return X, y
+
+
+@pytest.mark.parametrize('forgetting', [1.0, 0.99])
+def test_rls_fit_equals_incremental_partial_fit(forgetting):
+    X, y = regression_data()
+    batch = RecursiveLeastSquares(forgetting=forgetting).fit(X, y)
+    online = RecursiveLeastSquares(forgetting=forgetting).partial_fit(X, y)
+
+    np.testing.assert_allclose(online.coef_, batch.coef_, rtol=1e-6, atol=1e-8)
+    assert online.intercept_ == pytest.approx(batch.intercept_, rel=1e-6, abs=1e-8)
+    np.testing.assert_allclose(online.P_, batch.P_, rtol=1e-5, atol=1e-10)
+    assert online.n_samples_seen_ == batch.n_samples_seen_ == len(X)
+
+
+def test_rls_fit_then_partial_fit_equals_fit_on_all_rows():
+    X, y = regression_data(seed=1)
+    split = 200
+    model = RecursiveLeastSquares().fit(X[:split], y[:split]).partial_fit(X[split:], y[split:])
+    full = RecursiveLeastSquares().fit(X, y)
+
+    np.testing.assert_allclose(model.coef_, full.coef_, rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(model.predict(X[:5]), full.predict(X[:5]), rtol=1e-6)
+
+
+def test_update_model_matches_training_on_all_hours():
+    times = pd.date_range('2024-01-01', periods=24 * 8, freq='h')
+    rng = np.random.default_rng(2)
+    columns = {'Temperature': 20 + 3 * np.sin(2 * np.pi * times.hour / 24) + rng.normal(0, 0.1, len(times)),
+               'Salinity': 30 + rng.normal(0, 1, len(times))}
+    timestamps = times.as_unit('ns').asi8
+    split = 24 * 6
+
+    model, performance, meta = train_model(prepare_prediction_data('Temperature', timestamps[:split], {
+        name: values[:split] for name, values in columns.items()}), 'online')
+    features = prepare_prediction_data('Temperature', timestamps, columns)
+    performance, meta, added = update_model(model, performance, meta, features)
+
+    full, _, full_meta = train_model(features, 'online', options=DEFAULT_TRAINING_OPTIONS)
+    assert added == 48 and meta['rows'] == full_meta['rows']
+    assert meta['trained_until'] == features.hours[-1]
+    np.testing.assert_allclose(model.predict(features.X[-5:]), full.predict(features.X[-5:]), rtol=1e-6)
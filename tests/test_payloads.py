@@ -0,0 +1,60 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask, jsonify
+
+from payloads import (compressed_response, is_columnar, rows_to_columns, series_values, format_times,
+                      MIN_COMPRESS_SIZE)
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route('/big')
+    @compressed_response
+    def big():
+        return jsonify({'values': list(range(MIN_COMPRESS_SIZE))})
+
+    @app.route('/small')
+    @compressed_response
+    def small():
+        return jsonify({'values': [1]})
+
+    return app.test_client()
+
+
+def test_columnar_format_from_query_or_json_body():
+    app = Flask(__name__)
+    with app.test_request_context('/?format=columnar'):
+        assert is_columnar()
+    with app.test_request_context('/', method='POST', json={'format': 'columnar'}):
+        assert is_columnar()
+    with app.test_request_context('/?format=other'):
+        assert not is_columnar()
+
+
+def test_column_helpers():
+    assert rows_to_columns(['a', 'b'], [(1, 2), (3, 4)]) == {'a': [1, 3], 'b': [2, 4]}
+    assert rows_to_columns(['a', 'b'], []) == {'a': [], 'b': []}
+    assert series_values(pd.Series([1.5, np.nan])) == [1.5, None]
+    assert format_times(pd.Series(pd.to_datetime(['2024-01-01 08:30']))) == ['2024-01-01 08:30:00']
+
+
+def test_large_responses_are_gzipped(client):
+    plain = client.get('/big')
+    compressed = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data)
+
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == {'values': [1]}
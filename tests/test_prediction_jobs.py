@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from cache import bump_data_version
+from forecasting import parse_prediction_parameters
+from models import db
+from prediction_jobs import PredictionJobQueue, JobQueueFull
+
+
+def wait(job, timeout=5):
+    """等待任务结束"""
+    for _ in range(int(timeout / 0.01)):
+        if job.finished:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'任务未在 {timeout} 秒内结束')
+
+
+def test_jobs_are_deduplicated_and_results_cached_per_data_version(app):
+    queue = PredictionJobQueue()
+    release = threading.Event()
+    calls = []
+
+    def predict(progress):
+        release.wait(5)
+        progress(0.5, '训练模型')
+        calls.append(1)
+        return {'success': True, 'value': len(calls)}
+
+    first = queue.submit(app, 'single', ('ph',), predict)
+    assert queue.submit(app, 'single', ('ph',), predict) is first
+    release.set()
+    assert wait(first).to_dict()['result'] == {'success': True, 'value': 1}
+
+    cached = queue.submit(app, 'single', ('ph',), predict)
+    assert cached.finished and cached.cached and cached.result == first.result
+
+    with db.engine.begin() as conn:
+        bump_data_version(conn)
+    assert wait(queue.submit(app, 'single', ('ph',), predict)).result['value'] == 2
+    assert queue.stats()['deduplicated'] == 1
+
+
+def test_failed_jobs_report_the_error_and_are_not_cached(app):
+    queue = PredictionJobQueue()
+
+    def broken(progress):
+        raise ValueError('有效数据量不足')
+
+    job = wait(queue.submit(app, 'single', ('ph',), broken))
+    assert job.to_dict()['status'] == 'failed' and job.error == '有效数据量不足'
+    assert not queue.submit(app, 'single', ('ph',), broken).cached
+    assert queue.get(job.id) is job
+
+
+def test_full_queue_rejects_new_jobs(app):
+    queue = PredictionJobQueue(max_workers=1, max_pending=1)
+    release = threading.Event()
+    job = queue.submit(app, 'single', ('ph',), lambda progress: release.wait(5) and {})
+    with pytest.raises(JobQueueFull):
+        queue.submit(app, 'single', ('temperature',), lambda progress: {})
+    release.set()
+    wait(job)
+
+
+def test_multi_prediction_needs_a_supported_parameter():
+    assert parse_prediction_parameters(['pH', 'Unknown', 'pH', 'Temperature']) == ('pH', 'Temperature')
+    for values in ([], None, ['Unknown']):
+        with pytest.raises(ValueError):
+            parse_prediction_parameters(values)
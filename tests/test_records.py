@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from models import db, WaterQualityData
+from records import fetch_page
+
+
+def add_records(timestamps):
+    for number, timestamp in enumerate(timestamps, start=1):
+        db.session.add(WaterQualityData(timestamp=timestamp, record_number=number, temperature=float(number)))
+    db.session.commit()
+
+
+def read_all(limit, descending=False, **kwargs):
+    ids, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = fetch_page(['temperature'], cursor=cursor, limit=limit, descending=descending, **kwargs)
+        ids += [row['id'] for row in rows]
+        pages += 1
+        if cursor is None:
+            return ids, pages
+
+
+def test_keyset_paging_across_equal_timestamps(app):
+    base = datetime(2024, 1, 1)
+    # 多条记录共用同一时间，且插入顺序与时间顺序不同
+    add_records([base + timedelta(hours=h) for h in (2, 0, 1, 1, 1, 0, 2, 1)])
+    expected = [row.id for row in WaterQualityData.query.order_by(WaterQualityData.timestamp,
+                                                                  WaterQualityData.id)]
+
+    for limit in (1, 2, 3, 8):
+        ids, pages = read_all(limit)
+        assert ids == expected
+        assert pages == -(-len(expected) // limit)
+
+        ids, _ = read_all(limit, descending=True)
+        assert ids == expected[::-1]
+
+
+def test_keyset_paging_respects_time_range(app):
+    base = datetime(2024, 1, 1)
+    add_records([base + timedelta(hours=h) for h in (0, 1, 1, 1, 2, 3)])
+    ids, _ = read_all(2, start=base + timedelta(hours=1), end=base + timedelta(hours=3))
+    assert len(ids) == 4
+    assert ids == sorted(ids, key=lambda i: (db.session.get(WaterQualityData, i).timestamp, i))
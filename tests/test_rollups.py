@@ -0,0 +1,49 @@
+import pandas as pd
+from sqlalchemy import update
+
+from conftest import source_frame
+from ingest import write_batches
+from models import db, WaterQualityData, WaterQualityRollup, WaterQualityComoment
+from rollups import check_rollups, clear_rollups, ensure_rollups
+
+
+def test_incremental_rollups_match_raw_data(app):
+    times = pd.date_range('2024-01-30 20:00', periods=60, freq='20min')
+    write_batches([source_frame(list(range(1, 31)), times[:30])])
+    write_batches([source_frame(list(range(31, 61)), times[30:])])
+    assert check_rollups() == []
+
+    # 修改已有记录的数值
+    write_batches([source_frame([5, 6], times[4:6], temperature=[0.5, 0.7])], update_existing=True)
+    assert check_rollups() == []
+
+
+def test_rollups_follow_records_moved_to_another_time(app):
+    write_batches([source_frame(list(range(1, 25)), pd.date_range('2024-01-31 00:00', periods=24, freq='h'))])
+
+    # 记录被移到另一个月，原来的小时、日、月分组都要重算
+    moved = source_frame([3, 4], ['2024-03-15 08:00', '2024-03-15 09:30'])
+    write_batches([moved], update_existing=True)
+    assert check_rollups() == []
+    assert db.session.get(WaterQualityData, 3).timestamp == pd.Timestamp('2024-03-15 08:00')
+
+
+def test_check_rollups_reports_wrong_squares_and_comoments(app):
+    write_batches([source_frame([1, 2, 3], pd.date_range('2024-01-01', periods=3, freq='h'))])
+    db.session.execute(update(WaterQualityRollup).where(WaterQualityRollup.granularity == 'daily')
+                       .values(value_sum_sq=WaterQualityRollup.value_sum_sq + 1))
+    db.session.execute(update(WaterQualityComoment).values(sum_xy=WaterQualityComoment.sum_xy + 1))
+
+    mismatches = check_rollups()
+    assert {(m[0], m[1]) for m in mismatches} == {('daily', '2024-01-01'), ('comoment', '2024-01-01')}
+    assert ('comoment', '2024-01-01', 'temperature,ph') in {m[:3] for m in mismatches}
+
+
+def test_ensure_rollups_rebuilds_empty_tables(app):
+    write_batches([source_frame([1, 2, 3], pd.date_range('2024-01-01', periods=3, freq='h'))])
+    with db.engine.begin() as conn:
+        clear_rollups(conn)
+
+    ensure_rollups()
+    assert WaterQualityComoment.query.count() == 1
+    assert check_rollups() == []
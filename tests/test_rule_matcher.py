@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from rule_matcher import ThresholdGroup, CompiledRules, Rule
+
+# 三条规则按下标依次为 attention、warning、critical
+RANKS = [2, 3, 4]
+
+
+@pytest.mark.parametrize('operator, thresholds, cases', [
+    ('<', [6.0, 5.0, 4.0], [(7.0, -1), (6.0, -1), (5.99, 0), (5.0, 0), (4.0, 1), (3.9, 2)]),
+    ('<=', [6.0, 5.0, 4.0], [(7.0, -1), (6.0, 0), (5.0, 1), (4.0, 2), (-1.0, 2)]),
+    ('>', [8.0, 9.0, 10.0], [(7.0, -1), (8.0, -1), (8.01, 0), (9.0, 0), (10.0, 1), (10.5, 2)]),
+    ('>=', [8.0, 9.0, 10.0], [(7.99, -1), (8.0, 0), (9.0, 1), (10.0, 2), (50.0, 2)]),
+])
+def test_threshold_boundaries(operator, thresholds, cases):
+    group = ThresholdGroup(operator, [0, 1, 2], thresholds, RANKS)
+    values = np.array([value for value, _ in cases])
+    expected = [index for _, index in cases]
+
+    assert [group.match(value) for value in values] == expected
+    assert group.match_array(values).tolist() == expected
+
+
+def test_equal_severity_prefers_the_more_extreme_threshold():
+    group = ThresholdGroup('>', [0, 1], [9.0, 10.0], [3, 3])
+    assert group.match(9.5) == 0
+    assert group.match(11.0) == 1
+
+
+def test_classify_array_matches_single_values():
+    rules = [Rule(1, 'ph', '<', 6.5, 'warning'), Rule(2, 'ph', '<', 6.0, 'critical'),
+             Rule(3, 'ph', '>', 8.5, 'warning'), Rule(4, 'ph', '>=', 9.0, 'critical')]
+    compiled = CompiledRules(rules)
+    values = np.array([5.9, 6.0, 6.5, 7.0, 8.5, 8.6, 9.0, np.nan])
+
+    indexes = compiled.classify_array('ph', values)
+    for value, index in zip(values, indexes):
+        rule = compiled.classify('ph', value)
+        assert (rule.id if rule else None) == (compiled.rules[index].id if index >= 0 else None)
+    assert [compiled.rules[i].id if i >= 0 else None for i in indexes] == [2, 1, None, None, None, 3, 4, None]
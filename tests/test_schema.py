@@ -0,0 +1,95 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+from flask import Flask
+from sqlalchemy import inspect
+
+from conftest import source_frame
+from ingest import import_file
+from models import db, AlertRule, DataImportLog, UPGRADE_COLUMNS, upgrade_schema
+from rule_matcher import RuleMatcher
+
+# 升级前版本建出的表结构
+BASELINE_SCHEMA = """
+CREATE TABLE water_quality_data (
+    id INTEGER NOT NULL, timestamp DATETIME NOT NULL, record_number INTEGER NOT NULL,
+    average_water_speed FLOAT, average_water_direction FLOAT, chlorophyll FLOAT, chlorophyll_quality INTEGER,
+    temperature FLOAT, temperature_quality INTEGER, dissolved_oxygen FLOAT, dissolved_oxygen_quality INTEGER,
+    dissolved_oxygen_saturation FLOAT, dissolved_oxygen_saturation_quality INTEGER, ph FLOAT, ph_quality INTEGER,
+    salinity FLOAT, salinity_quality INTEGER, specific_conductance FLOAT, specific_conductance_quality INTEGER,
+    turbidity FLOAT, turbidity_quality INTEGER, data_quality_score FLOAT, is_anomaly BOOLEAN,
+    anomaly_type VARCHAR(50), created_at DATETIME, updated_at DATETIME,
+    PRIMARY KEY (id), UNIQUE (record_number)
+);
+CREATE INDEX ix_water_quality_data_timestamp ON water_quality_data (timestamp);
+CREATE TABLE alert_rules (
+    id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, parameter VARCHAR(50) NOT NULL,
+    operator VARCHAR(10) NOT NULL, threshold FLOAT NOT NULL, severity VARCHAR(20), is_active BOOLEAN,
+    description TEXT, created_by INTEGER, created_at DATETIME,
+    PRIMARY KEY (id)
+);
+INSERT INTO alert_rules (name, parameter, operator, threshold, severity, is_active, created_at)
+VALUES ('pH过低', 'ph', '<', 6.5, 'warning', 1, '2024-01-01 00:00:00.000000');
+CREATE TABLE prediction_models (
+    id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, model_type VARCHAR(50) NOT NULL,
+    target_parameter VARCHAR(50) NOT NULL, input_parameters TEXT NOT NULL, model_config TEXT NOT NULL,
+    performance_metrics TEXT, is_active BOOLEAN, created_by INTEGER, created_at DATETIME, updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE TABLE data_import_logs (
+    id INTEGER NOT NULL, filename VARCHAR(255) NOT NULL, import_type VARCHAR(50) NOT NULL,
+    records_imported INTEGER, records_skipped INTEGER, status VARCHAR(20), error_message TEXT,
+    imported_by INTEGER, started_at DATETIME, completed_at DATETIME,
+    PRIMARY KEY (id)
+);
+INSERT INTO data_import_logs (filename, import_type, records_imported, records_skipped, status, started_at)
+VALUES ('old.xlsx', 'excel', 10, 0, 'success', '2024-01-01 00:00:00.000000');
+"""
+
+
+@pytest.fixture
+def baseline_app(tmp_path):
+    path = tmp_path / 'baseline.db'
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.close()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def columns(table):
+    return {column['name'] for column in inspect(db.engine).get_columns(table)}
+
+
+def test_upgrade_adds_missing_columns_and_is_idempotent(baseline_app):
+    upgrade_schema()
+    upgrade_schema()
+    for table, names in UPGRADE_COLUMNS.items():
+        assert set(names) <= columns(table)
+    assert 'ix_data_import_logs_filename' in {index['name'] for index in inspect(db.engine).get_indexes(
+        'data_import_logs')}
+    # 已有的导入日志取列的默认值
+    assert db.session.get(DataImportLog, 1).import_mode == 'replace'
+    assert db.session.get(AlertRule, 1).updated_at == datetime(2024, 1, 1)
+
+
+def test_rules_compile_on_an_upgraded_database(baseline_app):
+    upgrade_schema()
+    compiled = RuleMatcher().get()
+    assert [(rule.parameter, rule.threshold) for rule in compiled.rules] == [('ph', 6.5)]
+
+
+def test_import_works_on_an_upgraded_database(baseline_app, tmp_path):
+    upgrade_schema()
+    path = tmp_path / 'data.csv'
+    source_frame([1, 2, 3], ['2024-01-01 00:00', '2024-01-01 01:00', '2024-01-01 02:00']).to_csv(path, index=False)
+
+    assert import_file(str(path))['imported'] == 3
+    stats = import_file(str(path))
+    assert (stats['imported'], stats['high_water_mark']) == (0, 3)
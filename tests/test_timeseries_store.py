@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+from timeseries_store import TimeSeriesSnapshot
+
+
+def snapshot(times):
+    timestamps = pd.DatetimeIndex(times).as_unit('ns').asi8
+    return TimeSeriesSnapshot(timestamps, np.arange(1, len(times) + 1), {'ph': np.arange(len(times), dtype='float64')})
+
+
+def test_slice_includes_end_and_slice_half_open_excludes_it():
+    data = snapshot(['2024-01-01 00:00', '2024-01-01 01:00', '2024-01-01 02:00', '2024-01-01 03:00'])
+    start, end = pd.Timestamp('2024-01-01 01:00'), pd.Timestamp('2024-01-01 03:00')
+
+    assert data.slice(start, end).record_numbers.tolist() == [2, 3, 4]
+    assert data.slice_half_open(start, end).record_numbers.tolist() == [2, 3]
+    assert data.slice_half_open(None, end).column('ph').tolist() == [0.0, 1.0, 2.0]
+    assert data.slice_half_open(start, None).record_numbers.tolist() == [2, 3, 4]
+    assert data.slice_half_open() is data
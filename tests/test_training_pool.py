@@ -0,0 +1,51 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecasting import DEFAULT_TRAINING_OPTIONS, prepare_prediction_data, train_model
+from training_pool import SharedArrays, attach, train_parallel, shutdown_executor
+
+
+def hourly_columns(days=5):
+    times = pd.date_range('2024-01-01', periods=24 * days, freq='h')
+    cycle = np.sin(2 * np.pi * times.hour / 24)
+    columns = {'Temperature': 20 + 3 * cycle, 'pH': 8 + 0.1 * cycle, 'Salinity': 30 - cycle}
+    return times.as_unit('ns').asi8, columns
+
+
+@pytest.fixture
+def executor():
+    yield
+    shutdown_executor()
+
+
+def test_shared_arrays_round_trip():
+    timestamps, columns = hourly_columns(1)
+    shared = SharedArrays(timestamps, list(columns.values()))
+    try:
+        shm, times, values = attach(shared.spec)
+        assert times.tolist() == timestamps.tolist()
+        np.testing.assert_array_equal(values, np.vstack(list(columns.values())))
+        del times, values
+        shm.close()
+    finally:
+        shared.close()
+
+
+def test_parallel_training_matches_in_process_training(tmp_path, executor):
+    timestamps, columns = hourly_columns()
+    paths = {target: str(tmp_path / f'{target}.joblib') for target in ['Temperature', 'pH']}
+
+    outcomes = train_parallel(timestamps, columns, list(paths), 'linear', DEFAULT_TRAINING_OPTIONS, paths)
+
+    for target, (performance, meta) in outcomes.items():
+        features = prepare_prediction_data(target, timestamps, columns)
+        model, expected, expected_meta = train_model(features, 'linear', options=DEFAULT_TRAINING_OPTIONS)
+        assert performance['r2'] == pytest.approx(expected['r2'])
+        assert meta['rows'] == expected_meta['rows']
+        artifact = joblib.load(paths[target])
+        np.testing.assert_allclose(artifact['model'].predict(features.X), model.predict(features.X))
+    assert sorted(os.listdir(tmp_path)) == ['Temperature.joblib', 'pH.joblib']
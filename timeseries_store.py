@@ -0,0 +1,212 @@
+"""
+内存列式时序数据存储
+
+每个测量参数保存为一个 float64 数组，时间保存为已排序的 int64（纳秒）数组，
+按时间范围切片使用二分查找。数据通过原生 SQL 游标直接加载，
+分析、预警和预测接口共享同一份只读快照。
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+
+from models import db, WaterQualityData, MEASUREMENT_FIELDS
+
+# 从游标分批读取的行数
+FETCH_SIZE = 50000
+
+# 两次检查数据库是否有变化的最小间隔（秒）
+DEFAULT_CHECK_INTERVAL = 5.0
+
+
+def to_ns(value):
+    """将 datetime/字符串/Timestamp 转为纳秒时间戳，None 原样返回"""
+    if value is None:
+        return None
+    return pd.Timestamp(value).value
+
+
+class TimeSeriesSnapshot:
+    """一次加载得到的只读列式数据"""
+
+    def __init__(self, timestamps, record_numbers, columns, fingerprint=None):
+        self.timestamps = timestamps
+        self.record_numbers = record_numbers
+        self.columns = columns
+        self.fingerprint = fingerprint
+
+        for array in [timestamps, record_numbers, *columns.values()]:
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def empty(self):
+        return len(self.timestamps) == 0
+
+    @property
+    def fields(self):
+        return list(self.columns.keys())
+
+    def column(self, field):
+        """获取某个参数的数组"""
+        return self.columns[field]
+
+    def slice(self, start=None, end=None):
+        """按时间范围 [start, end] 切片，二分查找定位，返回共享内存的视图"""
+        hi = len(self) if end is None else int(np.searchsorted(self.timestamps, to_ns(end), side='right'))
+        return self.take(start, hi)
+
+    def slice_half_open(self, start=None, end=None):
+        """按时间范围 [start, end) 切片，与数据库查询 timestamp < end 的结果一致"""
+        hi = len(self) if end is None else int(np.searchsorted(self.timestamps, to_ns(end), side='left'))
+        return self.take(start, hi)
+
+    def take(self, start, hi):
+        """从 start 起到下标 hi 之前的视图"""
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, to_ns(start), side='left'))
+        if lo == 0 and hi == len(self):
+            return self
+        return TimeSeriesSnapshot(
+            self.timestamps[lo:hi],
+            self.record_numbers[lo:hi],
+            {field: values[lo:hi] for field, values in self.columns.items()},
+            self.fingerprint
+        )
+
+    def datetimes(self):
+        """时间数组转换为 datetime64[ns]"""
+        return self.timestamps.view('datetime64[ns]')
+
+    def time_range(self):
+        """数据的起止时间"""
+        if self.empty:
+            return None, None
+        return pd.Timestamp(self.timestamps[0]), pd.Timestamp(self.timestamps[-1])
+
+    def to_frame(self, fields=None):
+        """转换为带 Timestamp 列的 DataFrame，只包含指定参数"""
+        fields = self.fields if fields is None else fields
+        data = {'Timestamp': self.datetimes()}
+        data.update({field: self.columns[field] for field in fields})
+        return pd.DataFrame(data)
+
+    def memory_usage(self):
+        """各数组占用的字节数"""
+        columns = {field: int(values.nbytes) for field, values in self.columns.items()}
+        usage = {
+            'rows': len(self),
+            'timestamps': int(self.timestamps.nbytes),
+            'record_numbers': int(self.record_numbers.nbytes),
+            'columns': columns
+        }
+        usage['total'] = usage['timestamps'] + usage['record_numbers'] + sum(columns.values())
+        return usage
+
+
+def empty_snapshot(fields, fingerprint=None):
+    """没有数据时使用的空快照"""
+    return TimeSeriesSnapshot(
+        np.empty(0, dtype='int64'),
+        np.empty(0, dtype='int64'),
+        {field: np.empty(0, dtype='float64') for field in fields},
+        fingerprint
+    )
+
+
+class TimeSeriesStore:
+    """
+    线程安全的列式时序数据存储
+
+    读取方通过 get() 拿到当前快照后一直使用它；刷新时先构建完整的新快照，
+    再整体替换引用，读取方无需加锁，也不会读到加载到一半的数据。
+    """
+
+    def __init__(self, fields=None, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.fields = list(fields or MEASUREMENT_FIELDS)
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def fingerprint(self):
+        """数据库当前数据的指纹，变化时需要重新加载"""
+        table = WaterQualityData.__table__
+        with db.engine.connect() as conn:
+            row = conn.execute(select(
+                func.count(), func.max(table.c.id), func.max(table.c.updated_at)
+            )).one()
+        return tuple(row)
+
+    def load(self, fingerprint=None):
+        """通过原生游标按时间顺序分批读取全部数据，构建新快照"""
+        columns = ['timestamp', 'record_number'] + self.fields
+        sql = (f"SELECT {', '.join(columns)} FROM {WaterQualityData.__tablename__} "
+               f"ORDER BY timestamp, id")
+
+        timestamp_parts, record_parts = [], []
+        value_parts = {field: [] for field in self.fields}
+
+        raw_conn = db.engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                transposed = list(zip(*rows))
+                timestamp_parts.append(
+                    pd.to_datetime(transposed[0], format='ISO8601').to_numpy(dtype='datetime64[ns]').view('int64'))
+                record_parts.append(np.asarray(transposed[1], dtype='int64'))
+                for field, values in zip(self.fields, transposed[2:]):
+                    value_parts[field].append(np.asarray(values, dtype='float64'))
+            cursor.close()
+        finally:
+            raw_conn.close()
+
+        if not timestamp_parts:
+            return empty_snapshot(self.fields, fingerprint)
+
+        return TimeSeriesSnapshot(
+            np.concatenate(timestamp_parts),
+            np.concatenate(record_parts),
+            {field: np.concatenate(parts) for field, parts in value_parts.items()},
+            fingerprint
+        )
+
+    def refresh(self, force=True):
+        """重新加载数据；force=False 时只在数据库有变化时加载"""
+        with self._refresh_lock:
+            fingerprint = self.fingerprint()
+            self._checked_at = time.monotonic()
+            if not force and self._snapshot is not None and self._snapshot.fingerprint == fingerprint:
+                return self._snapshot
+
+            started = time.perf_counter()
+            snapshot = self.load(fingerprint)
+            self._snapshot = snapshot
+            usage = snapshot.memory_usage()
+            print(f"时序存储已加载 {usage['rows']} 条记录，占用 {usage['total'] / 1024 / 1024:.2f} MB，"
+                  f"耗时 {time.perf_counter() - started:.2f} 秒")
+            return snapshot
+
+    def get(self):
+        """获取当前快照，首次访问或数据库有变化时自动加载"""
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - self._checked_at >= self.check_interval:
+            snapshot = self.refresh(force=False)
+        return snapshot
+
+    def memory_usage(self):
+        """当前快照的内存占用报告"""
+        snapshot = self._snapshot
+        return snapshot.memory_usage() if snapshot is not None else empty_snapshot(self.fields).memory_usage()
+
+
+# 全局共享的时序存储
+time_series_store = TimeSeriesStore()
@@ -0,0 +1,138 @@
+"""
+多参数模型的并行训练
+
+多个参数的模型分发到进程池中同时训练。时间戳和构造特征用到的各参数列先复制进一块共享内存，
+子进程按名称直接映射成 numpy 数组，不需要序列化整个 DataFrame。
+子进程训练完成后直接把模型写入 joblib 文件，只返回评估指标和元数据。
+进程池使用 spawn 方式启动，避免在多线程的 Web 进程中 fork。
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import joblib
+import numpy as np
+
+from forecasting import prepare_prediction_data, train_model
+
+# 进程池的最大进程数
+MAX_TRAINING_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # 非 Linux 平台
+        return os.cpu_count() or 1
+
+
+def pool_size():
+    return max(min(available_cpus(), MAX_TRAINING_WORKERS), 1)
+
+
+def get_executor():
+    """进程池在第一次并行训练时创建，之后一直复用"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=pool_size(), mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+class SharedArrays:
+    """
+    把时间戳和若干等长的参数列放进一块共享内存
+
+    前 8×n 字节为 int64 时间戳，之后为 k×n 的 float64 参数矩阵。
+    spec = (共享内存名称, n, k) 传给子进程。
+    """
+
+    def __init__(self, timestamps, columns):
+        size = len(timestamps)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(8 * size * (1 + len(columns)), 1))
+        self.spec = (self.shm.name, size, len(columns))
+        times, values = views(self.shm, size, len(columns))
+        times[:] = timestamps
+        for row, column in enumerate(columns):
+            values[row] = column
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def views(shm, size, count):
+    """共享内存上的时间戳数组和参数矩阵视图"""
+    times = np.ndarray(size, dtype='int64', buffer=shm.buf)
+    values = np.ndarray((count, size), dtype='float64', buffer=shm.buf, offset=8 * size)
+    return times, values
+
+
+def attach(spec):
+    """子进程中映射共享内存，返回 (共享内存对象, 时间戳数组, 参数矩阵)"""
+    name, size, count = spec
+    # spawn 启动的子进程与父进程共用资源跟踪器，共享内存由父进程释放
+    shm = shared_memory.SharedMemory(name=name)
+    return (shm, *views(shm, size, count))
+
+
+def train_shared(spec, names, target_param, model_type, options, artifact_path, n_jobs):
+    """
+    子进程入口：用共享内存中的各参数构造特征，训练 target_param 的模型并写入模型文件
+
+    names 为参数矩阵各行对应的参数名。返回 (评估指标, 元数据)，数据不足时返回 None。
+    """
+    shm, times, values = attach(spec)
+    try:
+        features = prepare_prediction_data(target_param, times, dict(zip(names, values)))
+    finally:
+        # 特征计算结果已是独立的数组，之后即可解除映射
+        del times, values
+        shm.close()
+
+    if features is None:
+        return None
+    model, performance, meta = train_model(features, model_type, n_jobs=n_jobs, options=options)
+    if model is None:
+        return None
+    joblib.dump({'model': model, 'meta': meta}, artifact_path)
+    return performance, meta
+
+
+def train_parallel(timestamps, columns, targets, model_type, options, artifact_paths):
+    """
+    并行训练多个参数的模型
+
+    columns 为构造特征用到的全部 {参数: 数值数组}，只共享一份；targets 为要训练的参数，
+    options 为训练选项，artifact_paths 为 {参数: 模型文件路径}。
+    返回 {参数: (评估指标, 元数据) 或 None}。
+    """
+    executor = get_executor()
+    # 随机森林内部的线程数按同时运行的进程数平分 CPU，避免超额占用
+    n_jobs = max(available_cpus() // min(len(targets), pool_size()), 1)
+
+    names = list(columns)
+    shared = SharedArrays(timestamps, [columns[name] for name in names])
+    try:
+        futures = {
+            target: executor.submit(train_shared, shared.spec, names, target, model_type, options,
+                                    artifact_paths[target], n_jobs)
+            for target in targets
+        }
+        return {target: future.result() for target, future in futures.items()}
+    finally:
+        shared.close()